@@ -0,0 +1,10 @@
+# ASGI entry point: uvicorn 'asgi:app'. The polling reads in async_api.py
+# run on the event loop; every other request goes to the Flask app through
+# asgiref's WSGI adapter, which runs it in a thread pool. Alternatively
+# route just those reads here and keep gunicorn 'wsgi:app' for the rest.
+from asgiref.wsgi import WsgiToAsgi
+from app import create_app
+from async_api import AsyncReadAPI
+
+flask_app = create_app()
+app = AsyncReadAPI(flask_app, fallback=WsgiToAsgi(flask_app))
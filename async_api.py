@@ -0,0 +1,175 @@
+import re
+from datetime import timezone
+from urllib.parse import parse_qsl
+from sqlalchemy import event, exc, select
+from sqlalchemy.ext.asyncio import create_async_engine
+from werkzeug.http import http_date, parse_date, parse_etags
+from circulation import availability_payload, availability_query
+from conditional import row_etag
+from database import set_sqlite_pragmas
+from models import db, Book, InboxCounter, Notification
+from pagination import PaginationError, projection, row_formatter
+
+
+class _Request:
+    def __init__(self, scope):
+        self.headers = {name.decode('latin-1'): value.decode('latin-1') for name, value in scope['headers']}
+        self.args = dict(parse_qsl(scope['query_string'].decode('latin-1')))
+
+
+# Read-only ASGI app for polling clients (kiosks): the hottest GET routes,
+# answered on the event loop from an aiosqlite engine, so thousands of idle
+# keep-alive connections cost no threads. Responses, validators and errors
+# match the Flask routes. Other requests go to `fallback` (another ASGI
+# app, e.g. the Flask app behind a WSGI adapter), else 404.
+class AsyncReadAPI:
+    def __init__(self, app, fallback=None):
+        config = app.config
+        self.config = config
+        self.dumps = app.json.dumps
+        self.fallback = fallback
+        with app.app_context():
+            url = db.engine.url
+        if url.get_backend_name() != 'sqlite':
+            raise ValueError('The async read API needs a SQLite database')
+        self.engine = create_async_engine(
+            url.set(drivername='sqlite+aiosqlite'),
+            pool_size=config['ASYNC_POOL_SIZE'],
+            max_overflow=config['ASYNC_MAX_OVERFLOW'],
+            pool_timeout=config['ASYNC_POOL_TIMEOUT'],
+        )
+        event.listen(self.engine.sync_engine, 'connect', set_sqlite_pragmas(config.get('SQLITE_PRAGMAS', {})))
+        self.book_formatter = row_formatter(Book, Book.serialized_fields)
+        self.notification_formatter = row_formatter(Notification, Notification.serialized_fields)
+        self.routes = (
+            (re.compile(r'/books/(\d+)'), self.get_book),
+            (re.compile(r'/books/(\d+)/availability'), self.get_availability),
+            (re.compile(r'/customers/(\d+)/notifications'), self.get_notifications),
+            (re.compile(r'/customers/(\d+)/notifications/unread_count'), self.get_unread_count),
+        )
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self._lifespan(receive, send)
+        if scope['type'] == 'http' and scope['method'] == 'GET':
+            for pattern, handler in self.routes:
+                match = pattern.fullmatch(scope['path'])
+                if match:
+                    try:
+                        return await handler(_Request(scope), send, int(match.group(1)))
+                    except exc.TimeoutError:
+                        # Every pooled connection stayed busy for ASYNC_POOL_TIMEOUT
+                        return await self._respond(send, 503, {'error': 'Server busy'}, [('retry-after', '1')])
+        if self.fallback is not None:
+            return await self.fallback(scope, receive, send)
+        await self._respond(send, 404, {'error': 'Not found'})
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.engine.dispose()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _respond(self, send, status, payload=None, headers=()):
+        body = b'' if payload is None else (self.dumps(payload) + '\n').encode()
+        head = [(b'content-length', str(len(body)).encode())]
+        if payload is not None:
+            head.append((b'content-type', b'application/json'))
+        head.extend((name.encode('latin-1'), value.encode('latin-1')) for name, value in headers)
+        await send({'type': 'http.response.start', 'status': status, 'headers': head})
+        await send({'type': 'http.response.body', 'body': body})
+
+    async def _first(self, statement):
+        async with self.engine.connect() as connection:
+            return (await connection.execute(statement)).first()
+
+    # Same validators as conditional_row(): ETag from the row version,
+    # Last-Modified from updated_at
+    async def get_book(self, request, send, id):
+        row = await self._first(select(*projection(Book, Book.serialized_fields)).where(Book.id == id))
+        if row is None or not row.active:
+            return await self._respond(send, 404, {'error': 'Book not found'})
+        etag = row_etag('book', id, row.version)
+        last_modified = row.updated_at.replace(microsecond=0, tzinfo=timezone.utc) if row.updated_at else None
+        headers = [('etag', f'"{etag}"')]
+        if last_modified is not None:
+            headers.append(('last-modified', http_date(last_modified)))
+        if self._not_modified(request, etag, last_modified):
+            return await self._respond(send, 304, headers=headers)
+        await self._respond(send, 200, self.book_formatter(row), headers)
+
+    def _not_modified(self, request, etag, last_modified):
+        if 'if-none-match' in request.headers:
+            return parse_etags(request.headers['if-none-match']).contains_weak(etag)
+        since = parse_date(request.headers.get('if-modified-since'))
+        return last_modified is not None and since is not None and last_modified <= since
+
+    async def get_availability(self, request, send, id):
+        row = await self._first(availability_query(id))
+        if row is None:
+            return await self._respond(send, 404, {'error': 'Book not found'})
+        await self._respond(send, 200, availability_payload(row))
+
+    async def get_unread_count(self, request, send, id):
+        row = await self._first(select(InboxCounter.unread).where(InboxCounter.recipient_id == id))
+        await self._respond(send, 200, {'recipient_id': id, 'unread': row.unread if row else 0})
+
+    def _page_args(self, args):
+        if args.get('fields') or args.get('format', 'json') != 'json':
+            raise PaginationError('fields and format are not supported here')
+        try:
+            limit = int(args['limit']) if 'limit' in args else None
+            after = int(args['after']) if 'after' in args else None
+        except ValueError:
+            raise PaginationError('limit and after must be integers') from None
+        if limit is not None:
+            if limit < 1:
+                raise PaginationError('limit must be positive')
+            limit = min(limit, self.config['MAX_PAGE_SIZE'])
+        return limit, after
+
+    # The inbox as list_response() serves it: newest first, one page with
+    # an X-Next-Cursor header with ?limit=, else every row streamed in batches
+    async def get_notifications(self, request, send, id):
+        try:
+            limit, after = self._page_args(request.args)
+        except PaginationError as e:
+            return await self._respond(send, 400, {'error': str(e)})
+        query = (
+            select(*projection(Notification, Notification.serialized_fields))
+            .where(Notification.recipient_id == id)
+            .order_by(Notification.id.desc())
+        )
+        for column in ('status', 'priority'):
+            if request.args.get(column):
+                query = query.where(getattr(Notification, column) == request.args[column])
+        if after is not None:
+            query = query.where(Notification.id < after)
+
+        if limit is None:
+            return await self._stream(send, query, Notification, self.notification_formatter)
+        async with self.engine.connect() as connection:
+            page = (await connection.execute(query.limit(limit + 1))).all()
+        headers = [('x-next-cursor', str(page[limit - 1].id))] if len(page) > limit else []
+        await self._respond(send, 200, [self.notification_formatter(row) for row in page[:limit]], headers)
+
+    async def _stream(self, send, query, model, formatter):
+        batch_size = self.config['STREAM_BATCH_SIZE']
+        await send({'type': 'http.response.start', 'status': 200, 'headers': [(b'content-type', b'application/json')]})
+        separator = b'['
+        async with self.engine.connect() as connection:
+            batch_query = query
+            while True:
+                batch = (await connection.execute(batch_query.limit(batch_size))).all()
+                if batch:
+                    chunk = ','.join(self.dumps(formatter(row)) for row in batch).encode()
+                    await send({'type': 'http.response.body', 'body': separator + chunk, 'more_body': True})
+                    separator = b','
+                if len(batch) < batch_size:
+                    break
+                batch_query = query.where(model.id < batch[-1].id)
+        await send({'type': 'http.response.body', 'body': (b'[' if separator == b'[' else b'') + b']\n'})
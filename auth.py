@@ -0,0 +1,76 @@
+from functools import lru_cache
+from flask import current_app
+from flask_login import UserMixin
+from werkzeug.security import check_password_hash, generate_password_hash
+from cache import LRUCache
+from models import db, Admin
+
+
+# What Flask-Login keeps as current_user: enough to authorize a request
+# without holding a session-bound Admin row
+class AdminIdentity(UserMixin):
+    def __init__(self, id, username):
+        self.id = id
+        self.username = username
+
+
+# Admin identities by id with a short TTL, so validating a session does not
+# query the database on every request. Updates and deletes in this process
+# invalidate their entry; other workers catch up within ADMIN_CACHE_TTL.
+class AdminIdentityCache:
+    def __init__(self, app=None):
+        self.cache = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        ttl = app.config.get('ADMIN_CACHE_TTL', 60)
+        self.cache = LRUCache(maxsize=app.config.get('ADMIN_CACHE_SIZE', 1024), ttl=ttl) if ttl else None
+        app.extensions['admin_identities'] = self
+
+    def get(self, admin_id):
+        identity = self.cache.get(admin_id) if self.cache is not None else None
+        if identity is None:
+            row = db.session.execute(
+                db.select(Admin.id, Admin.username).where(Admin.id == admin_id)
+            ).first()
+            if row is None:
+                return None
+            identity = AdminIdentity(row.id, row.username)
+            if self.cache is not None:
+                self.cache.set(admin_id, identity)
+        return identity
+
+    def invalidate(self, admin_id):
+        if self.cache is not None:
+            self.cache.delete_many([admin_id])
+
+    def clear(self):
+        if self.cache is not None:
+            self.cache.clear()
+
+
+@lru_cache(maxsize=None)
+def _method_prefix(method):
+    # generate_password_hash() spells out default parameters ('pbkdf2' becomes
+    # 'pbkdf2:sha256:600000'); hash once to learn the stored form
+    return generate_password_hash('', method=method).split('$', 1)[0]
+
+
+def hash_password(password):
+    return generate_password_hash(password, method=current_app.config['PASSWORD_HASH_METHOD'])
+
+
+def needs_rehash(stored_hash):
+    return stored_hash.split('$', 1)[0] != _method_prefix(current_app.config['PASSWORD_HASH_METHOD'])
+
+
+# Check a login; when the stored hash uses other parameters than
+# PASSWORD_HASH_METHOD, replace it while the plain password is at hand
+def verify_password(admin, password):
+    if not check_password_hash(admin.password, password):
+        return False
+    if needs_rehash(admin.password):
+        admin.password = hash_password(password)
+        db.session.commit()
+    return True
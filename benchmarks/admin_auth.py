@@ -0,0 +1,53 @@
+# Admin login latency per password hashing method, and authenticated request
+# latency with and without the admin identity cache.
+#
+#   python benchmarks/admin_auth.py --requests 200
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from common import summarize, use_database
+
+METHODS = ['scrypt:32768:8:1', 'scrypt:16384:8:1', 'pbkdf2:sha256:600000', 'pbkdf2:sha256:100000']
+
+
+def timed_requests(count, send):
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(count):
+        request_started = time.perf_counter()
+        assert send().status_code == 200
+        latencies.append(time.perf_counter() - request_started)
+    return summarize(latencies, time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--logins', type=int, default=20)
+    parser.add_argument('--requests', type=int, default=200)
+    args = parser.parse_args()
+
+    app = use_database(os.path.join(tempfile.mkdtemp(), 'auth.db'), RATE_LIMIT_ENABLED=False)
+    from auth import AdminIdentityCache
+    client = app.test_client()
+
+    for number, method in enumerate(METHODS):
+        app.config['PASSWORD_HASH_METHOD'] = method
+        username = f'bench{number}'
+        client.post('/admin', json={'username': username, 'password': 'secret'})
+        stats = timed_requests(args.logins, lambda: client.post('/login', json={'username': username, 'password': 'secret'}))
+        print(f"login {method:<22} p50 {stats['p50_ms']:>8} ms  p95 {stats['p95_ms']:>8} ms")
+
+    for label, ttl in (('identity cache', 60), ('no cache', 0)):
+        app.config['ADMIN_CACHE_TTL'] = ttl
+        AdminIdentityCache(app)
+        stats = timed_requests(args.requests, lambda: client.get('/admin/1'))
+        print(f"GET /admin/1 {label:<16} p50 {stats['p50_ms']:>8} ms  p95 {stats['p95_ms']:>8} ms  "
+              f"{stats['req_per_sec']} req/s")
+
+
+if __name__ == '__main__':
+    main()
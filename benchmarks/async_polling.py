@@ -0,0 +1,233 @@
+# Concurrent polling clients against the async read API and the sync Flask
+# routes, each server in one process.
+#
+#   python benchmarks/async_polling.py --clients 100,1000,3000 --duration 10
+#   python benchmarks/async_polling.py --modes threaded,async --threads 32 --output polling.json
+#
+# Every client polls like a kiosk over a keep-alive connection (reopened
+# when the server closes it): an inbox badge, a title's availability, a
+# book and an inbox page, with --think seconds between requests. Modes:
+#   threaded      the Flask app on werkzeug's WSGI server with a pool of
+#                 --threads threads; every request holds one, and the server
+#                 closes the connection after each response
+#   wsgi-on-asgi  the Flask app under uvicorn through asgiref's adapter, as
+#                 asgi.py serves non-polling routes: idle connections wait on
+#                 the event loop, requests run on --threads threads
+#   async         AsyncReadAPI under uvicorn, no threads per request
+# Clients that wait more than --timeout for a response count as errors.
+import argparse
+import asyncio
+import os
+import random
+import resource
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from common import git_revision, seed, summarize, use_database, write_results
+
+PATHS = (
+    lambda rng, n: f"/customers/{rng.randint(1, n['customers'])}/notifications/unread_count",
+    lambda rng, n: f"/books/{rng.randint(1, n['books'])}/availability",
+    lambda rng, n: f"/books/{rng.randint(1, n['books'])}",
+    lambda rng, n: f"/customers/{rng.randint(1, n['customers'])}/notifications?limit=20",
+)
+
+
+def raise_open_files_limit():
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    return hard
+
+
+def seed_notifications(path, customers, per_customer):
+    conn = sqlite3.connect(path)
+    conn.executemany(
+        "INSERT INTO notification(type, content, status, priority, recipient_id, attempts, created_at) "
+        "VALUES ('info', ?, ?, 'low', ?, 0, CURRENT_TIMESTAMP)",
+        [(f'Notice {i}', 'new' if i % 3 else 'read', cust_id)
+         for cust_id in range(1, customers + 1) for i in range(per_customer)],
+    )
+    conn.commit()
+    conn.close()
+
+
+def serve_threaded(app, port, threads):
+    import logging
+    from concurrent.futures import ThreadPoolExecutor
+    from werkzeug.serving import BaseWSGIServer
+
+    # Connections are handled by a fixed pool of `threads` threads
+    class PooledWSGIServer(BaseWSGIServer):
+        multithread = True
+        request_queue_size = 4096
+
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.pool = ThreadPoolExecutor(threads)
+
+        def process_request(self, request, client_address):
+            self.pool.submit(self._handle, request, client_address)
+
+        def _handle(self, request, client_address):
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    PooledWSGIServer('127.0.0.1', port, app).serve_forever()
+
+
+def serve(mode, db_path, port, threads):
+    from app import create_app
+    app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + db_path, 'CACHE_BACKEND': None})
+    if mode == 'threaded':
+        return serve_threaded(app, port, threads)
+    import uvicorn
+    if mode == 'async':
+        from async_api import AsyncReadAPI
+        asgi_app = AsyncReadAPI(app)
+    else:
+        from asgiref.wsgi import WsgiToAsgi
+        asgi_app = WsgiToAsgi(app)
+    uvicorn.run(asgi_app, host='127.0.0.1', port=port, log_level='error', backlog=4096)
+
+
+async def _request(reader, writer, path):
+    writer.write(f'GET {path} HTTP/1.1\r\nHost: bench\r\n\r\n'.encode())
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    close = False
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        name = name.lower()
+        if name == 'content-length':
+            length = int(value)
+        elif name == 'connection':
+            close = value.strip().lower() == 'close'
+    await reader.readexactly(length)
+    return status, close
+
+
+async def _connect(port, timeout):
+    return await asyncio.wait_for(asyncio.open_connection('127.0.0.1', port), timeout)
+
+
+# Latency includes reconnecting after a server that closed the connection
+async def client(port, scale, think, timeout, deadline, rng, latencies, counts):
+    try:
+        reader, writer = await _connect(port, timeout)
+    except (OSError, asyncio.TimeoutError):
+        counts['refused'] += 1
+        return
+    counts['connected'] += 1
+    close = False
+    try:
+        # Spread the first requests over one think interval
+        await asyncio.sleep(rng.random() * think)
+        while time.perf_counter() < deadline:
+            path = rng.choice(PATHS)(rng, scale)
+            started = time.perf_counter()
+            if close:
+                writer.close()
+                reader, writer = await _connect(port, timeout)
+            status, close = await asyncio.wait_for(_request(reader, writer, path), timeout)
+            latencies.append(time.perf_counter() - started)
+            if status != 200:
+                counts['errors'] += 1
+            await asyncio.sleep(think)
+    except (OSError, asyncio.IncompleteReadError, asyncio.TimeoutError, ValueError, IndexError):
+        counts['errors'] += 1
+    finally:
+        writer.close()
+
+
+async def poll(port, clients, scale, think, timeout, duration):
+    rng = random.Random(42)
+    latencies = []
+    counts = {'connected': 0, 'refused': 0, 'errors': 0}
+    started = time.perf_counter()
+    deadline = started + duration
+    await asyncio.gather(*(
+        client(port, scale, think, timeout, deadline, random.Random(rng.random()), latencies, counts) for _ in range(clients)
+    ))
+    elapsed = time.perf_counter() - started
+    return {**summarize(latencies, elapsed, counts['errors']), 'connected': counts['connected'], 'refused': counts['refused']}
+
+
+def wait_for_port(port, timeout=30):
+    import socket
+    give_up = time.monotonic() + timeout
+    while time.monotonic() < give_up:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f'server on port {port} did not start')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--clients', default='100,1000,3000', help='comma-separated concurrent client counts')
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--think', type=float, default=0.5, help='seconds each client waits between requests')
+    parser.add_argument('--modes', default='threaded,wsgi-on-asgi,async')
+    parser.add_argument('--threads', type=int, default=32, help='worker threads for the Flask app')
+    parser.add_argument('--timeout', type=float, default=5, help='seconds a client waits for a response')
+    parser.add_argument('--books', type=int, default=10000)
+    parser.add_argument('--customers', type=int, default=2000)
+    parser.add_argument('--notifications', type=int, default=20, help='per customer')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--output', default=None)
+    parser.add_argument('--serve', choices=('threaded', 'wsgi-on-asgi', 'async'), help=argparse.SUPPRESS)
+    parser.add_argument('--db', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    raise_open_files_limit()
+    if args.serve:
+        return serve(args.serve, args.db, args.port, args.threads)
+
+    path = os.path.join(tempfile.mkdtemp(), 'polling.db')
+    use_database(path)
+    seed(path, books=args.books, customers=args.customers, loans=0)
+    seed_notifications(path, args.customers, args.notifications)
+    scale = {'books': args.books, 'customers': args.customers}
+
+    results = {}
+    for mode in args.modes.split(','):
+        env = {**os.environ, 'ASGI_THREADS': str(args.threads)}
+        server = subprocess.Popen([
+            sys.executable, os.path.abspath(__file__), '--serve', mode, '--db', path,
+            '--port', str(args.port), '--threads', str(args.threads),
+        ], env=env)
+        try:
+            wait_for_port(args.port)
+            results[mode] = {}
+            for clients in (int(n) for n in args.clients.split(',')):
+                stats = asyncio.run(poll(args.port, clients, scale, args.think, args.timeout, args.duration))
+                results[mode][f'{clients}_clients'] = stats
+                print(f"{mode:>12} {clients:>6} clients: {stats['req_per_sec']:>8} req/s  p50 {stats['p50_ms']} ms  "
+                      f"p99 {stats['p99_ms']} ms  errors {stats['errors']}  refused {stats['refused']}")
+        finally:
+            server.terminate()
+            server.wait()
+
+    if args.output:
+        meta = {'revision': git_revision(), 'started_at': datetime.utcnow().isoformat(), 'args': vars(args)}
+        write_results(args.output, meta, results)
+
+
+if __name__ == '__main__':
+    main()
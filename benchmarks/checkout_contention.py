@@ -0,0 +1,76 @@
+# Hammer one title with concurrent checkouts and verify it is never overbooked.
+#
+#   python benchmarks/checkout_contention.py --threads 32 --copies 50 --customers 200
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from datetime import date
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from common import use_database
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--copies', type=int, default=50)
+    parser.add_argument('--customers', type=int, default=200)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    # Every thread is the same client; measure the checkout path, not the rate limiter
+    app = use_database(os.path.join(workdir, 'contention.db'), RATE_LIMIT_ENABLED=False)
+    from models import db, Book, Customer, Loan
+
+    with app.app_context():
+        db.session.add(Book(name='Bestseller', author='Someone', year_published=2024, book_type=1, available_copies=args.copies))
+        db.session.add_all([
+            Customer(name=f'Patron {i}', city='Town', age=30, date_of_birth=date(1990, 1, 1), email=f'patron{i}@example.com', phone='5550000000')
+            for i in range(args.customers)
+        ])
+        db.session.commit()
+        book_id = Book.query.first().id
+        customer_ids = [c.id for c in Customer.query.all()]
+
+    statuses = {}
+    lock = threading.Lock()
+
+    def worker(ids):
+        client = app.test_client()
+        for cust_id in ids:
+            response = client.post('/loans', json={
+                'cust_id': cust_id,
+                'book_id': book_id,
+                'loan_date': '2025-01-01',
+                'return_date': '2025-01-15',
+            })
+            with lock:
+                statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    threads = [threading.Thread(target=worker, args=(customer_ids[i::args.threads],)) for i in range(args.threads)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    with app.app_context():
+        loans = Loan.query.filter_by(book_id=book_id).count()
+        remaining = db.session.get(Book, book_id).available_copies
+
+    print(f'{len(customer_ids)} checkout attempts from {args.threads} threads in {elapsed:.2f}s '
+          f'({len(customer_ids) / elapsed:.0f} req/s)')
+    print(f'responses: {dict(sorted(statuses.items()))}')
+    print(f'loans created: {loans}, copies: {args.copies}, available_copies left: {remaining}')
+    if loans > args.copies or loans + remaining != args.copies:
+        print('OVERBOOKED')
+        sys.exit(1)
+    print('OK: no overbooking')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,163 @@
+# Shared helpers for the benchmark scripts: synthetic data at scale and
+# latency statistics.
+import json
+import os
+import random
+import sqlite3
+import subprocess
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Same vocabulary as the seed data in data.py
+CATEGORIES = ['Fiction', 'Fantasy', 'Mystery', 'Science', 'History', 'Biography']
+AUTHORS = ['F. Scott Fitzgerald', 'Harper Lee', 'George Orwell', 'J.D. Salinger', 'J.R.R. Tolkien', 'Dan Brown']
+WORDS = ['great', 'lost', 'symbol', 'lord', 'rings', 'code', 'angels', 'demons', 'mockingbird', 'rye', 'hobbit', 'inferno']
+CITIES = ['New York', 'Los Angeles', 'Chicago', 'Houston', 'Phoenix']
+NAMES = ['Alice', 'Bob', 'Charlie', 'David', 'Eve']
+
+SCALES = {
+    'small': {'books': 10000, 'customers': 10000, 'loans': 10000},
+    'medium': {'books': 100000, 'customers': 100000, 'loans': 1000000},
+    'large': {'books': 500000, 'customers': 1000000, 'loans': 10000000},
+}
+
+
+# An app on the SQLite database at `path` (settings in `config` override
+# Config), with the schema created
+def use_database(path, **config):
+    from app import create_app
+    from models import db
+    app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.abspath(path), **config})
+    with app.app_context():
+        db.create_all()
+    return app
+
+
+def _batches(total, batch):
+    for offset in range(0, total, batch):
+        yield offset, min(batch, total - offset)
+
+
+# Bulk-load synthetic books, customers and loans straight through sqlite3
+def seed(path, books, customers, loans, batch=50000, rng_seed=42):
+    rng = random.Random(rng_seed)
+    today = datetime.utcnow().date()
+    conn = sqlite3.connect(path)
+    conn.execute('PRAGMA synchronous = OFF')
+    started = time.perf_counter()
+
+    for offset, size in _batches(books, batch):
+        conn.executemany(
+            'INSERT INTO book(name, author, year_published, book_type, category, active, available_copies, description) '
+            'VALUES (?, ?, ?, ?, ?, 1, ?, ?)',
+            [(
+                ' '.join(rng.sample(WORDS, 3)).title() + f' {offset + i}',
+                rng.choice(AUTHORS),
+                rng.randint(1900, 2024),
+                rng.randint(1, 3),
+                rng.choice(CATEGORIES),
+                rng.randint(1, 5),
+                ' '.join(rng.choices(WORDS, k=12)),
+            ) for i in range(size)],
+        )
+        conn.commit()
+
+    for offset, size in _batches(customers, batch):
+        rows = []
+        for i in range(size):
+            age = rng.randint(18, 90)
+            rows.append((
+                f'{rng.choice(NAMES)} {offset + i}',
+                rng.choice(CITIES),
+                age,
+                str(date(today.year - age, rng.randint(1, 12), rng.randint(1, 28))),
+                f'patron{offset + i}@example.com',
+                f'{rng.randint(0, 9999999999):010d}',
+            ))
+        conn.executemany(
+            'INSERT INTO customer(name, city, age, date_of_birth, email, phone, status, registration_date) '
+            "VALUES (?, ?, ?, ?, ?, ?, 'active', CURRENT_TIMESTAMP)",
+            rows,
+        )
+        conn.commit()
+
+    for offset, size in _batches(loans, batch):
+        rows = []
+        for _ in range(size):
+            loan_date = today - timedelta(days=rng.randint(0, 3650))
+            return_date = loan_date + timedelta(days=14)
+            returned = return_date < today and rng.random() < 0.97
+            rows.append((
+                rng.randint(1, customers),
+                rng.randint(1, books),
+                str(loan_date),
+                str(return_date),
+                str(loan_date + timedelta(days=rng.randint(1, 20))) if returned else None,
+                'returned' if returned else 'ongoing',
+            ))
+        conn.executemany(
+            'INSERT INTO loan(cust_id, book_id, loan_date, return_date, actual_return_date, status) VALUES (?, ?, ?, ?, ?, ?)',
+            rows,
+        )
+        conn.commit()
+
+    conn.execute('ANALYZE')
+    conn.close()
+    return time.perf_counter() - started
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def summarize(latencies, elapsed, errors=0):
+    latencies = sorted(latencies)
+    ms = lambda value: round(value * 1000, 3) if value is not None else None
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'req_per_sec': round(len(latencies) / elapsed, 1) if elapsed else None,
+        'p50_ms': ms(percentile(latencies, 0.50)),
+        'p95_ms': ms(percentile(latencies, 0.95)),
+        'p99_ms': ms(percentile(latencies, 0.99)),
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def write_results(path, meta, results):
+    with open(path, 'w') as f:
+        json.dump({'meta': meta, 'results': results}, f, indent=2, sort_keys=True)
+
+
+# Compare two result files; a metric regresses when it is worse than the
+# baseline by more than `tolerance` (0.2 = 20%). Returns the regressions.
+def compare(baseline_path, results, tolerance):
+    with open(baseline_path) as f:
+        baseline = json.load(f)['results']
+    regressions = []
+    for group, endpoints in results.items():
+        for name, current in endpoints.items():
+            previous = baseline.get(group, {}).get(name)
+            if not previous:
+                continue
+            for metric, higher_is_better in (('req_per_sec', True), ('p95_ms', False), ('p99_ms', False)):
+                old, new = previous.get(metric), current.get(metric)
+                if not old or new is None:
+                    continue
+                change = (new - old) / old
+                if (higher_is_better and change < -tolerance) or (not higher_is_better and change > tolerance):
+                    regressions.append(f'{group}/{name} {metric}: {old} -> {new} ({change:+.0%})')
+    return regressions
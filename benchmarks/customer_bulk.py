@@ -0,0 +1,84 @@
+# Customer bulk operations on a large table: the status sweep before and
+# after the set-based UPDATE, and POST /customers/bulk throughput.
+#
+#   python benchmarks/customer_bulk.py --customers 1000000 --sweep 100000
+#   python benchmarks/customer_bulk.py --customers 100000 --sweep 100000 --batches 50
+#
+# "set-based" is POST /customers/bulk_update_status (chunked
+# UPDATE ... WHERE id IN (...)), "orm loop" the original implementation that
+# loads every customer and flips status in Python. The set-based sweep runs
+# first, so the peak RSS growth reported for the ORM loop is its own.
+import argparse
+import os
+import resource
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from common import seed, use_database
+
+
+def max_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def orm_loop(customer_ids, new_status):
+    from models import db, Customer
+    customers = Customer.query.filter(Customer.id.in_(customer_ids)).all()
+    for customer in customers:
+        customer.status = new_status
+    db.session.commit()
+    return len(customers)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--customers', type=int, default=1000000)
+    parser.add_argument('--sweep', type=int, default=100000, help='customers whose status each sweep changes')
+    parser.add_argument('--batch', type=int, default=1000, help='items per POST /customers/bulk')
+    parser.add_argument('--batches', type=int, default=20)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), 'customers.db')
+    app = use_database(path, RATE_LIMIT_ENABLED=False, CACHE_BACKEND=None)
+    elapsed = seed(path, books=0, customers=args.customers, loans=0)
+    print(f'seeded {args.customers} customers in {elapsed:.1f}s')
+
+    client = app.test_client()
+    customer_ids = list(range(1, args.sweep + 1))
+
+    rss = max_rss_mb()
+    started = time.perf_counter()
+    response = client.post('/customers/bulk_update_status', json={'customer_ids': customer_ids, 'status': 'inactive'})
+    set_based = time.perf_counter() - started
+    print(f"{'set-based':>10}: {set_based:8.2f}s  +{max_rss_mb() - rss:7.1f} MB peak  {response.json['message']}")
+
+    rss = max_rss_mb()
+    started = time.perf_counter()
+    with app.app_context():
+        updated = orm_loop(customer_ids, 'active')
+    loop = time.perf_counter() - started
+    print(f"{'orm loop':>10}: {loop:8.2f}s  +{max_rss_mb() - rss:7.1f} MB peak  {updated} customers updated"
+          f"  speedup={loop / set_based:6.1f}x")
+
+    for upsert in (False, True):
+        started = time.perf_counter()
+        accepted = 0
+        for n in range(args.batches):
+            customers = [{
+                'name': f'Bulk Patron {n}-{i}',
+                'city': 'Springfield',
+                'age': 30,
+                'date_of_birth': '1995-01-01',
+                'email': f'bulk{n}-{i}@example.com',
+                'phone': '5550000000',
+            } for i in range(args.batch)]
+            accepted += client.post('/customers/bulk', json={'customers': customers, 'upsert': upsert}).json['accepted']
+        elapsed = time.perf_counter() - started
+        print(f"{'upsert' if upsert else 'create':>10}: {elapsed:8.2f}s  {accepted} accepted  "
+              f"{accepted / elapsed:,.0f} rows/sec")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,172 @@
+# Load test the read API at a chosen data scale.
+#
+#   python benchmarks/loadtest.py --scale small --mode both --output results.json
+#   python benchmarks/loadtest.py --db /tmp/bench.db --compare results.json
+#
+# Seeds a synthetic library (or reuses --db), then drives every endpoint in
+# ENDPOINTS through the Flask test client and/or a local threaded WSGI
+# server with --concurrency client threads. Reports req/s and p50/p95/p99
+# per endpoint and writes them to --output; --compare exits non-zero when
+# any endpoint regressed by more than --tolerance against an earlier file.
+import argparse
+import http.client
+import logging
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from common import SCALES, WORDS, compare, git_revision, seed, summarize, use_database, write_results
+
+# name -> function(rng, scale) returning the path to request
+ENDPOINTS = {
+    'list_books_page': lambda rng, n: '/books?limit=50',
+    'get_book': lambda rng, n: f"/books/{rng.randint(1, n['books'])}",
+    'search_books_text': lambda rng, n: f'/books/search?q={rng.choice(WORDS)}&limit=20',
+    'search_books_filter': lambda rng, n: '/books/search?category=Mystery&year_from=1990&limit=50',
+    'get_customer': lambda rng, n: f"/customers/{rng.randint(1, n['customers'])}",
+    'customer_loans': lambda rng, n: f"/customers/{rng.randint(1, n['customers'])}/loans",
+    'list_loans_page': lambda rng, n: f"/loans?limit=100&after={rng.randint(0, n['loans'])}",
+    'overdue_loans_page': lambda rng, n: '/loans/overdue?limit=100',
+    'notify_preview_page': lambda rng, n: '/loans/overdue/notify?limit=100',
+    'inbox': lambda rng, n: f"/customers/{rng.randint(1, n['customers'])}/notifications?limit=20",
+}
+
+
+def run(make_request, paths, concurrency):
+    latencies, errors = [], [0]
+    lock = threading.Lock()
+
+    def worker(chunk):
+        request = make_request()
+        local = []
+        for path in chunk:
+            started = time.perf_counter()
+            status = request(path)
+            local.append(time.perf_counter() - started)
+            if status is None or (status >= 400 and status != 404):
+                with lock:
+                    errors[0] += 1
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=worker, args=(paths[i::concurrency],)) for i in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return summarize(latencies, time.perf_counter() - started, errors[0])
+
+
+def test_client_requester(app):
+    def make_request():
+        client = app.test_client()
+
+        def request(path):
+            response = client.get(path)
+            response.get_data()
+            return response.status_code
+        return request
+    return make_request
+
+
+# A request that fails or waits more than `timeout` seconds returns None
+# (counted as an error) and the next one opens a fresh connection
+def wsgi_requester(port, timeout):
+    def make_request():
+        connection = http.client.HTTPConnection('127.0.0.1', port, timeout=timeout)
+
+        def request(path):
+            try:
+                connection.request('GET', path)
+                response = connection.getresponse()
+                response.read()
+                return response.status
+            except (OSError, http.client.HTTPException):
+                connection.close()
+                return None
+        return request
+    return make_request
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scale', choices=SCALES, default='small')
+    parser.add_argument('--books', type=int)
+    parser.add_argument('--customers', type=int)
+    parser.add_argument('--loans', type=int)
+    parser.add_argument('--db', help='reuse (or create and keep) this SQLite file')
+    parser.add_argument('--mode', choices=['testclient', 'wsgi', 'both'], default='both')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=500, help='requests per endpoint')
+    parser.add_argument('--timeout', type=float, default=10, help='seconds a wsgi request may take before it counts as an error')
+    parser.add_argument('--endpoints', help='comma-separated subset of: ' + ', '.join(ENDPOINTS))
+    parser.add_argument('--output', default='bench_results.json')
+    parser.add_argument('--compare', help='earlier result file to check for regressions')
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    args = parser.parse_args()
+
+    scale = dict(SCALES[args.scale])
+    for key in scale:
+        if getattr(args, key):
+            scale[key] = getattr(args, key)
+
+    path = args.db or os.path.join(tempfile.mkdtemp(), 'bench.db')
+    fresh = not os.path.exists(path)
+    app = use_database(path)
+    if fresh:
+        elapsed = seed(path, **scale)
+        print(f"seeded {scale} in {elapsed:.1f}s")
+
+    modes = ['testclient', 'wsgi'] if args.mode == 'both' else [args.mode]
+    names = args.endpoints.split(',') if args.endpoints else list(ENDPOINTS)
+    rng = random.Random(1)
+    results = {}
+    server = None
+    for mode in modes:
+        if mode == 'testclient':
+            make_request = test_client_requester(app)
+        else:
+            from werkzeug.serving import make_server
+            logging.getLogger('werkzeug').setLevel(logging.ERROR)
+            server = make_server('127.0.0.1', 0, app, threaded=True)
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            make_request = wsgi_requester(server.server_port, args.timeout)
+
+        results[mode] = {}
+        for name in names:
+            paths = [ENDPOINTS[name](rng, scale) for _ in range(args.requests)]
+            run(make_request, paths[:args.concurrency], args.concurrency)  # warm up
+            summary = run(make_request, paths, args.concurrency)
+            results[mode][name] = summary
+            print(f"{mode:>10} {name:<22} {summary['req_per_sec']:>9} req/s  p50 {summary['p50_ms']:>8} ms  "
+                  f"p95 {summary['p95_ms']:>8} ms  p99 {summary['p99_ms']:>8} ms  errors {summary['errors']}")
+        if server is not None:
+            server.shutdown()
+            server = None
+
+    meta = {
+        'revision': git_revision(),
+        'timestamp': datetime.utcnow().isoformat(timespec='seconds'),
+        'scale': scale,
+        'concurrency': args.concurrency,
+        'requests_per_endpoint': args.requests,
+    }
+    write_results(args.output, meta, results)
+    print(f'results written to {args.output}')
+
+    if args.compare:
+        regressions = compare(args.compare, results, args.tolerance)
+        for regression in regressions:
+            print('REGRESSION', regression)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+# Measure queued-notification mail throughput against a local SMTP sink.
+#
+#   python benchmarks/mail_dispatch.py --notices 2000 --workers 4 --batch-size 200
+#
+# The sink accepts and discards every message; pass --latency to simulate a
+# slower relay (seconds added to each DATA command).
+import argparse
+import os
+import socketserver
+import sys
+import tempfile
+import threading
+import time
+from datetime import date
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from common import use_database
+
+
+class SMTPSink(socketserver.StreamRequestHandler):
+    latency = 0.0
+    received = 0
+    lock = threading.Lock()
+
+    def reply(self, line):
+        self.wfile.write(line.encode() + b'\r\n')
+
+    def handle(self):
+        self.reply('220 sink ready')
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode(errors='replace').strip().upper()
+            if command.startswith(('EHLO', 'HELO')):
+                self.reply('250 sink')
+            elif command == 'DATA':
+                self.reply('354 end with <CRLF>.<CRLF>')
+                while self.rfile.readline() not in (b'.\r\n', b''):
+                    pass
+                time.sleep(self.latency)
+                with SMTPSink.lock:
+                    SMTPSink.received += 1
+                self.reply('250 queued')
+            elif command == 'QUIT':
+                self.reply('221 bye')
+                return
+            else:
+                self.reply('250 ok')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--notices', type=int, default=2000)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--batch-size', type=int, default=200)
+    parser.add_argument('--latency', type=float, default=0.0)
+    args = parser.parse_args()
+
+    SMTPSink.latency = args.latency
+    server = socketserver.ThreadingTCPServer(('127.0.0.1', 0), SMTPSink)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    app = use_database(
+        os.path.join(tempfile.mkdtemp(), 'mail.db'),
+        MAIL_SERVER='127.0.0.1', MAIL_PORT=server.server_address[1], MAIL_USE_TLS=False,
+        MAIL_USERNAME=None, MAIL_PASSWORD=None,
+    )
+    from extensions import mail
+    from mailer import dispatch_pending
+    from models import db, Customer, Notification
+
+    with app.app_context():
+        customers = [
+            Customer(name=f'Patron {i}', city='Town', age=30, date_of_birth=date(1990, 1, 1),
+                     email=f'patron{i}@example.com', phone='5550000000')
+            for i in range(100)
+        ]
+        db.session.add_all(customers)
+        db.session.commit()
+        db.session.add_all([
+            Notification(type='overdue', content=f'Notice {i}', priority='high',
+                         recipient_id=customers[i % len(customers)].id, delivery_status='pending')
+            for i in range(args.notices)
+        ])
+        db.session.commit()
+
+        stats = dispatch_pending(mail, batch_size=args.batch_size, workers=args.workers)
+
+    print(f"sent {stats['sent']} (sink received {SMTPSink.received}), failed {stats['failed']}, "
+          f"{stats['batches']} batches in {stats['seconds']}s: {stats['mails_per_sec']} mails/sec")
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+# Micro-benchmarks for the hot paths under the list and lookup endpoints.
+#
+#   python benchmarks/micro.py --rows 10000 --output micro.json [--compare old.json]
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from common import compare, git_revision, seed, use_database, write_results
+
+
+def measure(func, repeat=5):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        count = func()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return {'seconds': round(best, 6), 'ops_per_sec': round(count / best, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--output', default='bench_micro.json')
+    parser.add_argument('--compare')
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), 'micro.db')
+    app = use_database(path)
+    seed(path, books=args.rows, customers=args.rows, loans=args.rows)
+
+    from extensions import lookup_cache
+    from models import Book, Loan
+
+    results = {}
+    with app.test_request_context():
+        books = Book.query.all()
+        loans = Loan.query.all()
+        book_dicts = [book.to_dict() for book in books]
+
+        results['book_to_dict'] = measure(lambda: len([book.to_dict() for book in books]))
+        results['loan_to_dict'] = measure(lambda: len([loan.to_dict() for loan in loans]))
+        results['json_dumps_books'] = measure(lambda: len(book_dicts) if app.json.dumps(book_dicts) else 0)
+        results['orm_load_books'] = measure(lambda: len(Book.query.all()))
+        results['projected_load_books'] = measure(lambda: len(Book.query.with_entities(Book.id, Book.name).all()))
+        results['keyset_page_loans'] = measure(
+            lambda: sum(len(Loan.query.filter(Loan.id > after).order_by(Loan.id).limit(100).all())
+                        for after in range(0, args.rows, 1000)) // 100
+        )
+        lookup_cache.clear()
+        results['cache_get_book'] = measure(lambda: len([lookup_cache.get(Book, i) for i in range(1, 1001)]))
+
+    for name, result in results.items():
+        print(f"{name:<22} {result['ops_per_sec']:>14,.0f} ops/s")
+
+    meta = {'revision': git_revision(), 'timestamp': datetime.utcnow().isoformat(timespec='seconds'), 'rows': args.rows}
+    # Same layout as loadtest.py so compare() applies; ops/s is reported as req_per_sec
+    grouped = {'micro': {name: {'req_per_sec': r['ops_per_sec'], 'seconds': r['seconds']} for name, r in results.items()}}
+    write_results(args.output, meta, grouped)
+    print(f'results written to {args.output}')
+
+    if args.compare:
+        regressions = compare(args.compare, grouped, args.tolerance)
+        for regression in regressions:
+            print('REGRESSION', regression)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
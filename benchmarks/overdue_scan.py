@@ -0,0 +1,93 @@
+# Compare the overdue lookups before and after the overdue materialization.
+#
+#   python benchmarks/overdue_scan.py --loans 1000000
+#   python benchmarks/overdue_scan.py --loans 10000000 --overdue-ratio 0.001
+#
+# "scan" is the original query (status = 'ongoing' AND return_date < today)
+# forced to ignore indexes, "partial index" is the open-loan query through
+# ix_loan_open_return_date and "overdue set" reads the overdue_loan table.
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from common import use_database
+
+
+def seed(path, loans, overdue_ratio, batch=100000):
+    use_database(path)
+
+    today = datetime.utcnow().date()
+    conn = sqlite3.connect(path)
+    conn.execute('PRAGMA journal_mode = WAL')
+    conn.execute('PRAGMA synchronous = OFF')
+    conn.execute("INSERT INTO customer(id, name, city, age, date_of_birth, email, phone, status) "
+                 "VALUES (1, 'Bench', 'Town', 30, '1990-01-01', 'bench@example.com', '1', 'active')")
+    conn.execute("INSERT INTO book(id, name, author, year_published, book_type, category, active, available_copies) "
+                 "VALUES (1, 'Bench', 'Bench', 2000, 1, 'General', 1, 1)")
+    rng = random.Random(42)
+    started = time.perf_counter()
+    for offset in range(0, loans, batch):
+        rows = []
+        for _ in range(min(batch, loans - offset)):
+            loan_date = today - timedelta(days=rng.randint(0, 3650))
+            if rng.random() < overdue_ratio:
+                rows.append((loan_date, today - timedelta(days=rng.randint(1, 30)), None, 'ongoing'))
+            elif rng.random() < 0.05:
+                rows.append((loan_date, today + timedelta(days=rng.randint(0, 14)), None, 'ongoing'))
+            else:
+                rows.append((loan_date, loan_date + timedelta(days=14), loan_date + timedelta(days=10), 'returned'))
+        conn.executemany(
+            'INSERT INTO loan(cust_id, book_id, loan_date, return_date, actual_return_date, status) '
+            'VALUES (1, 1, ?, ?, ?, ?)',
+            [(str(a), str(b), str(c) if c else None, s) for a, b, c, s in rows],
+        )
+        conn.commit()
+    print(f'seeded {loans} loans in {time.perf_counter() - started:.1f}s')
+    conn.close()
+    return today
+
+
+def timed(conn, sql, params=(), repeat=5):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        rows = conn.execute(sql, params).fetchall()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, len(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--loans', type=int, default=1000000)
+    parser.add_argument('--overdue-ratio', type=float, default=0.01)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), 'overdue.db')
+    today = seed(path, args.loans, args.overdue_ratio)
+    conn = sqlite3.connect(path)
+    conn.execute('ANALYZE')
+
+    columns = 'loan.id, loan.cust_id, loan.book_id, loan.loan_date, loan.return_date, loan.actual_return_date, loan.status'
+    queries = {
+        'scan': (f"SELECT {columns} FROM loan NOT INDEXED WHERE status = 'ongoing' AND return_date < ?", (str(today),)),
+        'partial index': (
+            f"SELECT {columns} FROM loan WHERE status IN ('ongoing', 'overdue') AND return_date < ?", (str(today),)
+        ),
+        'overdue set': (f"SELECT {columns} FROM loan WHERE loan.id IN (SELECT loan_id FROM overdue_loan) ORDER BY loan.id", ()),
+    }
+    baseline = None
+    for name, (sql, params) in queries.items():
+        elapsed, count = timed(conn, sql, params)
+        baseline = baseline or elapsed
+        print(f'{name:>14}: {elapsed * 1000:9.2f} ms  rows={count}  speedup={baseline / elapsed:6.1f}x')
+
+
+if __name__ == '__main__':
+    main()
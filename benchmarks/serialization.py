@@ -0,0 +1,49 @@
+# Rows/sec serialized by the list endpoints' pipeline (load, format, encode),
+# ORM objects + to_dict() against projected row tuples, for each JSON provider,
+# and the encoding step alone.
+#
+#   python benchmarks/serialization.py --rows 100000
+import argparse
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from common import seed, use_database
+from micro import measure
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=100000)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), 'serialize.db')
+    app = use_database(path)
+    seed(path, books=args.rows, customers=args.rows, loans=args.rows)
+
+    from flask.json.provider import DefaultJSONProvider
+    from json_provider import OrjsonProvider
+    from models import Book, Customer, Loan
+    from pagination import projection, row_formatter
+
+    providers = {'stdlib': DefaultJSONProvider(app), 'orjson': OrjsonProvider(app)}
+    with app.app_context():
+        for model in (Book, Customer, Loan):
+            fields = model.serialized_fields
+            fmt = row_formatter(model, fields)
+            pipelines = {
+                'orm+to_dict': lambda: [obj.to_dict() for obj in model.query.all()],
+                'rows+formatter': lambda: [fmt(row) for row in model.query.with_entities(*projection(model, fields)).all()],
+            }
+            items = pipelines['rows+formatter']()
+            pipelines['encode only'] = lambda: items
+            for pipeline_name, build in pipelines.items():
+                for provider_name, provider in providers.items():
+                    result = measure(lambda: len(provider.dumps(build())) and args.rows, repeat=3)
+                    print(f"{model.__tablename__:<9} {pipeline_name:<15} {provider_name:<7} "
+                          f"{result['ops_per_sec']:>12,.0f} rows/s")
+
+
+if __name__ == '__main__':
+    main()
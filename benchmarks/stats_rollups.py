@@ -0,0 +1,71 @@
+# Time the /stats endpoints against the daily rollups, next to the same
+# aggregates computed straight from the loan table.
+#
+#   python benchmarks/stats_rollups.py --scale medium
+#   python benchmarks/stats_rollups.py --scale large --requests 50
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from common import SCALES, seed, summarize, use_database
+
+ENDPOINTS = [
+    '/stats/top_books',
+    '/stats/loans_per_category',
+    '/stats/loan_duration',
+    '/stats/overdue_rate',
+]
+
+# What the dashboard computed before: one pass over every loan per metric
+DIRECT_QUERIES = {
+    'top_books': 'SELECT book_id, count(*) AS n FROM loan GROUP BY book_id ORDER BY n DESC LIMIT 10',
+    'loans_per_category': "SELECT strftime('%Y-%m', loan_date), category, count(*) "
+                          'FROM loan JOIN book ON book.id = loan.book_id GROUP BY 1, 2',
+    'loan_duration': 'SELECT avg(julianday(actual_return_date) - julianday(loan_date)) '
+                     'FROM loan WHERE actual_return_date IS NOT NULL',
+    'overdue_rate': 'SELECT city, count(*), sum(actual_return_date > return_date) '
+                    'FROM loan JOIN customer ON customer.id = loan.cust_id GROUP BY city',
+}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scale', choices=sorted(SCALES), default='small')
+    parser.add_argument('--requests', type=int, default=20)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), 'stats.db')
+    app = use_database(path)
+    print(f'seeded in {seed(path, **SCALES[args.scale]):.1f}s')
+
+    from stats import refresh_summaries
+    with app.app_context():
+        started = time.perf_counter()
+        days = refresh_summaries(full=True)
+        print(f'full refresh: {days} days in {time.perf_counter() - started:.2f}s')
+
+    conn = sqlite3.connect(path)
+    for name, sql in DIRECT_QUERIES.items():
+        started = time.perf_counter()
+        conn.execute(sql).fetchall()
+        print(f'direct {name}: {(time.perf_counter() - started) * 1000:.1f} ms')
+    conn.close()
+
+    client = app.test_client()
+    for url in ENDPOINTS:
+        latencies = []
+        started = time.perf_counter()
+        for _ in range(args.requests):
+            request_started = time.perf_counter()
+            assert client.get(url).status_code == 200
+            latencies.append(time.perf_counter() - request_started)
+        stats = summarize(latencies, time.perf_counter() - started)
+        print(f"{url}: p50 {stats['p50_ms']} ms, p95 {stats['p95_ms']} ms")
+
+
+if __name__ == '__main__':
+    main()
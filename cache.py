@@ -0,0 +1,151 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+
+
+class CacheStats:
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def to_dict(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_ratio': round(self.hits / lookups, 4) if lookups else None,
+        }
+
+
+# In-process LRU with a per-entry TTL and a bound on the number of entries
+class LRUCache:
+    def __init__(self, maxsize=1024, ttl=300, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self.stats = CacheStats()
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at > self.clock():
+                    self._data.move_to_end(key)
+                    self.stats.hits += 1
+                    return value
+                del self._data[key]
+            self.stats.misses += 1
+            return None
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, self.clock() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.stats.evictions += 1
+
+    def delete_many(self, keys):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+# Backend for any client exposing the redis-py get/set/delete API.
+# Values are stored as JSON; expiry and eviction are left to the server.
+class RedisCache:
+    def __init__(self, client, ttl=300, prefix='library:'):
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+        self.stats = CacheStats()
+
+    def get(self, key):
+        raw = self.client.get(self.prefix + key)
+        if raw is None:
+            self.stats.misses += 1
+            return None
+        self.stats.hits += 1
+        return json.loads(raw)
+
+    def set(self, key, value):
+        self.client.set(self.prefix + key, json.dumps(value), ex=self.ttl)
+
+    def delete_many(self, keys):
+        keys = [self.prefix + key for key in keys]
+        if keys:
+            self.client.delete(*keys)
+
+    def clear(self):
+        for key in self.client.scan_iter(match=self.prefix + '*'):
+            self.client.delete(key)
+
+    def __len__(self):
+        return sum(1 for _ in self.client.scan_iter(match=self.prefix + '*'))
+
+
+# Read-through cache of to_dict() payloads for hot, rarely-changing rows
+class LookupCache:
+    def __init__(self, app=None):
+        self.backend = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        kind = app.config.get('CACHE_BACKEND', 'memory')
+        ttl = app.config.get('CACHE_TTL', 300)
+        if kind == 'memory':
+            self.backend = LRUCache(maxsize=app.config.get('CACHE_MAX_SIZE', 1024), ttl=ttl)
+        elif kind == 'redis':
+            import redis
+            client = redis.Redis.from_url(app.config['CACHE_REDIS_URL'])
+            self.backend = RedisCache(client, ttl=ttl)
+        elif kind is None:
+            self.backend = None
+        else:
+            raise ValueError(f'Unknown CACHE_BACKEND: {kind}')
+        app.extensions['lookup_cache'] = self
+
+    def get(self, model, id):
+        if self.backend is None:
+            obj = model.query.get(id)
+            return obj.to_dict() if obj else None
+
+        key = f'{model.__tablename__}:{id}'
+        value = self.backend.get(key)
+        if value is None:
+            obj = model.query.get(id)
+            if obj is None:
+                return None
+            value = obj.to_dict()
+            self.backend.set(key, value)
+        return value
+
+    def invalidate(self, model, *ids):
+        if self.backend is not None:
+            self.backend.delete_many([f'{model.__tablename__}:{id}' for id in ids])
+
+    def clear(self):
+        if self.backend is not None:
+            self.backend.clear()
+
+    def stats(self):
+        if self.backend is None:
+            return {'backend': None}
+        stats = self.backend.stats.to_dict()
+        stats['backend'] = type(self.backend).__name__
+        stats['size'] = len(self.backend)
+        return stats
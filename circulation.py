@@ -0,0 +1,427 @@
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import and_, bindparam, func, insert, literal, or_, select, update
+from models import db, Book, Customer, Hold, Loan, Notification, OPEN_LOAN_STATUSES, OverdueLoan, OverdueState
+from pagination import projection, row_formatter
+
+
+class CirculationError(Exception):
+    def __init__(self, message, status_code=409):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+
+
+def parse_date(value):
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+
+# SQLite has no SELECT ... FOR UPDATE: open the write transaction up front
+# so the reads that decide a batch see the state the batch is applied to.
+# Inside a transaction that is already open (a test's outer transaction)
+# there is nothing to open.
+def begin_write():
+    connection = db.session.connection()
+    if connection.dialect.name == 'sqlite' and not connection.connection.dbapi_connection.in_transaction:
+        connection.exec_driver_sql('BEGIN IMMEDIATE')
+
+
+# Check a copy out in one short transaction: the copy set aside by the
+# customer's ready hold, else one from available_copies. The conditional
+# UPDATEs come first, so they open the write transaction and the loan-limit
+# count that follows cannot be raced by another checkout; a failed check
+# rolls the copy back.
+def checkout(cust_id, book_id, loan_date, return_date, status='ongoing'):
+    taken = db.session.execute(
+        update(Hold)
+        .where(Hold.cust_id == cust_id, Hold.book_id == book_id, Hold.status == 'ready')
+        .values(status='fulfilled')
+        .execution_options(synchronize_session=False)
+    ).rowcount or db.session.execute(
+        update(Book)
+        .where(Book.id == book_id, Book.available_copies > 0)
+        .values(available_copies=Book.available_copies - 1)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if not taken:
+        db.session.rollback()
+        raise CirculationError('No copies available')
+
+    open_loans = db.session.scalar(
+        select(func.count(Loan.id)).where(Loan.cust_id == cust_id, Loan.actual_return_date.is_(None))
+    )
+    if open_loans >= current_app.config['MAX_LOANS_PER_CUSTOMER']:
+        db.session.rollback()
+        raise CirculationError('Customer has reached the loan limit')
+
+    loan = Loan(
+        cust_id=cust_id,
+        book_id=book_id,
+        loan_date=loan_date,
+        return_date=return_date,
+        status=status,
+    )
+    db.session.add(loan)
+    db.session.commit()
+    return loan
+
+
+# Close an open loan and put its copy back. Only the request that actually
+# closes the loan increments available_copies, so concurrent returns of
+# the same loan cannot double count. The caller commits.
+def return_loan(loan, returned_on, status='returned'):
+    closed = db.session.execute(
+        update(Loan)
+        .where(Loan.id == loan.id, Loan.actual_return_date.is_(None))
+        .values(actual_return_date=returned_on, status=status)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if closed:
+        release_copy(loan.book_id)
+    return bool(closed)
+
+
+# Hand a copy back: to the oldest waiting hold on the book if there is one,
+# else to available_copies. Returns the promoted hold's id, or None.
+def release_copy(book_id):
+    hold_id = promote_next_hold(book_id)
+    if hold_id is None:
+        db.session.execute(
+            update(Book)
+            .where(Book.id == book_id)
+            .values(available_copies=Book.available_copies + 1)
+            .execution_options(synchronize_session=False)
+        )
+    return hold_id
+
+
+# Mark the head of the book's hold queue ready and queue a notice (mailed by
+# the notification dispatcher) for its customer. The head is found through
+# the partial ix_hold_queue index. The caller is already inside the write
+# transaction (SQLite serializes it); on databases with row locks, SKIP
+# LOCKED lets concurrent returns of the same book promote different holds.
+def promote_next_hold(book_id):
+    head = db.session.execute(
+        select(Hold.id, Hold.cust_id)
+        .where(Hold.book_id == book_id, Hold.status == 'waiting')
+        .order_by(Hold.id)
+        .limit(1)
+        .with_for_update(skip_locked=True)
+    ).first()
+    if head is None:
+        return None
+    db.session.execute(
+        update(Hold)
+        .where(Hold.id == head.id)
+        .values(status='ready', ready_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    )
+    notice = select(
+        literal('hold_ready'),
+        literal('Book "') + Book.name + literal('" is ready for pickup'),
+        literal('new'),
+        literal('high'),
+        literal(head.cust_id),
+        literal('pending'),
+        literal(0),
+    ).where(Book.id == book_id)
+    db.session.execute(
+        insert(Notification).from_select(
+            ['type', 'content', 'status', 'priority', 'recipient_id', 'delivery_status', 'attempts'],
+            notice,
+        )
+    )
+    return head.id
+
+
+# Join the book's queue. Only books with no copy on the shelf take holds, and
+# a customer holds a book at most once at a time.
+def place_hold(cust_id, book_id):
+    begin_write()
+    available = db.session.scalar(select(Book.available_copies).where(Book.id == book_id))
+    if available is None:
+        db.session.rollback()
+        raise CirculationError('Book not found', 404)
+    if available > 0:
+        db.session.rollback()
+        raise CirculationError('Copies are available, check one out instead')
+    if db.session.scalar(select(Customer.id).where(Customer.id == cust_id)) is None:
+        db.session.rollback()
+        raise CirculationError('Customer not found', 404)
+    active = db.session.scalar(
+        select(Hold.id).where(Hold.cust_id == cust_id, Hold.book_id == book_id, Hold.status.in_(('waiting', 'ready')))
+    )
+    if active is not None:
+        db.session.rollback()
+        raise CirculationError('Customer already holds this book')
+
+    hold = Hold(cust_id=cust_id, book_id=book_id)
+    db.session.add(hold)
+    db.session.commit()
+    return hold
+
+
+# Leave the queue. A ready hold's copy moves on to the next waiting hold.
+# Returns the id of the hold promoted in its place, or None.
+def cancel_hold(hold):
+    begin_write()
+    status = db.session.scalar(select(Hold.status).where(Hold.id == hold.id))
+    if status not in ('waiting', 'ready'):
+        db.session.rollback()
+        raise CirculationError(f'Hold is already {status}')
+    db.session.execute(
+        update(Hold)
+        .where(Hold.id == hold.id)
+        .values(status='cancelled')
+        .execution_options(synchronize_session=False)
+    )
+    promoted = release_copy(hold.book_id) if status == 'ready' else None
+    db.session.commit()
+    return promoted
+
+
+# Insert `rows` with multi-row INSERT ... RETURNING statements and return the
+# `columns` of the new rows in the order of `rows`. sort_by_parameter_order
+# would fall back to one INSERT per row on SQLite; an INSERT's rows get
+# ascending ids in VALUES order, so sorting by id restores it.
+def insert_returning(model, rows, *columns):
+    if not rows:
+        return []
+    returned = db.session.execute(insert(model).returning(model.id, *columns), rows).all()
+    return [row[1:] for row in sorted(returned, key=lambda row: row[0])]
+
+
+def _rejected(index, reason):
+    return {'index': index, 'status': 'rejected', 'reason': reason}
+
+
+# Create many loans in one transaction. Customers, books, ready holds and
+# open-loan counts are each fetched with a single IN (...) query; items are
+# accepted in order while copies and the per-customer limit allow. As in
+# checkout(), a customer's ready hold on the book supplies the copy first.
+def bulk_checkout(items):
+    results = [None] * len(items)
+    parsed = []
+    for index, item in enumerate(items):
+        try:
+            parsed.append((index, {
+                'cust_id': int(item['cust_id']),
+                'book_id': int(item['book_id']),
+                'loan_date': parse_date(item['loan_date']),
+                'return_date': parse_date(item['return_date']),
+                'status': item.get('status', 'ongoing'),
+            }))
+        except (KeyError, TypeError, ValueError) as e:
+            results[index] = _rejected(index, f'Invalid loan: {e}')
+
+    begin_write()
+    cust_ids = {loan['cust_id'] for _, loan in parsed}
+    book_ids = {loan['book_id'] for _, loan in parsed}
+    customers = set(db.session.scalars(select(Customer.id).where(Customer.id.in_(cust_ids))))
+    copies = dict(db.session.execute(
+        select(Book.id, Book.available_copies).where(Book.id.in_(book_ids)).with_for_update()
+    ).all())
+    ready_holds = {
+        (hold.cust_id, hold.book_id): hold.id
+        for hold in db.session.execute(
+            select(Hold.id, Hold.cust_id, Hold.book_id)
+            .where(Hold.cust_id.in_(cust_ids), Hold.book_id.in_(book_ids), Hold.status == 'ready')
+            .with_for_update()
+        )
+    }
+    open_loans = dict(db.session.execute(
+        select(Loan.cust_id, func.count(Loan.id))
+        .where(Loan.cust_id.in_(cust_ids), Loan.actual_return_date.is_(None))
+        .group_by(Loan.cust_id)
+    ).all())
+    max_loans = current_app.config['MAX_LOANS_PER_CUSTOMER']
+
+    accepted = []
+    fulfilled = []
+    taken = set()
+    for index, loan in parsed:
+        cust_id, book_id = loan['cust_id'], loan['book_id']
+        hold_id = ready_holds.get((cust_id, book_id))
+        if cust_id not in customers:
+            results[index] = _rejected(index, 'Customer not found')
+        elif book_id not in copies:
+            results[index] = _rejected(index, 'Book not found')
+        elif hold_id is None and copies[book_id] <= 0:
+            results[index] = _rejected(index, 'No copies available')
+        elif open_loans.get(cust_id, 0) >= max_loans:
+            results[index] = _rejected(index, 'Customer has reached the loan limit')
+        else:
+            if hold_id is not None:
+                fulfilled.append(ready_holds.pop((cust_id, book_id)))
+            else:
+                copies[book_id] -= 1
+                taken.add(book_id)
+            open_loans[cust_id] = open_loans.get(cust_id, 0) + 1
+            accepted.append((index, loan))
+
+    if fulfilled:
+        db.session.execute(
+            update(Hold)
+            .where(Hold.id.in_(fulfilled))
+            .values(status='fulfilled')
+            .execution_options(synchronize_session=False)
+        )
+    if taken:
+        db.session.execute(update(Book), [{'id': book_id, 'available_copies': copies[book_id]} for book_id in taken])
+    created = insert_returning(Loan, [loan for _, loan in accepted], *projection(Loan, Loan.serialized_fields))
+    db.session.commit()
+
+    fmt = row_formatter(Loan, Loan.serialized_fields)
+    for (index, _), row in zip(accepted, created):
+        results[index] = {'index': index, 'status': 'created', 'loan': fmt(row)}
+    return results, taken
+
+
+# Return many loans in one transaction, releasing one copy per closed loan
+def bulk_return(items):
+    results = [None] * len(items)
+    parsed = []
+    for index, item in enumerate(items):
+        try:
+            parsed.append((index, int(item['loan_id']), parse_date(item['actual_return_date']), item.get('status', 'returned')))
+        except (KeyError, TypeError, ValueError) as e:
+            results[index] = _rejected(index, f'Invalid return: {e}')
+
+    begin_write()
+    loan_ids = {loan_id for _, loan_id, _, _ in parsed}
+    loans = {
+        loan.id: loan for loan in db.session.execute(
+            select(Loan.id, Loan.book_id, Loan.actual_return_date).where(Loan.id.in_(loan_ids)).with_for_update()
+        )
+    }
+
+    released = {}
+    returned = []
+    closed = set()
+    for index, loan_id, returned_on, status in parsed:
+        loan = loans.get(loan_id)
+        if loan is None:
+            results[index] = _rejected(index, 'Loan not found')
+        elif loan.actual_return_date is not None or loan_id in closed:
+            results[index] = _rejected(index, 'Loan already returned')
+        else:
+            closed.add(loan_id)
+            released[loan.book_id] = released.get(loan.book_id, 0) + 1
+            returned.append((index, {'loan_id': loan_id, 'returned_on': returned_on, 'status': status}))
+
+    if returned:
+        loan = Loan.__table__
+        db.session.execute(
+            loan.update()
+            .where(loan.c.id == bindparam('loan_id'))
+            .values(actual_return_date=bindparam('returned_on'), status=bindparam('status')),
+            [values for _, values in returned],
+        )
+
+    # Books with a queue get their copies one at a time, through the holds
+    queued = set(db.session.scalars(
+        select(Hold.book_id).distinct().where(Hold.book_id.in_(released), Hold.status == 'waiting')
+    )) if released else set()
+    for book_id in queued:
+        for _ in range(released.pop(book_id)):
+            release_copy(book_id)
+
+    if released:
+        book = Book.__table__
+        db.session.execute(
+            book.update()
+            .where(book.c.id == bindparam('book_id'))
+            .values(available_copies=book.c.available_copies + bindparam('released')),
+            [{'book_id': book_id, 'released': count} for book_id, count in released.items()],
+        )
+    # Read back once, for the versions and timestamps the triggers set
+    rows = {
+        row.id: row for row in db.session.execute(
+            select(*projection(Loan, Loan.serialized_fields)).where(Loan.id.in_(closed))
+        )
+    } if closed else {}
+    db.session.commit()
+
+    fmt = row_formatter(Loan, Loan.serialized_fields)
+    for index, values in returned:
+        results[index] = {'index': index, 'status': 'returned', 'loan': fmt(rows[values['loan_id']])}
+    return results, set(released) | queued
+
+
+# Move the overdue set forward to `today`: only loans that fell due since
+# the last roll are scanned, through the partial index on open loans.
+def roll_overdue(today=None):
+    today = today or datetime.utcnow().date()
+    as_of = db.session.scalar(select(OverdueState.as_of).where(OverdueState.id == 1))
+    if as_of is None or as_of >= today:
+        return 0
+    claimed = db.session.execute(
+        update(OverdueState)
+        .where(OverdueState.id == 1, OverdueState.as_of == as_of)
+        .values(as_of=today)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if not claimed:
+        # Another worker rolled forward first
+        db.session.rollback()
+        return 0
+    added = db.session.execute(
+        insert(OverdueLoan).prefix_with('OR REPLACE').from_select(
+            ['loan_id', 'cust_id', 'book_id', 'return_date'],
+            select(Loan.id, Loan.cust_id, Loan.book_id, Loan.return_date).where(
+                Loan.status.in_(OPEN_LOAN_STATUSES),
+                Loan.return_date >= as_of,
+                Loan.return_date < today,
+            ),
+        )
+    ).rowcount
+    db.session.commit()
+    return added
+
+
+# Copies on the shelf and holds waiting for one active book, through the
+# primary key and the hold queue's partial index
+def availability_query(book_id):
+    waiting = select(func.count()).where(Hold.book_id == Book.id, Hold.status == 'waiting').scalar_subquery()
+    return select(Book.id, Book.available_copies, waiting.label('holds_waiting')).where(Book.id == book_id, Book.active)
+
+
+def availability_payload(row):
+    return {
+        'book_id': row.id,
+        'available': row.available_copies > 0,
+        'available_copies': row.available_copies,
+        'holds_waiting': row.holds_waiting,
+    }
+
+
+# Ongoing loans past their return date. Read-only: loans that fell due
+# since the last roll_overdue() are read through the partial index on open
+# loans instead of rolling the set forward here.
+def overdue_loans_query():
+    today = datetime.utcnow().date()
+    if db.session.get_bind().dialect.name != 'sqlite':
+        return Loan.query.filter(Loan.status.in_(OPEN_LOAN_STATUSES), Loan.return_date < today)
+    as_of = select(OverdueState.as_of).where(OverdueState.id == 1).scalar_subquery()
+    return Loan.query.filter(or_(
+        Loan.id.in_(select(OverdueLoan.loan_id)),
+        and_(Loan.status.in_(OPEN_LOAN_STATUSES), Loan.return_date >= as_of, Loan.return_date < today),
+    ))
+
+
+# One row per overdue loan with the customer and book columns a notice
+# needs, fetched in a single joined query instead of lazy loads per loan
+def overdue_notices_query():
+    return (
+        overdue_loans_query()
+        .join(Customer, Customer.id == Loan.cust_id)
+        .join(Book, Book.id == Loan.book_id)
+        .with_entities(
+            Loan.id,
+            Loan.cust_id,
+            Customer.name.label('customer_name'),
+            Customer.email,
+            Book.name.label('book_title'),
+            Loan.return_date,
+        )
+    )
@@ -0,0 +1,92 @@
+import threading
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from exporter import EXPORT_FORMATS, EXPORT_MODELS, ExportError, export_to_file
+from extensions import job_scheduler, mail
+from importer import IMPORT_SCHEMAS, import_file
+from mailer import dispatch_pending
+from scheduler import run_pending
+from stats import refresh_summaries
+
+
+# Send queued notification mail in batches until the queue is drained
+@click.command('dispatch-mail')
+@click.option('--batch-size', type=int, default=None)
+@click.option('--workers', type=int, default=None)
+@with_appcontext
+def dispatch_mail_command(batch_size, workers):
+    stats = dispatch_pending(mail, batch_size=batch_size, workers=workers)
+    click.echo(f"sent {stats['sent']}, failed {stats['failed']} in {stats['batches']} batches "
+               f"({stats['mails_per_sec']} mails/sec)")
+
+
+# Bulk-load books, customers or loans from a CSV or JSONL file
+@click.command('import-data')
+@click.argument('kind', type=click.Choice(sorted(IMPORT_SCHEMAS)))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'jsonl']), default=None)
+@click.option('--batch-size', type=int, default=None)
+@click.option('--restart', is_flag=True, help='Ignore the checkpoint of an earlier, unfinished run.')
+@click.option('--keep-indexes', is_flag=True, help='Maintain indexes during the load instead of rebuilding them.')
+@with_appcontext
+def import_data_command(kind, path, fmt, batch_size, restart, keep_indexes):
+    config = current_app.config
+    stats = import_file(
+        kind, path, fmt=fmt,
+        batch_size=batch_size or config['IMPORT_BATCH_SIZE'],
+        restart=restart,
+        defer_indexes=not keep_indexes,
+        load_pragmas=config['IMPORT_SQLITE_PRAGMAS'],
+        restore_pragmas=config['SQLITE_PRAGMAS'],
+        report=click.echo,
+    )
+    click.echo(f"imported {stats['imported']} {kind}, rejected {stats['rejected']} "
+               f"in {stats['seconds']}s ({stats['rows_per_sec']:,.0f} rows/sec)")
+
+
+# Export books, customers or loans to a CSV, NDJSON or Parquet file
+@click.command('export-data')
+@click.argument('kind', type=click.Choice(sorted(EXPORT_MODELS)))
+@click.argument('path', type=click.Path(dir_okay=False, writable=True))
+@click.option('--format', 'fmt', type=click.Choice(EXPORT_FORMATS), default='csv')
+@click.option('--since-id', type=int, default=None, help='Only rows with a greater id.')
+@click.option('--updated-since', type=click.DateTime(), default=None, help='Only rows updated at or after this time.')
+@click.option('--watermark', default=None, help='Export only rows added or changed since the last run with this name.')
+@click.option('--batch-size', type=int, default=None)
+@with_appcontext
+def export_data_command(kind, path, fmt, since_id, updated_since, watermark, batch_size):
+    try:
+        stats = export_to_file(kind, fmt, path, since_id=since_id, watermark=watermark, updated_since=updated_since,
+                               batch_size=batch_size or current_app.config['EXPORT_BATCH_SIZE'])
+    except ExportError as e:
+        raise click.ClickException(str(e))
+    if stats['updated_since'] is not None:
+        click.echo(f"exported {stats['rows']} {kind} updated since {stats['updated_since']} to {path}")
+    else:
+        click.echo(f"exported {stats['rows']} {kind} to {path} (ids {stats['since_id'] or 0}..{stats['last_id']})")
+
+
+# Recompute the /stats daily rollups (all of them with --full)
+@click.command('refresh-stats')
+@click.option('--full', is_flag=True, help='Rebuild every day instead of only the days changed since the last refresh.')
+@with_appcontext
+def refresh_stats_command(full):
+    click.echo(f'refreshed {refresh_summaries(full=full)} days')
+
+
+# Run the maintenance jobs in JOB_SCHEDULES as they fall due, until
+# interrupted. Any number of these can run; each job run is leased to one.
+@click.command('run-scheduler')
+@click.option('--once', is_flag=True, help='Run the jobs that are due now and exit.')
+@with_appcontext
+def run_scheduler_command(once):
+    if not once:
+        job_scheduler.run_forever(threading.Event())
+        return
+    for name, count in run_pending().items():
+        click.echo(f"{name}: {'failed' if count is None else count}")
+
+
+COMMANDS = (dispatch_mail_command, import_data_command, export_data_command, refresh_stats_command,
+            run_scheduler_command)
@@ -0,0 +1,84 @@
+import hashlib
+from datetime import datetime, timezone
+from functools import wraps
+from flask import Response, jsonify, make_response, request
+from sqlalchemy import select
+from extensions import lookup_cache
+from models import db, ChangeCounter
+
+
+# Versions are only maintained by the SQLite triggers in models.py
+def _enabled():
+    return db.session.get_bind().dialect.name == 'sqlite'
+
+
+def _not_modified(etag, last_modified):
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    if last_modified is not None and request.if_modified_since is not None:
+        return last_modified.replace(microsecond=0, tzinfo=timezone.utc) <= request.if_modified_since
+    return False
+
+
+def _set_validators(response, etag, last_modified):
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified.replace(tzinfo=timezone.utc)
+    return response
+
+
+# Answer 304 when the client's ETag / Last-Modified still match; otherwise
+# call build() for the full response. Nothing is serialized for a 304.
+def conditional(etag, last_modified, build):
+    if not _enabled():
+        return build()
+    if _not_modified(etag, last_modified):
+        return _set_validators(Response(status=304), etag, last_modified)
+    response = make_response(build())
+    if response.status_code == 200:
+        _set_validators(response, etag, last_modified)
+    return response
+
+
+def row_etag(table, id, version):
+    return f'{table}-{id}-{version}'
+
+
+# Single row from its cached to_dict() payload, or None when the row is
+# missing or not `visible`. A conditional request first reads the row's
+# version, so a stale cache entry (e.g. one a write on another worker has
+# not invalidated yet) is reloaded instead of answering 304.
+def conditional_row(model, id, visible=lambda payload: True):
+    payload = lookup_cache.get(model, id)
+    if payload is not None and _enabled() and (request.if_none_match or request.if_modified_since):
+        version = db.session.scalar(select(model.version).where(model.id == id))
+        if version != payload['version']:
+            lookup_cache.invalidate(model, id)
+            payload = lookup_cache.get(model, id)
+    if payload is None or not visible(payload):
+        return None
+    updated_at = payload.get('updated_at')
+    last_modified = datetime.fromisoformat(updated_at) if updated_at not in (None, 'None') else None
+    etag = row_etag(model.__tablename__, id, payload['version'])
+    return conditional(etag, last_modified, lambda: jsonify(payload))
+
+
+# List endpoints: validators come from the change counters of the tables the
+# list reads, combined with the query string, so a 304 costs one small query
+def conditional_list(*tables):
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if not _enabled():
+                return view(*args, **kwargs)
+            counters = db.session.execute(
+                select(ChangeCounter.table_name, ChangeCounter.version, ChangeCounter.updated_at)
+                .where(ChangeCounter.table_name.in_(tables))
+                .order_by(ChangeCounter.table_name)
+            ).all()
+            state = ','.join(f'{row.table_name}:{row.version}' for row in counters)
+            etag = hashlib.sha1(f'{request.full_path}|{state}'.encode()).hexdigest()[:24]
+            last_modified = max((row.updated_at for row in counters), default=None)
+            return conditional(etag, last_modified, lambda: view(*args, **kwargs))
+        return wrapper
+    return decorator
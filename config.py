@@ -1,17 +1,144 @@
+import os
+from sqlalchemy.engine import make_url
+
+
+# create_engine() options for `url` from DB_* environment variables. Only
+# the ones that are set are passed, since SQLite's default pools reject some
+# of them; the lock timeout is a pysqlite argument other drivers reject.
+def engine_options(url, environ=os.environ):
+    options = {}
+    if make_url(url).get_backend_name() == 'sqlite':
+        options['connect_args'] = {'timeout': 15}  # Seconds to wait on a locked SQLite database
+    for option, name, convert in (
+        ('pool_size', 'DB_POOL_SIZE', int),
+        ('max_overflow', 'DB_MAX_OVERFLOW', int),
+        ('pool_timeout', 'DB_POOL_TIMEOUT', int),
+        ('pool_recycle', 'DB_POOL_RECYCLE', int),  # Seconds before a connection is replaced
+        ('pool_pre_ping', 'DB_POOL_PRE_PING', lambda value: value.lower() in ('1', 'true', 'yes')),
+    ):
+        if environ.get(name):
+            options[option] = convert(environ[name])
+    return options
+
+
 class Config:
-    SQLALCHEMY_DATABASE_URI = 'sqlite:///library.db'  # Database URI
+    SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL', 'sqlite:///library.db')  # Database URI
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    SQLALCHEMY_ENGINE_OPTIONS = {}  # Overrides; init_db() adds engine_options() for the final URI
+
+    # Read-only copy for the list, search, export and /stats endpoints
+    DATABASE_REPLICA_URL = os.environ.get('DATABASE_REPLICA_URL')
+    SQLALCHEMY_BINDS = {'replica': DATABASE_REPLICA_URL} if DATABASE_REPLICA_URL else {}
+
+    # Applied to every new SQLite connection. WAL lets readers run alongside
+    # the single writer; busy_timeout makes writers queue instead of failing
+    # with "database is locked".
+    SQLITE_PRAGMAS = {
+        'journal_mode': 'WAL',
+        'synchronous': os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL'),
+        'busy_timeout': 15000,
+        'mmap_size': int(os.environ.get('SQLITE_MMAP_SIZE', 268435456)),  # 256 MB
+        'cache_size': int(os.environ.get('SQLITE_CACHE_SIZE', -65536)),  # 64 MB
+    }
     SECRET_KEY = 'your_secret_key'
     
     
     
+    # Admin passwords: a werkzeug generate_password_hash() method with its cost
+    # parameters. Stored hashes made with other parameters are replaced on
+    # the next successful login.
+    PASSWORD_HASH_METHOD = 'scrypt:32768:8:1'
+    ADMIN_CACHE_TTL = 60  # Seconds an admin identity is trusted without a query; 0 disables
+    ADMIN_CACHE_SIZE = 1024
+
     # Email settings
     MAIL_SERVER = 'smtp.example.com'
     MAIL_PORT = 587
     MAIL_USE_TLS = True
     MAIL_USERNAME = 'your_email@example.com'
     MAIL_PASSWORD = 'your_password'
+    MAIL_DEFAULT_SENDER = 'library@example.com'
+
+    # Queued notification mail (flask dispatch-mail)
+    MAIL_DISPATCH_BATCH_SIZE = 200  # Notifications claimed per batch
+    MAIL_DISPATCH_WORKERS = 4  # Sending threads, one SMTP connection each per batch
+    MAIL_MAX_ATTEMPTS = 5  # Give up and mark failed after this many tries
+    MAIL_RETRY_BACKOFF = 60  # Seconds before the first retry, doubled on every failure
+    MAIL_CLAIM_TIMEOUT = 300  # Seconds before a claimed but unfinished batch is retried
     
     # Max loans and other constants
     MAX_LOANS_PER_CUSTOMER = 2
     MAX_LOAN_DURATION = 14  # Max loan duration in days
+    MAX_BULK_ITEMS = 1000  # Items accepted by one bulk request
+    BULK_UPDATE_CHUNK_SIZE = 500  # Ids per UPDATE ... WHERE id IN (...) in set-based bulk updates
+
+    # flask import-data / export-data
+    IMPORT_BATCH_SIZE = 10000  # Rows per transaction
+    EXPORT_BATCH_SIZE = 5000  # Rows per fetch (and per Parquet row group) in exports
+    IMPORT_SQLITE_PRAGMAS = {  # Applied to the loading connection only, restored afterwards
+        'synchronous': 'OFF',
+        'cache_size': -262144,  # 256 MB
+        'temp_store': 'MEMORY',
+    }
+
+    # Response encoding: 'orjson' (falls back to the stdlib encoder when the
+    # package is missing) or 'default'
+    JSON_PROVIDER = 'orjson'
+
+    # List endpoints
+    MAX_PAGE_SIZE = 1000  # Upper bound for ?limit=
+    STREAM_BATCH_SIZE = 1000  # Rows fetched per query when streaming a full list
+
+    # /stats rollups are read-only: the refresh-stats job (JOB_SCHEDULES),
+    # `flask refresh-stats` or POST /stats/refresh bring them up to date
+    STATS_TOP_LIMIT = 10  # Default ?limit= for /stats/top_books
+
+    # Book/customer lookup cache: 'memory', 'redis' or None to disable
+    CACHE_BACKEND = 'memory'
+    CACHE_MAX_SIZE = 10000  # Entries kept by the in-process LRU
+    CACHE_TTL = 300  # Seconds
+    CACHE_REDIS_URL = 'redis://localhost:6379/0'
+
+    # Write requests (POST/PUT/PATCH/DELETE): token bucket per client and
+    # endpoint ('blueprint.view') as (requests per second, burst), answered
+    # 429 when empty
+    RATE_LIMIT_ENABLED = True
+    RATE_LIMIT_BACKEND = 'memory'  # Or 'redis' to share buckets between workers
+    RATE_LIMIT_REDIS_URL = 'redis://localhost:6379/1'
+    RATE_LIMIT_KEY_HEADER = 'X-Client-Key'  # Falls back to the remote address
+    RATE_LIMIT_DEFAULT = (10, 20)
+    RATE_LIMITS = {
+        'loans.create_loan': (2, 10),
+        'notifications.create_notification': (2, 10),
+    }
+    # Concurrent write requests per worker; a few more may queue briefly,
+    # the rest are answered 503 with Retry-After
+    ADMISSION_MAX_CONCURRENT = 4
+    ADMISSION_MAX_QUEUE = 32
+    ADMISSION_QUEUE_TIMEOUT = 5  # Seconds
+
+    # Per-endpoint latency/SQL/serialization metrics on /metrics (Prometheus text)
+    PERF_INSTRUMENTATION = False
+    PERF_SERVER_TIMING = False  # Also send a Server-Timing header on every response
+
+    # Maintenance jobs (flask run-scheduler, or a thread in every app process
+    # with SCHEDULER_ENABLED). Each job row is leased by one worker at a time,
+    # so any number of processes can run the scheduler.
+    SCHEDULER_ENABLED = False
+    SCHEDULER_POLL_INTERVAL = 30  # Seconds between checks for due jobs
+    JOB_LEASE_SECONDS = 600  # A job held by a worker that died is run again after this
+    JOB_SCHEDULES = {  # Cron expressions (minute hour day month weekday), UTC
+        'mark-overdue': '*/15 * * * *',
+        'due-soon-reminders': '0 8 * * *',
+        'prune-notifications': '30 3 * * *',
+        'refresh-stats': '*/10 * * * *',
+    }
+    MAINTENANCE_CHUNK_SIZE = 500  # Rows per write transaction in maintenance jobs
+    DUE_SOON_DAYS = 2  # Remind patrons this many days before return_date
+    NOTIFICATION_RETENTION_DAYS = 90  # Read notifications older than this are pruned
+
+    # Async read API (asgi.py) for polling clients: book lookups, availability
+    # and notification inboxes on an aiosqlite engine of its own
+    ASYNC_POOL_SIZE = 8  # aiosqlite connections kept open, one thread each
+    ASYNC_MAX_OVERFLOW = 8  # Extra connections opened under load
+    ASYNC_POOL_TIMEOUT = 10  # Seconds a request waits for a connection before failing
@@ -0,0 +1,91 @@
+import os
+import pytest
+from sqlalchemy import event
+from app import create_app
+from models import db
+
+TEST_CONFIG = {
+    'TESTING': True,
+    'RATE_LIMIT_ENABLED': False,
+}
+
+
+def pytest_addoption(parser):
+    parser.addoption('--test-db', choices=('file', 'memory'), default='file',
+                     help='Per-worker test database: a SQLite file (default) or an in-memory database.')
+
+
+# pysqlite opens transactions on its own and cannot do SAVEPOINTs inside
+# them; let SQLAlchemy emit BEGIN itself instead
+def _driver_autocommit(dbapi_connection, connection_record):
+    dbapi_connection.isolation_level = None
+
+
+def _emit_begin(connection):
+    connection.exec_driver_sql('BEGIN')
+
+
+def _build_app(uri):
+    app = create_app({**TEST_CONFIG, 'SQLALCHEMY_DATABASE_URI': uri})
+    with app.app_context():
+        db.create_all()
+    return app
+
+
+def _dispose(app):
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose()
+
+
+# One app and schema per worker: pytest-xdist runs each worker in its own
+# process, with its own base temp directory
+@pytest.fixture(scope='session')
+def worker_app(request, tmp_path_factory):
+    if request.config.getoption('test_db') == 'memory':
+        uri = 'sqlite:///:memory:'
+    else:
+        worker = os.environ.get('PYTEST_XDIST_WORKER', 'main')
+        uri = f"sqlite:///{tmp_path_factory.mktemp('db') / f'library-{worker}.db'}"
+    app = create_app({**TEST_CONFIG, 'SQLALCHEMY_DATABASE_URI': uri})
+    with app.app_context():
+        event.listen(db.engine, 'connect', _driver_autocommit)
+        event.listen(db.engine, 'begin', _emit_begin)
+        db.create_all()
+    yield app
+    _dispose(app)
+
+
+# The worker's app with each test inside one outer transaction, rolled back
+# at teardown. Sessions join it on the same connection, so the code under
+# test committing or rolling back only releases or rolls back a SAVEPOINT.
+@pytest.fixture
+def app(worker_app):
+    with worker_app.app_context():
+        connection = db.engine.connect()
+        transaction = connection.begin()
+        db.session.configure(bind=connection, join_transaction_mode='create_savepoint')
+    worker_app.extensions['lookup_cache'].clear()
+    worker_app.extensions['admin_identities'].clear()
+    try:
+        yield worker_app
+    finally:
+        with worker_app.app_context():
+            db.session.configure(bind=None)
+        transaction.rollback()
+        connection.close()
+
+
+# A fresh database with real commits, for code that opens connections of its
+# own (bulk import) and so cannot join the test's transaction
+@pytest.fixture
+def committing_app(tmp_path):
+    app = _build_app(f"sqlite:///{tmp_path / 'library.db'}")
+    yield app
+    _dispose(app)
+
+
+@pytest.fixture
+def client(app):
+    with app.test_client() as client:
+        yield client
@@ -1,12 +1,12 @@
 from datetime import date
-from app import app, db
-from models import Admin, Book, Customer, Loan, Notification
+from app import create_app
+from models import db, Admin, Book, Customer, Loan, Notification
 from werkzeug.security import generate_password_hash
-from models import Notification
 
 
 
 # Ensure the seeding process is inside the application context
+app = create_app()
 with app.app_context():
     # Create tables
     db.create_all()
@@ -41,57 +41,33 @@ with app.app_context():
     loan5 = Loan(book_id=5, cust_id=5, loan_date=date(2021, 3, 5), return_date=date(2021, 3, 19))
     db.session.add_all([loan1, loan2, loan3, loan4, loan5])
 
-#add admin
-admin1 = Admin(username='admin', password=generate_password_hash('123', method='pbkdf2:sha256'))
-db.session.add(admin1)
-db.session.commit()
-
+    # Add admin
+    admin1 = Admin(username='admin', password=generate_password_hash('123', method='pbkdf2:sha256'))
+    db.session.add(admin1)
+    db.session.commit()
 
     # Add notifications
-notification1 = Notification(message='Book The Great Gatsby is due for return on 2021-03-15', cust_id=1)
-notification2 = Notification(message='Book To Kill a Mockingbird is due for return on 2021-03-16', cust_id=2)
-notification3 = Notification(message='Book 1984 is due for return on 2021-03-17', cust_id=3)
-notification4 = Notification(message='Book The Catcher in the Rye is due for return on 2021-03-18', cust_id=4)
-notification5 = Notification(message='Book The Hobbit is due for return on 2021-03-19', cust_id=5)
-
-# Add all notifications at once
-db.session.add_all([notification1, notification2, notification3, notification4, notification5])
-
-# Commit the changes to save them to the database
-db.session.commit()
-
-# Function to update the notification status
-def update_notification_status(notification_id):
-    with app.app_context():
-        # Get the notification by ID
-        notification = Notification.query.get(notification_id)
-        
-        if notification:
-            # Update its status to 'read'
-            notification.status = 'read'
-            
-            # Commit the update to the database
-            db.session.commit()
-            
-            print(f'Notification {notification_id} status updated successfully.')
-        else:
-            print('Notification not found.')
-
-# Call the function to update the notification status
-update_notification_status(1)
-update_notification_status(2)
-update_notification_status(3)
-update_notification_status(4)
-update_notification_status(5)
-
-# Commit the final changes
-db.session.commit()
-
-print('Data seeded and notifications updated successfully!')
+    notification1 = Notification(type='reminder', content='Book The Great Gatsby is due for return on 2021-03-15', priority='medium', recipient_id=1)
+    notification2 = Notification(type='reminder', content='Book To Kill a Mockingbird is due for return on 2021-03-16', priority='medium', recipient_id=2)
+    notification3 = Notification(type='reminder', content='Book 1984 is due for return on 2021-03-17', priority='medium', recipient_id=3)
+    notification4 = Notification(type='reminder', content='Book The Catcher in the Rye is due for return on 2021-03-18', priority='medium', recipient_id=4)
+    notification5 = Notification(type='reminder', content='Book The Hobbit is due for return on 2021-03-19', priority='medium', recipient_id=5)
+
+    # Add all notifications at once
+    db.session.add_all([notification1, notification2, notification3, notification4, notification5])
+
+    # Commit the changes to save them to the database
+    db.session.commit()
+
+    # Mark the seeded notifications as read in one statement
+    notification_ids = [n.id for n in [notification1, notification2, notification3, notification4, notification5]]
+    Notification.query.filter(Notification.id.in_(notification_ids)).update({'status': 'read'}, synchronize_session=False)
+    db.session.commit()
+
+    print('Data seeded and notifications updated successfully!')
 
     # Verify the data in the database
-notifications_in_db = Notification.query.all()
-print(f'Total notifications in DB: {len(notifications_in_db)}')
+    print(f'Total notifications in DB: {Notification.query.count()}')
 
 
 
@@ -0,0 +1,63 @@
+import os
+from functools import wraps
+from sqlalchemy import event
+from config import engine_options
+from models import db
+
+
+# Apply SQLITE_PRAGMAS to every new SQLite connection
+def set_sqlite_pragmas(pragmas):
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+        cursor.close()
+    return on_connect
+
+
+# engine_options() for the URIs the app ends up with, under any options
+# set explicitly in its config
+def _apply_engine_options(config):
+    config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+        **engine_options(config['SQLALCHEMY_DATABASE_URI']), **config.get('SQLALCHEMY_ENGINE_OPTIONS', {}),
+    }
+    binds = {}
+    for key, bind in config.get('SQLALCHEMY_BINDS', {}).items():
+        bind = {'url': bind} if isinstance(bind, str) else bind
+        binds[key] = {**engine_options(bind['url']), **bind}
+    config['SQLALCHEMY_BINDS'] = binds
+
+
+def init_db(app):
+    _apply_engine_options(app.config)
+    db.init_app(app)
+    with app.app_context():
+        for key, engine in db.engines.items():
+            if engine.dialect.name == 'sqlite':
+                pragmas = dict(app.config.get('SQLITE_PRAGMAS', {}))
+                if key == 'replica':
+                    # Never change the replica file, even by accident
+                    pragmas.pop('journal_mode', None)
+                    pragmas['query_only'] = 'ON'
+                event.listen(engine, 'connect', set_sqlite_pragmas(pragmas))
+        engines = list(db.engines.values())
+
+    # Workers forked after the app was loaded (gunicorn --preload) must not
+    # reuse the parent's pooled connections; close=False leaves them to the parent.
+    if hasattr(os, 'register_at_fork'):
+        os.register_at_fork(after_in_child=lambda: [engine.dispose(close=False) for engine in engines])
+
+
+# Route this session's reads to the read replica, if one is configured,
+# until the session is removed at the end of the request
+def use_replica():
+    db.session.info['use_replica'] = True
+
+
+# View decorator for heavy list and report endpoints
+def replica_reads(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        use_replica()
+        return view(*args, **kwargs)
+    return wrapper
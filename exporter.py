@@ -0,0 +1,142 @@
+import csv
+import io
+import json
+from datetime import datetime, timedelta
+from sqlalchemy import Boolean, Date, DateTime, Integer, select
+from models import db, Book, Customer, ExportWatermark, Loan
+from pagination import row_formatter
+
+EXPORT_MODELS = {
+    'books': Book,
+    'customers': Customer,
+    'loans': Loan,
+}
+EXPORT_FORMATS = ('csv', 'ndjson', 'parquet')
+
+
+class ExportError(ValueError):
+    pass
+
+
+# Stream rows with id > since_id and/or updated_at >= updated_since in id
+# order, `batch_size` rows at a time. yield_per keeps a server-side cursor
+# open instead of loading the result.
+def export_batches(kind, since_id=None, batch_size=5000, updated_since=None):
+    model = EXPORT_MODELS[kind]
+    statement = select(*model.__table__.columns).order_by(model.id)
+    if since_id is not None:
+        statement = statement.where(model.id > since_id)
+    if updated_since is not None:
+        statement = statement.where(model.updated_at >= updated_since)
+    result = db.session.execute(statement.execution_options(yield_per=batch_size))
+    for batch in result.partitions():
+        yield batch
+
+
+def _columns(kind):
+    return EXPORT_MODELS[kind].__table__.columns.keys()
+
+
+# Text chunks for CSV / NDJSON, one per batch, in the to_dict() shape
+def iter_text(kind, fmt, since_id=None, batch_size=5000, updated_since=None):
+    model = EXPORT_MODELS[kind]
+    columns = _columns(kind)
+    fmt_row = row_formatter(model, columns)
+    if fmt == 'csv':
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(columns)
+        yield buffer.getvalue()
+    for batch in export_batches(kind, since_id, batch_size, updated_since):
+        if fmt == 'csv':
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerows(fmt_row(row).values() for row in batch)
+            yield buffer.getvalue()
+        else:
+            yield ''.join(json.dumps(fmt_row(row), default=str) + '\n' for row in batch)
+
+
+def _arrow_schema(kind):
+    import pyarrow as pa
+    types = []
+    for column in EXPORT_MODELS[kind].__table__.columns:
+        if isinstance(column.type, Boolean):
+            arrow_type = pa.bool_()
+        elif isinstance(column.type, Integer):
+            arrow_type = pa.int64()
+        elif isinstance(column.type, DateTime):
+            arrow_type = pa.timestamp('us')
+        elif isinstance(column.type, Date):
+            arrow_type = pa.date32()
+        else:
+            arrow_type = pa.string()
+        types.append(pa.field(column.name, arrow_type))
+    return pa.schema(types)
+
+
+# Write one Parquet row group per batch, so memory stays bounded by batch_size
+def write_parquet(kind, path, since_id=None, batch_size=50000, updated_since=None):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ExportError('Parquet export needs the pyarrow package')
+    schema = _arrow_schema(kind)
+    count, last_id = 0, since_id
+    with pq.ParquetWriter(path, schema) as writer:
+        for batch in export_batches(kind, since_id, batch_size, updated_since):
+            table = pa.Table.from_pylist([row._asdict() for row in batch], schema=schema)
+            writer.write_table(table)
+            count += len(batch)
+            last_id = batch[-1].id
+    return count, last_id
+
+
+def write_text(kind, fmt, path, since_id=None, batch_size=5000, updated_since=None):
+    count, last_id = 0, since_id
+    with open(path, 'w', newline='') as f:
+        if fmt == 'csv':
+            writer = csv.writer(f)
+            writer.writerow(_columns(kind))
+        fmt_row = row_formatter(EXPORT_MODELS[kind], _columns(kind))
+        for batch in export_batches(kind, since_id, batch_size, updated_since):
+            if fmt == 'csv':
+                writer.writerows(fmt_row(row).values() for row in batch)
+            else:
+                f.writelines(json.dumps(fmt_row(row), default=str) + '\n' for row in batch)
+            count += len(batch)
+            last_id = batch[-1].id
+    return count, last_id
+
+
+# Export `kind` to `path`. With a watermark name only rows added or
+# changed since the last export under that name are written (by updated_at,
+# so returns and other updates are picked up), and the watermark moves
+# forward once the file is complete. The next run starts a second before
+# this one did, as the update triggers store whole seconds; rows written
+# in that second are exported again, so consumers upsert by id.
+def export_to_file(kind, fmt, path, since_id=None, watermark=None, batch_size=5000, updated_since=None, now=None):
+    if kind not in EXPORT_MODELS:
+        raise ExportError(f'Unknown kind: {kind}')
+    if fmt not in EXPORT_FORMATS:
+        raise ExportError(f'Unknown format: {fmt}')
+    started = (now or datetime.utcnow()).replace(microsecond=0) - timedelta(seconds=1)
+    if watermark is not None and since_id is None and updated_since is None:
+        mark = db.session.get(ExportWatermark, watermark)
+        if mark is not None and mark.updated_since is not None:
+            updated_since = mark.updated_since
+        elif mark is not None:
+            # Watermarks written before updated_since was tracked
+            since_id = mark.last_id
+
+    if fmt == 'parquet':
+        count, last_id = write_parquet(kind, path, since_id, batch_size, updated_since)
+    else:
+        count, last_id = write_text(kind, fmt, path, since_id, batch_size, updated_since)
+
+    if watermark is not None and last_id is not None:
+        db.session.merge(ExportWatermark(name=watermark, kind=kind, last_id=last_id, exported_at=datetime.utcnow(),
+                                         updated_since=started))
+        db.session.commit()
+    return {'rows': count, 'since_id': since_id, 'updated_since': updated_since, 'last_id': last_id}
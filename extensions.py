@@ -0,0 +1,28 @@
+from flask import current_app
+from flask_login import LoginManager
+from flask_mail import Mail
+from werkzeug.local import LocalProxy
+
+# Created unbound and attached to each app by create_app(); both keep their
+# per-app state in app.extensions / on the app, so one instance serves many apps
+login_manager = LoginManager()
+mail = Mail()
+
+
+def _extension(name):
+    return LocalProxy(lambda: current_app.extensions[name])
+
+
+# Extensions holding per-app state (caches, buckets, metrics) are built for
+# each app; these resolve to the current app's instance
+admin_identities = _extension('admin_identities')
+job_scheduler = _extension('job_scheduler')
+lookup_cache = _extension('lookup_cache')
+perf = _extension('perf_instrumentation')
+write_throttle = _extension('write_throttle')
+
+
+# Resolve the session's admin through the identity cache
+@login_manager.user_loader
+def load_admin(admin_id):
+    return admin_identities.get(int(admin_id))
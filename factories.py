@@ -0,0 +1,86 @@
+import itertools
+from collections import Counter
+from datetime import date, datetime, timedelta
+from sqlalchemy import bindparam, insert
+from models import db, Book, Customer, Loan
+
+# Numbers names and emails, unique across calls within a process
+_sequence = itertools.count(1)
+
+
+# Bulk fixtures for tests and scale runs. Each call is one multi-row INSERT
+# (no ORM objects) and returns the new ids in order. Columns default to
+# numbered values; a keyword sets a column for every row, or per row when it
+# is a callable taking the row's index. The caller commits.
+def _rows(count, defaults, overrides):
+    rows = []
+    for index in range(count):
+        row = defaults(next(_sequence))
+        for column, value in overrides.items():
+            row[column] = value(index) if callable(value) else value
+        rows.append(row)
+    return rows
+
+
+def _insert(model, rows):
+    if not rows:
+        return []
+    return list(db.session.scalars(insert(model).returning(model.id, sort_by_parameter_order=True), rows))
+
+
+def make_books(count, **columns):
+    return _insert(Book, _rows(count, lambda n: {
+        'name': f'Book {n}',
+        'author': f'Author {n % 100}',
+        'year_published': 1950 + n % 75,
+        'book_type': 1,
+        'category': 'General',
+        'active': True,
+        'available_copies': 1,
+        'updated_at': datetime.utcnow(),
+    }, columns))
+
+
+def make_customers(count, **columns):
+    return _insert(Customer, _rows(count, lambda n: {
+        'name': f'Customer {n}',
+        'city': 'Springfield',
+        'age': 30,
+        'date_of_birth': date(1995, 1, 1),
+        'email': f'customer{n}@example.com',
+        'phone': f'{n:010d}'[-10:],
+        'status': 'active',
+        'updated_at': datetime.utcnow(),
+    }, columns))
+
+
+# Loans cycle through `customer_ids` and `book_ids`; open loans take their
+# copy from available_copies as checkout() would (limits are not checked)
+def make_loans(count, customer_ids, book_ids, **columns):
+    today = date.today()
+    cycle = itertools.count()
+
+    def defaults(n):
+        index = next(cycle)
+        return {
+            'cust_id': customer_ids[index % len(customer_ids)],
+            'book_id': book_ids[index % len(book_ids)],
+            'loan_date': today - timedelta(days=7),
+            'return_date': today + timedelta(days=7),
+            'actual_return_date': None,
+            'status': 'ongoing',
+            'updated_at': datetime.utcnow(),
+        }
+
+    rows = _rows(count, defaults, columns)
+    ids = _insert(Loan, rows)
+    taken = Counter(row['book_id'] for row in rows if row['actual_return_date'] is None)
+    if taken:
+        book = Book.__table__
+        db.session.execute(
+            book.update()
+            .where(book.c.id == bindparam('book_id'))
+            .values(available_copies=book.c.available_copies - bindparam('taken')),
+            [{'book_id': book_id, 'taken': n} for book_id, n in taken.items()],
+        )
+    return ids
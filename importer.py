@@ -0,0 +1,191 @@
+import csv
+import json
+import os
+import time
+from flask import current_app
+from sqlalchemy import delete, insert, select
+from circulation import parse_date
+from models import db, Book, Customer, ImportCheckpoint, Loan
+
+
+def _bool(value):
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() not in ('0', 'false', 'no', '')
+
+
+def _optional(convert):
+    return lambda value: convert(value) if value not in (None, '') else None
+
+
+def _date(value):
+    return value if hasattr(value, 'year') else parse_date(value)
+
+
+# kind -> (model, {column: (converter, required, default)})
+IMPORT_SCHEMAS = {
+    'books': (Book, {
+        'name': (str, True, None),
+        'author': (str, True, None),
+        'year_published': (int, True, None),
+        'book_type': (int, True, None),
+        'category': (str, False, 'General'),
+        'active': (_bool, False, True),
+        'available_copies': (int, False, 1),
+        'description': (_optional(str), False, None),
+    }),
+    'customers': (Customer, {
+        'name': (str, True, None),
+        'city': (str, True, None),
+        'age': (int, True, None),
+        'date_of_birth': (_date, True, None),
+        'email': (str, True, None),
+        'phone': (str, True, None),
+        'status': (str, False, 'active'),
+    }),
+    'loans': (Loan, {
+        'cust_id': (int, True, None),
+        'book_id': (int, True, None),
+        'loan_date': (_date, True, None),
+        'return_date': (_date, True, None),
+        'actual_return_date': (_optional(_date), False, None),
+        'status': (str, False, 'ongoing'),
+    }),
+}
+
+
+class ImportDataError(ValueError):
+    pass
+
+
+# One record as a row of `schema`'s columns; ValueError names the bad column
+def convert_record(record, schema):
+    if not isinstance(record, dict):
+        raise ValueError(f'expected an object, got {type(record).__name__}')
+    row = {}
+    for column, (convert, required, default) in schema.items():
+        value = record.get(column)
+        if value in (None, ''):
+            if required:
+                raise ValueError(f'missing {column}')
+            row[column] = default
+        else:
+            try:
+                row[column] = convert(value)
+            except (TypeError, ValueError):
+                raise ValueError(f'invalid {column}: {value!r}') from None
+    return row
+
+
+def _records(path, fmt):
+    with open(path, newline='') as f:
+        if fmt == 'csv':
+            yield from csv.DictReader(f)
+        else:
+            yield from f
+
+
+def _load_checkpoint(connection, source, kind):
+    row = connection.execute(
+        select(ImportCheckpoint.kind, ImportCheckpoint.records).where(ImportCheckpoint.source == source)
+    ).first()
+    if row is None:
+        return 0
+    if row.kind != kind:
+        raise ImportDataError(f'{source} has an unfinished {row.kind} import')
+    return row.records
+
+
+def _save_checkpoint(connection, source, kind, records):
+    checkpoints = ImportCheckpoint.__table__
+    connection.execute(delete(checkpoints).where(checkpoints.c.source == source))
+    connection.execute(insert(checkpoints).values(source=source, kind=kind, records=records))
+
+
+def _set_pragmas(connection, pragmas):
+    for name, value in pragmas.items():
+        connection.exec_driver_sql(f'PRAGMA {name} = {value}')
+
+
+# Stream a CSV or JSONL file into one table in large batched transactions.
+# Each batch commits together with a checkpoint row for the file, so a run
+# that fails part way resumes after the last committed batch (pass
+# restart=True to start over). With `defer_indexes` the table's secondary
+# indexes are dropped for the load and rebuilt once at the end. Rejected
+# records are counted and logged with their line number.
+def import_file(kind, path, fmt=None, batch_size=10000, restart=False, defer_indexes=True,
+                load_pragmas=None, restore_pragmas=None, report=None):
+    if kind not in IMPORT_SCHEMAS:
+        raise ImportDataError(f'Unknown kind: {kind}')
+    model, schema = IMPORT_SCHEMAS[kind]
+    table = model.__table__
+    fmt = fmt or ('csv' if path.endswith('.csv') else 'jsonl')
+    source = os.path.abspath(path)
+    started = time.perf_counter()
+
+    checkpoints = ImportCheckpoint.__table__
+    with db.engine.connect() as connection:
+        skip = 0 if restart else _load_checkpoint(connection, source, kind)
+        stats = {'imported': 0, 'resumed_after': skip, 'rejected': 0}
+        sqlite = connection.dialect.name == 'sqlite'
+        if sqlite and load_pragmas:
+            _set_pragmas(connection, load_pragmas)
+        try:
+            if defer_indexes:
+                for index in table.indexes:
+                    index.drop(connection, checkfirst=True)
+                connection.commit()
+
+            batch = []
+            done = skip
+
+            def flush():
+                nonlocal batch
+                if batch:
+                    connection.execute(insert(table), batch)
+                _save_checkpoint(connection, source, kind, done)
+                connection.commit()
+                stats['imported'] += len(batch)
+                batch = []
+                if report:
+                    elapsed = time.perf_counter() - started
+                    report(f"{done} records read, {stats['imported']} imported "
+                           f"({stats['imported'] / elapsed:,.0f} rows/sec)")
+
+            # JSONL records are numbered by line and parsed here, so a bad
+            # line is rejected like any other bad record
+            for number, record in enumerate(_records(path, fmt), start=1):
+                if number <= skip:
+                    continue
+                done = number
+                if fmt != 'csv' and not record.strip():
+                    continue
+                try:
+                    if fmt != 'csv':
+                        record = json.loads(record)
+                    batch.append(convert_record(record, schema))
+                except (TypeError, ValueError) as e:
+                    stats['rejected'] += 1
+                    current_app.logger.warning('%s:%d: rejected: %s', path, number, e)
+                if len(batch) >= batch_size:
+                    flush()
+            flush()
+            connection.execute(delete(checkpoints).where(checkpoints.c.source == source))
+            connection.commit()
+        finally:
+            connection.rollback()
+            # Rebuilt whether or not the load finished, so a failed or
+            # interrupted import never leaves the table without its indexes
+            if defer_indexes:
+                for index in table.indexes:
+                    index.create(connection, checkfirst=True)
+                if sqlite:
+                    connection.exec_driver_sql(f'ANALYZE {table.name}')
+                connection.commit()
+            if sqlite and restore_pragmas:
+                _set_pragmas(connection, restore_pragmas)
+
+    elapsed = time.perf_counter() - started
+    stats['seconds'] = round(elapsed, 3)
+    stats['rows_per_sec'] = round(stats['imported'] / elapsed, 1) if elapsed else 0.0
+    return stats
@@ -0,0 +1,154 @@
+import threading
+import time
+from flask import Response, g, has_request_context, request
+from sqlalchemy import event
+from models import db
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class EndpointStats:
+    def __init__(self):
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.count = 0
+        self.latency = 0.0
+        self.sql_statements = 0
+        self.db_time = 0.0
+        self.serialize_time = 0.0
+
+    def observe(self, latency, sql_statements, db_time, serialize_time):
+        index = 0
+        while index < len(LATENCY_BUCKETS) and latency > LATENCY_BUCKETS[index]:
+            index += 1
+        self.buckets[index] += 1
+        self.count += 1
+        self.latency += latency
+        self.sql_statements += sql_statements
+        self.db_time += db_time
+        self.serialize_time += serialize_time
+
+
+# Opt-in per-endpoint timing: request latency histogram, SQL statement count,
+# DB time and time spent formatting list rows and JSON encoding. Nothing is
+# hooked in unless PERF_INSTRUMENTATION is set, so the disabled cost is zero.
+# Only this app's engines and JSON provider are hooked; model classes are
+# shared by every app in the process and are left alone.
+class PerfInstrumentation:
+    def __init__(self, app=None):
+        self.endpoints = {}
+        self.enabled = False
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.extensions['perf_instrumentation'] = self
+        if not app.config.get('PERF_INSTRUMENTATION'):
+            return
+        self.enabled = True
+        self.server_timing = app.config.get('PERF_SERVER_TIMING', False)
+
+        with app.app_context():
+            for engine in db.engines.values():
+                event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+                event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+        app.json.dumps = _timed(app.json.dumps)
+
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.add_url_rule('/metrics', 'metrics', self.metrics_view, methods=['GET'])
+
+    # `func` with its time counted as serialization (list_response() wraps
+    # its row formatter); returned as is when instrumentation is off
+    def timed(self, func):
+        return _timed(func) if self.enabled else func
+
+    def _before_request(self):
+        g.perf = {'start': time.perf_counter(), 'sql': 0, 'db': 0.0, 'serialize': 0.0}
+
+    def _after_request(self, response):
+        perf = g.get('perf')
+        if perf is None:
+            return response
+        endpoint = request.endpoint or 'unknown'
+        if self.server_timing:
+            response.headers['Server-Timing'] = (
+                f'db;dur={perf["db"] * 1000:.2f};desc="{perf["sql"]} queries", '
+                f'serialize;dur={perf["serialize"] * 1000:.2f}, '
+                f'app;dur={(time.perf_counter() - perf["start"]) * 1000:.2f}'
+            )
+        # Streamed bodies keep running queries and encoding after this hook,
+        # so the request is recorded once the response is closed
+        response.call_on_close(lambda: self._record(endpoint, perf))
+        return response
+
+    def _record(self, endpoint, perf):
+        latency = time.perf_counter() - perf['start']
+        with self._lock:
+            stats = self.endpoints.get(endpoint)
+            if stats is None:
+                stats = self.endpoints[endpoint] = EndpointStats()
+            stats.observe(latency, perf['sql'], perf['db'], perf['serialize'])
+
+    def metrics_view(self):
+        return Response(self.render_prometheus(), mimetype='text/plain; version=0.0.4')
+
+    def render_prometheus(self):
+        with self._lock:
+            endpoints = sorted(self.endpoints.items())
+        lines = [
+            '# HELP library_request_duration_seconds Request latency by endpoint.',
+            '# TYPE library_request_duration_seconds histogram',
+        ]
+        for endpoint, stats in endpoints:
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS + ('+Inf',), stats.buckets):
+                cumulative += count
+                lines.append(f'library_request_duration_seconds_bucket{{endpoint="{endpoint}",le="{bound}"}} {cumulative}')
+            lines.append(f'library_request_duration_seconds_sum{{endpoint="{endpoint}"}} {stats.latency:.6f}')
+            lines.append(f'library_request_duration_seconds_count{{endpoint="{endpoint}"}} {stats.count}')
+
+        for name, attr, help_text in (
+            ('library_sql_statements_total', 'sql_statements', 'SQL statements executed.'),
+            ('library_db_seconds_total', 'db_time', 'Time spent executing SQL.'),
+            ('library_serialization_seconds_total', 'serialize_time', 'Time spent formatting rows and JSON encoding.'),
+        ):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} counter')
+            for endpoint, stats in endpoints:
+                value = getattr(stats, attr)
+                value = f'{value:.6f}' if isinstance(value, float) else value
+                lines.append(f'{name}{{endpoint="{endpoint}"}} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+def _current_perf():
+    return g.get('perf') if has_request_context() else None
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    perf = _current_perf()
+    if perf is not None:
+        perf['sql'] += 1
+        conn.info.setdefault('perf_query_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    perf = _current_perf()
+    starts = conn.info.get('perf_query_start')
+    if perf is not None and starts:
+        perf['db'] += time.perf_counter() - starts.pop()
+
+
+def _timed(func):
+    def wrapper(*args, **kwargs):
+        perf = _current_perf()
+        if perf is None:
+            return func(*args, **kwargs)
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            perf['serialize'] += time.perf_counter() - started
+    wrapper.__wrapped__ = func
+    return wrapper
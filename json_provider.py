@@ -0,0 +1,46 @@
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# orjson-backed provider that keeps the stdlib provider's output: sorted
+# keys, and dates passed through to default() so they stay HTTP dates.
+# Calls with json.dumps() keyword arguments go to the stdlib encoder.
+class OrjsonProvider(DefaultJSONProvider):
+    def _option(self):
+        option = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        return option
+
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=self.default, option=self._option()).decode()
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    # Encodes through self.dumps, so a wrapper on app.json.dumps (the perf
+    # instrumentation's timer) sees every jsonify() body too. Indented
+    # (debug) output comes from the stdlib provider's response().
+    def response(self, *args, **kwargs):
+        if (self.compact is None and self._app.debug) or self.compact is False:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(f'{self.dumps(obj)}\n', mimetype=self.mimetype)
+
+
+# JSON_PROVIDER: 'orjson' (used when the package is installed) or 'default'
+def json_provider(app):
+    name = app.config.get('JSON_PROVIDER', 'orjson')
+    if name not in ('orjson', 'default'):
+        raise ValueError(f'Unknown JSON_PROVIDER: {name}')
+    if name == 'orjson' and orjson is not None:
+        return OrjsonProvider(app)
+    return DefaultJSONProvider(app)
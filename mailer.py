@@ -0,0 +1,149 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from flask import current_app
+from flask_mail import Message
+from sqlalchemy import String, cast, exists, insert, literal, select, update
+from circulation import begin_write, overdue_loans_query
+from models import db, Book, Customer, Loan, Notification
+
+SUBJECTS = {
+    'overdue': 'Overdue library loan',
+    'hold_ready': 'Your library hold is ready',
+    'due_soon': 'Library loan due soon',
+}
+
+
+# Queue one overdue notice per overdue loan that does not have one yet,
+# in a single INSERT ... SELECT. Returns the number of notices queued.
+def enqueue_overdue_notices():
+    already_queued = exists().where(Notification.loan_id == Loan.id, Notification.type == 'overdue')
+    notices = (
+        overdue_loans_query()
+        .join(Book, Book.id == Loan.book_id)
+        .filter(~already_queued)
+        .with_entities(
+            literal('overdue'),
+            literal('Book "') + Book.name + literal('" was due on ') + cast(Loan.return_date, String),
+            literal('new'),
+            literal('high'),
+            Loan.cust_id,
+            Loan.id,
+            literal('pending'),
+            literal(0),
+        )
+    )
+    queued = db.session.execute(
+        insert(Notification).from_select(
+            ['type', 'content', 'status', 'priority', 'recipient_id', 'loan_id', 'delivery_status', 'attempts'],
+            notices.statement,
+        )
+    ).rowcount
+    db.session.commit()
+    return queued
+
+
+# Claim up to `limit` due notifications for this worker. Claimed rows get
+# next_attempt_at pushed out by MAIL_CLAIM_TIMEOUT, so a crashed worker's
+# batch is picked up again later instead of being lost.
+def _claim_batch(limit, now):
+    begin_write()
+    rows = db.session.execute(
+        select(Notification.id, Notification.type, Notification.content, Notification.attempts, Customer.email)
+        .join(Customer, Customer.id == Notification.recipient_id)
+        .where(
+            Notification.delivery_status == 'pending',
+            (Notification.next_attempt_at.is_(None)) | (Notification.next_attempt_at <= now),
+        )
+        .order_by(Notification.id)
+        .limit(limit)
+    ).all()
+    if rows:
+        lease = now + timedelta(seconds=current_app.config['MAIL_CLAIM_TIMEOUT'])
+        db.session.execute(
+            update(Notification)
+            .where(Notification.id.in_([row.id for row in rows]))
+            .values(next_attempt_at=lease)
+            .execution_options(synchronize_session=False)
+        )
+    db.session.commit()
+    return rows
+
+
+# Send one chunk over a single SMTP connection
+def _send_chunk(app, mail, rows):
+    sent, failed = [], []
+    with app.app_context():
+        try:
+            with mail.connect() as connection:
+                for row in rows:
+                    message = Message(
+                        subject=SUBJECTS.get(row.type, 'Library notification'),
+                        recipients=[row.email],
+                        body=row.content,
+                    )
+                    try:
+                        connection.send(message)
+                        sent.append(row)
+                    except Exception as e:
+                        failed.append((row, str(e)))
+        except Exception as e:
+            done = {row.id for row in sent} | {row.id for row, _ in failed}
+            failed.extend((row, str(e)) for row in rows if row.id not in done)
+    return sent, failed
+
+
+def _record_results(sent, failed, now):
+    config = current_app.config
+    if sent:
+        db.session.execute(
+            update(Notification),
+            [{'id': row.id, 'delivery_status': 'sent', 'sent_at': now, 'next_attempt_at': None} for row in sent],
+        )
+    if failed:
+        updates = []
+        for row, error in failed:
+            attempts = row.attempts + 1
+            give_up = attempts >= config['MAIL_MAX_ATTEMPTS']
+            updates.append({
+                'id': row.id,
+                'attempts': attempts,
+                'last_error': error[:500],
+                'delivery_status': 'failed' if give_up else 'pending',
+                'next_attempt_at': None if give_up else now + timedelta(
+                    seconds=config['MAIL_RETRY_BACKOFF'] * 2 ** (attempts - 1)
+                ),
+            })
+        db.session.execute(update(Notification), updates)
+    db.session.commit()
+
+
+# Drain pending notifications in batches. Each batch is split across a
+# bounded thread pool and every thread reuses one SMTP connection for its
+# chunk. Returns counts and throughput for the run.
+def dispatch_pending(mail, batch_size=None, workers=None, max_batches=None):
+    app = current_app._get_current_object()
+    batch_size = batch_size or app.config['MAIL_DISPATCH_BATCH_SIZE']
+    workers = workers or app.config['MAIL_DISPATCH_WORKERS']
+    stats = {'sent': 0, 'failed': 0, 'batches': 0}
+    started = time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while max_batches is None or stats['batches'] < max_batches:
+            rows = _claim_batch(batch_size, datetime.utcnow())
+            if not rows:
+                break
+            chunks = [rows[i::workers] for i in range(min(workers, len(rows)))]
+            sent, failed = [], []
+            for chunk_sent, chunk_failed in pool.map(lambda chunk: _send_chunk(app, mail, chunk), chunks):
+                sent.extend(chunk_sent)
+                failed.extend(chunk_failed)
+            _record_results(sent, failed, datetime.utcnow())
+            stats['sent'] += len(sent)
+            stats['failed'] += len(failed)
+            stats['batches'] += 1
+
+    elapsed = time.perf_counter() - started
+    stats['seconds'] = round(elapsed, 3)
+    stats['mails_per_sec'] = round(stats['sent'] / elapsed, 1) if elapsed else 0.0
+    return stats
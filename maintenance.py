@@ -0,0 +1,107 @@
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import String, cast, delete, exists, insert, literal, or_, select, update
+from circulation import roll_overdue
+from models import db, Book, Loan, Notification, OPEN_LOAN_STATUSES
+
+# Periodic circulation upkeep, run by scheduler.py. Each job works in
+# chunks of MAINTENANCE_CHUNK_SIZE rows, one short write transaction per
+# chunk, so requests never wait long on the SQLite write lock. Jobs return
+# the number of rows they changed.
+
+
+# Move the overdue set forward, then mark the ongoing loans past their
+# return date 'overdue'. Each chunk is a range of the ('ongoing', ...) keys
+# of the partial index on open loans, and a marked loan moves out of that
+# range, so no chunk rescans the last one.
+def mark_overdue_loans(today=None):
+    today = today or datetime.utcnow().date()
+    chunk_size = current_app.config['MAINTENANCE_CHUNK_SIZE']
+    roll_overdue(today)
+    marked = 0
+    while True:
+        due = (
+            select(Loan.id)
+            .where(Loan.status.in_(OPEN_LOAN_STATUSES), Loan.status == 'ongoing', Loan.return_date < today)
+            .limit(chunk_size)
+        )
+        count = db.session.execute(
+            update(Loan)
+            .where(Loan.id.in_(due))
+            .values(status='overdue')
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        db.session.commit()
+        marked += count
+        if count < chunk_size:
+            return marked
+
+
+# Queue a 'due_soon' notification for every ongoing loan due within
+# DUE_SOON_DAYS that does not have one yet
+def queue_due_soon_reminders(today=None):
+    today = today or datetime.utcnow().date()
+    config = current_app.config
+    chunk_size = config['MAINTENANCE_CHUNK_SIZE']
+    already_queued = exists().where(Notification.loan_id == Loan.id, Notification.type == 'due_soon')
+    reminders = (
+        select(
+            literal('due_soon'),
+            literal('Book "') + Book.name + literal('" is due on ') + cast(Loan.return_date, String),
+            literal('new'),
+            literal('medium'),
+            Loan.cust_id,
+            Loan.id,
+            literal('pending'),
+            literal(0),
+        )
+        .select_from(Loan)
+        .join(Book, Book.id == Loan.book_id)
+        .where(
+            Loan.status.in_(OPEN_LOAN_STATUSES),
+            Loan.status == 'ongoing',
+            Loan.return_date >= today,
+            Loan.return_date <= today + timedelta(days=config['DUE_SOON_DAYS']),
+            ~already_queued,
+        )
+        .limit(chunk_size)
+    )
+    queued = 0
+    while True:
+        count = db.session.execute(
+            insert(Notification).from_select(
+                ['type', 'content', 'status', 'priority', 'recipient_id', 'loan_id', 'delivery_status', 'attempts'],
+                reminders,
+            )
+        ).rowcount
+        db.session.commit()
+        queued += count
+        if count < chunk_size:
+            return queued
+
+
+# Delete read notifications older than NOTIFICATION_RETENTION_DAYS, except
+# those still waiting to be mailed. Walks the table once in id order.
+def prune_read_notifications(now=None):
+    now = now or datetime.utcnow()
+    chunk_size = current_app.config['MAINTENANCE_CHUNK_SIZE']
+    cutoff = now - timedelta(days=current_app.config['NOTIFICATION_RETENTION_DAYS'])
+    prunable = (
+        Notification.status == 'read',
+        Notification.created_at < cutoff,
+        or_(Notification.delivery_status.is_(None), Notification.delivery_status != 'pending'),
+    )
+    pruned = 0
+    after = 0
+    while True:
+        ids = db.session.scalars(
+            select(Notification.id).where(Notification.id > after, *prunable).order_by(Notification.id).limit(chunk_size)
+        ).all()
+        if not ids:
+            db.session.commit()
+            return pruned
+        pruned += db.session.execute(
+            delete(Notification).where(Notification.id.in_(ids), *prunable).execution_options(synchronize_session=False)
+        ).rowcount
+        db.session.commit()
+        after = ids[-1]
@@ -1,10 +1,31 @@
 from datetime import datetime
+from flask import current_app
 from flask_login import UserMixin
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session
+from sqlalchemy import Select, event, text
 
 
+# With a 'replica' bind configured, sessions flagged by database.use_replica()
+# run their SELECTs there. Anything else (and every statement after the
+# session's first write, so a request reads its own writes) goes to the primary.
+# A session configured with an explicit bind (the test suite joins each test
+# to one outer transaction that way) uses it for everything.
+class RoutingSession(Session):
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and self.bind is not None:
+            return self.bind
+        if bind is None and self.info.get('use_replica'):
+            if self._flushing or (clause is not None and not isinstance(clause, Select)):
+                self.info['wrote'] = True
+            elif clause is not None and not self.info.get('wrote'):
+                replica = self._db.engines.get('replica')
+                if replica is not None:
+                    return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
 
-db = SQLAlchemy()
+
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 # Book model
 class Book(db.Model):
@@ -17,6 +38,20 @@ class Book(db.Model):
     active = db.Column(db.Boolean, default=True)
     available_copies = db.Column(db.Integer, nullable=False, default=1)
     description = db.Column(db.Text, nullable=True)
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')  # Bumped by a trigger on every update
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, server_default=db.func.current_timestamp())
+
+    __table_args__ = (
+        db.Index('ix_book_author_year', 'author', 'year_published'),
+        db.Index('ix_book_category_year', 'category', 'year_published'),
+        db.Index('ix_book_year_published', 'year_published'),
+    )
+
+    # Columns of to_dict(), in order, and the formatting applied to them when
+    # list endpoints serialize projected rows instead of ORM objects
+    serialized_fields = ('id', 'name', 'author', 'year_published', 'book_type', 'category', 'active',
+                         'available_copies', 'description', 'version', 'updated_at')
+    field_formatters = {'updated_at': str}
 
     def to_dict(self):
         return {
@@ -28,9 +63,54 @@ class Book(db.Model):
             "category": self.category,
             "active": self.active,
             "available_copies": self.available_copies,
-            "description": self.description
+            "description": self.description,
+            "version": self.version,
+            "updated_at": str(self.updated_at)
         }
 
+# Full-text index over active books' name and description (SQLite FTS5).
+# Triggers keep it in sync with every insert/update/deactivation of a book.
+BOOK_FTS_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS book_fts USING fts5(name, description)",
+    """CREATE TRIGGER IF NOT EXISTS book_fts_insert AFTER INSERT ON book WHEN new.active
+       BEGIN
+           INSERT INTO book_fts(rowid, name, description) VALUES (new.id, new.name, new.description);
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS book_fts_update AFTER UPDATE OF name, description, active ON book
+       BEGIN
+           DELETE FROM book_fts WHERE rowid = old.id;
+           INSERT INTO book_fts(rowid, name, description)
+               SELECT new.id, new.name, new.description WHERE new.active;
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS book_fts_delete AFTER DELETE ON book
+       BEGIN
+           DELETE FROM book_fts WHERE rowid = old.id;
+       END""",
+]
+
+
+@event.listens_for(db.metadata, 'after_create')
+def create_book_fts(target, connection, **kw):
+    if connection.dialect.name != 'sqlite':
+        return
+    exists = connection.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'book_fts'")
+    ).first()
+    for statement in BOOK_FTS_DDL:
+        connection.execute(text(statement))
+    if not exists:
+        # Backfill books created before the index existed
+        connection.execute(text(
+            "INSERT INTO book_fts(rowid, name, description) "
+            "SELECT id, name, description FROM book WHERE active"
+        ))
+
+
+@event.listens_for(db.metadata, 'before_drop')
+def drop_book_fts(target, connection, **kw):
+    if connection.dialect.name == 'sqlite':
+        connection.execute(text("DROP TABLE IF EXISTS book_fts"))
+
 # Customer model
 class Customer(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -40,13 +120,20 @@ class Customer(db.Model):
     date_of_birth = db.Column(db.Date, nullable=False)
     email = db.Column(db.String(100), unique=True, nullable=False)
     phone = db.Column(db.String(15), nullable=False)
-    status = db.Column(db.String(20), nullable=False, default='active')
+    status = db.Column(db.String(20), nullable=False, default='active', index=True)
     registration_date = db.Column(db.DateTime, default=db.func.current_timestamp())
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')  # Bumped by a trigger on every update
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, server_default=db.func.current_timestamp())
+
+    # Columns of to_dict(), in order, and the formatting applied to them when
+    # list endpoints serialize projected rows instead of ORM objects
+    serialized_fields = ('id', 'name', 'city', 'age', 'date_of_birth', 'email', 'phone', 'status',
+                         'registration_date', 'version', 'updated_at')
+    field_formatters = {'date_of_birth': str, 'registration_date': str, 'updated_at': str}
 
     def can_borrow(self):
-        from app import MAX_LOANS_PER_CUSTOMER
         active_loans = Loan.query.filter_by(cust_id=self.id, actual_return_date=None).count()
-        return active_loans < MAX_LOANS_PER_CUSTOMER
+        return active_loans < current_app.config['MAX_LOANS_PER_CUSTOMER']
 
     def to_dict(self):
         return {
@@ -58,7 +145,9 @@ class Customer(db.Model):
             "email": self.email,
             "phone": self.phone,
             "status": self.status,
-            "registration_date": str(self.registration_date)
+            "registration_date": str(self.registration_date),
+            "version": self.version,
+            "updated_at": str(self.updated_at)
         }
 
 # Loan model
@@ -70,10 +159,35 @@ class Loan(db.Model):
     return_date = db.Column(db.Date, nullable=False)
     actual_return_date = db.Column(db.Date, nullable=True)
     status = db.Column(db.String(20), nullable=False, default='ongoing')
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')  # Bumped by a trigger on every update
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, server_default=db.func.current_timestamp())
+
+    __table_args__ = (
+        db.Index('ix_loan_cust_open', 'cust_id', 'actual_return_date'),
+        db.Index('ix_loan_loan_date', 'loan_date'),
+        # Open loans by due date. SQLite only uses a partial index when the
+        # query repeats its predicate, so queries filter on OPEN_LOAN_STATUSES.
+        db.Index(
+            'ix_loan_open_return_date', 'status', 'return_date',
+            sqlite_where=text("status IN ('ongoing', 'overdue')"),
+            postgresql_where=text("status IN ('ongoing', 'overdue')"),
+        ),
+    )
 
     customer = db.relationship('Customer', backref=db.backref('loans', lazy=True))
     book = db.relationship('Book', backref=db.backref('loans', lazy=True))
 
+    # Columns of to_dict(), in order, and the formatting applied to them when
+    # list endpoints serialize projected rows instead of ORM objects
+    serialized_fields = ('id', 'cust_id', 'book_id', 'loan_date', 'return_date', 'actual_return_date', 'status',
+                         'version', 'updated_at')
+    field_formatters = {
+        'loan_date': str,
+        'return_date': str,
+        'actual_return_date': lambda value: str(value) if value else None,
+        'updated_at': str,
+    }
+
     def is_overdue(self):
         if self.actual_return_date is None and self.return_date < datetime.utcnow().date():
             return True
@@ -87,9 +201,203 @@ class Loan(db.Model):
             "loan_date": str(self.loan_date),
             "return_date": str(self.return_date),
             "actual_return_date": str(self.actual_return_date) if self.actual_return_date else None,
-            "status": self.status
+            "status": self.status,
+            "version": self.version,
+            "updated_at": str(self.updated_at)
+        }
+
+# A customer waiting for a copy of a book. Each book's queue is served in id
+# order; a returned copy goes to the head of the queue (status 'ready')
+# instead of back to available_copies, until it is checked out or cancelled.
+class Hold(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    book_id = db.Column(db.Integer, db.ForeignKey('book.id'), nullable=False)
+    cust_id = db.Column(db.Integer, db.ForeignKey('customer.id'), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='waiting')  # waiting, ready, fulfilled or cancelled
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    ready_at = db.Column(db.DateTime, nullable=True)
+
+    __table_args__ = (
+        # Head of a book's queue: one index seek, however long the queue
+        db.Index(
+            'ix_hold_queue', 'book_id', 'id',
+            sqlite_where=text("status = 'waiting'"),
+            postgresql_where=text("status = 'waiting'"),
+        ),
+        db.Index('ix_hold_cust_book', 'cust_id', 'book_id', 'status'),
+    )
+
+    serialized_fields = ('id', 'book_id', 'cust_id', 'status', 'created_at', 'ready_at')
+    field_formatters = {
+        'created_at': str,
+        'ready_at': lambda value: str(value) if value else None,
+    }
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "book_id": self.book_id,
+            "cust_id": self.cust_id,
+            "status": self.status,
+            "created_at": str(self.created_at),
+            "ready_at": str(self.ready_at) if self.ready_at else None,
         }
 
+# Ongoing loans whose return_date was before overdue_state.as_of.
+# SQLite triggers keep it in step with every write to loan; roll_overdue()
+# moves as_of forward once a day and adds the loans that fell due since.
+class OverdueLoan(db.Model):
+    loan_id = db.Column(db.Integer, db.ForeignKey('loan.id'), primary_key=True)
+    cust_id = db.Column(db.Integer, nullable=False)
+    book_id = db.Column(db.Integer, nullable=False)
+    return_date = db.Column(db.Date, nullable=False, index=True)
+
+
+class OverdueState(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    as_of = db.Column(db.Date, nullable=False)
+
+
+# Open loans: 'overdue' is set by the mark-overdue maintenance job
+OPEN_LOAN_STATUSES = ('ongoing', 'overdue')
+
+OVERDUE_CONDITION = (
+    "new.status IN ('ongoing', 'overdue') AND new.return_date < (SELECT as_of FROM overdue_state WHERE id = 1)"
+)
+
+OVERDUE_DDL = [
+    f"""CREATE TRIGGER IF NOT EXISTS overdue_loan_insert AFTER INSERT ON loan WHEN {OVERDUE_CONDITION}
+       BEGIN
+           INSERT OR REPLACE INTO overdue_loan(loan_id, cust_id, book_id, return_date)
+               VALUES (new.id, new.cust_id, new.book_id, new.return_date);
+       END""",
+    f"""CREATE TRIGGER IF NOT EXISTS overdue_loan_update AFTER UPDATE OF status, return_date, cust_id, book_id ON loan
+       BEGIN
+           DELETE FROM overdue_loan WHERE loan_id = old.id;
+           INSERT INTO overdue_loan(loan_id, cust_id, book_id, return_date)
+               SELECT new.id, new.cust_id, new.book_id, new.return_date WHERE {OVERDUE_CONDITION};
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS overdue_loan_delete AFTER DELETE ON loan
+       BEGIN
+           DELETE FROM overdue_loan WHERE loan_id = old.id;
+       END""",
+]
+
+
+@event.listens_for(db.metadata, 'after_create')
+def create_overdue_triggers(target, connection, **kw):
+    if connection.dialect.name != 'sqlite':
+        return
+    # Databases whose triggers and open-loan index predate the 'overdue' status
+    for trigger in ('overdue_loan_insert', 'overdue_loan_update'):
+        connection.execute(text(f"DROP TRIGGER IF EXISTS {trigger}"))
+    connection.execute(text("DROP INDEX IF EXISTS ix_loan_ongoing_return_date"))
+    next(index for index in Loan.__table__.indexes if index.name == 'ix_loan_open_return_date').create(connection, checkfirst=True)
+    for statement in OVERDUE_DDL:
+        connection.execute(text(statement))
+    if connection.execute(text("SELECT 1 FROM overdue_state WHERE id = 1")).first() is None:
+        connection.execute(text("INSERT INTO overdue_state(id, as_of) VALUES (1, date('now'))"))
+        connection.execute(text(
+            "INSERT OR REPLACE INTO overdue_loan(loan_id, cust_id, book_id, return_date) "
+            "SELECT id, cust_id, book_id, return_date FROM loan "
+            "WHERE status IN ('ongoing', 'overdue') AND return_date < date('now')"
+        ))
+
+# Daily circulation rollups behind the /stats endpoints, keyed by loan_date.
+# Triggers record which days a write to loan (or a loan falling due into
+# overdue_loan) touched in stats_dirty_day and stats.refresh_summaries()
+# recomputes just those days.
+class BookLoanDay(db.Model):
+    day = db.Column(db.Date, primary_key=True)
+    book_id = db.Column(db.Integer, primary_key=True)
+    loans = db.Column(db.Integer, nullable=False)
+
+
+# All-time loans per book, so the unbounded top titles list is an index read
+class BookLoanTotal(db.Model):
+    book_id = db.Column(db.Integer, primary_key=True)
+    loans = db.Column(db.Integer, nullable=False, index=True)
+
+
+class CategoryLoanDay(db.Model):
+    day = db.Column(db.Date, primary_key=True)
+    category = db.Column(db.String(50), primary_key=True)
+    loans = db.Column(db.Integer, nullable=False)
+
+
+class CityLoanDay(db.Model):
+    day = db.Column(db.Date, primary_key=True)
+    city = db.Column(db.String(100), primary_key=True)
+    loans = db.Column(db.Integer, nullable=False)
+    returned = db.Column(db.Integer, nullable=False)
+    returned_late = db.Column(db.Integer, nullable=False)
+    open_overdue = db.Column(db.Integer, nullable=False)  # Still out and in overdue_loan
+    loan_days = db.Column(db.Integer, nullable=False)  # Sum over returned loans
+
+
+class StatsDirtyDay(db.Model):
+    day = db.Column(db.Date, primary_key=True)
+
+
+STATS_DDL = [
+    """CREATE TRIGGER IF NOT EXISTS stats_dirty_insert AFTER INSERT ON loan
+       BEGIN
+           INSERT OR IGNORE INTO stats_dirty_day(day) VALUES (new.loan_date);
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS stats_dirty_update
+       AFTER UPDATE OF loan_date, return_date, actual_return_date, cust_id, book_id ON loan
+       BEGIN
+           INSERT OR IGNORE INTO stats_dirty_day(day) VALUES (old.loan_date);
+           INSERT OR IGNORE INTO stats_dirty_day(day) VALUES (new.loan_date);
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS stats_dirty_delete AFTER DELETE ON loan
+       BEGIN
+           INSERT OR IGNORE INTO stats_dirty_day(day) VALUES (old.loan_date);
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS stats_dirty_overdue AFTER INSERT ON overdue_loan
+       BEGIN
+           INSERT OR IGNORE INTO stats_dirty_day(day) SELECT loan_date FROM loan WHERE id = new.loan_id;
+       END""",
+]
+
+
+@event.listens_for(db.metadata, 'after_create')
+def create_stats_triggers(target, connection, **kw):
+    if connection.dialect.name != 'sqlite':
+        return
+    for statement in STATS_DDL:
+        connection.execute(text(statement))
+    if connection.execute(text("SELECT 1 FROM city_loan_day LIMIT 1")).first() is None:
+        # Loans that predate the rollups get summarised on the first refresh
+        connection.execute(text("INSERT OR IGNORE INTO stats_dirty_day(day) SELECT DISTINCT loan_date FROM loan"))
+
+# Progress of an interrupted `flask import-data` run, one row per source file
+class ImportCheckpoint(db.Model):
+    source = db.Column(db.String(500), primary_key=True)
+    kind = db.Column(db.String(20), nullable=False)
+    records = db.Column(db.Integer, nullable=False)
+
+# Last row written by an incremental `flask export-data --watermark` run,
+# and the modification time the next run picks up from
+class ExportWatermark(db.Model):
+    name = db.Column(db.String(100), primary_key=True)
+    kind = db.Column(db.String(20), nullable=False)
+    last_id = db.Column(db.Integer, nullable=False)
+    exported_at = db.Column(db.DateTime, nullable=False)
+    updated_since = db.Column(db.DateTime)  # The next run exports rows with updated_at at or after this
+
+# Maintenance jobs run by scheduler.py: when each is next due, how its last
+# run went, and which worker holds it (until lease_expires_at) while running
+class ScheduledJob(db.Model):
+    name = db.Column(db.String(50), primary_key=True)
+    schedule = db.Column(db.String(100), nullable=False)
+    next_run_at = db.Column(db.DateTime, nullable=False)
+    last_run_at = db.Column(db.DateTime, nullable=True)
+    last_status = db.Column(db.String(20), nullable=True)  # ok or failed
+    last_result = db.Column(db.Text, nullable=True)  # The job's count, or the error
+    lease_owner = db.Column(db.String(100), nullable=True)
+    lease_expires_at = db.Column(db.DateTime, nullable=True)
+
 # Admin model
 class Admin(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -109,4 +417,126 @@ class Notification(db.Model):
     recipient_id = db.Column(db.Integer, nullable=True)
     created_at = db.Column(db.DateTime, default=db.func.current_timestamp())
 
-        
\ No newline at end of file
+    # Email delivery, for notifications queued to be mailed to the recipient
+    loan_id = db.Column(db.Integer, nullable=True, index=True)
+    delivery_status = db.Column(db.String(20), nullable=True)  # pending, sent or failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=True)
+    sent_at = db.Column(db.DateTime, nullable=True)
+    last_error = db.Column(db.Text, nullable=True)
+
+    __table_args__ = (
+        db.Index('ix_notification_delivery', 'delivery_status', 'next_attempt_at'),
+        # Inbox pages are newest first by id: one index per form of the
+        # query, with and without a status filter, so neither needs a sort
+        db.Index('ix_notification_inbox_recent', 'recipient_id', 'id'),
+        db.Index('ix_notification_inbox_status', 'recipient_id', 'status', 'id'),
+    )
+
+    # Columns of to_dict(), for list endpoints serializing projected rows
+    serialized_fields = ('id', 'type', 'content', 'status', 'priority', 'recipient_id', 'created_at')
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "type": self.type,
+            "content": self.content,
+            "status": self.status,
+            "priority": self.priority,
+            "recipient_id": self.recipient_id,
+            "created_at": self.created_at,
+        }
+
+
+# Unread ('new') notifications per recipient, kept current by triggers so
+# inbox badges never need a COUNT(*) over the notification table
+class InboxCounter(db.Model):
+    recipient_id = db.Column(db.Integer, primary_key=True)
+    unread = db.Column(db.Integer, nullable=False, default=0)
+
+
+INBOX_COUNTER_DDL = [
+    """CREATE TRIGGER IF NOT EXISTS inbox_counter_insert AFTER INSERT ON notification
+       WHEN new.status = 'new' AND new.recipient_id IS NOT NULL
+       BEGIN
+           INSERT INTO inbox_counter(recipient_id, unread) VALUES (new.recipient_id, 1)
+               ON CONFLICT(recipient_id) DO UPDATE SET unread = unread + 1;
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS inbox_counter_update AFTER UPDATE OF status, recipient_id ON notification
+       BEGIN
+           UPDATE inbox_counter SET unread = unread - 1
+               WHERE recipient_id = old.recipient_id AND old.status = 'new';
+           INSERT INTO inbox_counter(recipient_id, unread)
+               SELECT new.recipient_id, 1 WHERE new.status = 'new' AND new.recipient_id IS NOT NULL
+               ON CONFLICT(recipient_id) DO UPDATE SET unread = unread + 1;
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS inbox_counter_delete AFTER DELETE ON notification
+       WHEN old.status = 'new'
+       BEGIN
+           UPDATE inbox_counter SET unread = unread - 1 WHERE recipient_id = old.recipient_id;
+       END""",
+]
+
+
+@event.listens_for(db.metadata, 'after_create')
+def create_inbox_counter_triggers(target, connection, **kw):
+    if connection.dialect.name != 'sqlite':
+        return
+    # Databases whose inbox index was ordered by created_at
+    connection.execute(text("DROP INDEX IF EXISTS ix_notification_inbox"))
+    for index in Notification.__table__.indexes:
+        if index.name.startswith('ix_notification_inbox_'):
+            index.create(connection, checkfirst=True)
+    for statement in INBOX_COUNTER_DDL:
+        connection.execute(text(statement))
+    if connection.execute(text("SELECT 1 FROM inbox_counter LIMIT 1")).first() is None:
+        connection.execute(text(
+            "INSERT INTO inbox_counter(recipient_id, unread) "
+            "SELECT recipient_id, count(*) FROM notification "
+            "WHERE status = 'new' AND recipient_id IS NOT NULL GROUP BY recipient_id"
+        ))
+
+
+# Writes per table, so list responses can be revalidated (ETag /
+# Last-Modified) without running the list query. Kept by the triggers in
+# VERSION_DDL, which also bump the per-row version and updated_at.
+class ChangeCounter(db.Model):
+    table_name = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, nullable=False)
+    updated_at = db.Column(db.DateTime, nullable=False)
+
+
+VERSIONED_TABLES = ('book', 'customer', 'loan')
+
+def _version_ddl(table):
+    counter = f"""CREATE TRIGGER IF NOT EXISTS {table}_change_{{name}} AFTER {{event}} ON {table}
+       BEGIN
+           INSERT INTO change_counter(table_name, version, updated_at) VALUES ('{table}', 1, CURRENT_TIMESTAMP)
+               ON CONFLICT(table_name) DO UPDATE SET version = version + 1, updated_at = excluded.updated_at;
+       END"""
+    return [
+        f"""CREATE TRIGGER IF NOT EXISTS {table}_row_version AFTER UPDATE ON {table}
+           WHEN new.version = old.version
+           BEGIN
+               UPDATE {table} SET version = old.version + 1, updated_at = CURRENT_TIMESTAMP WHERE id = new.id;
+           END""",
+    ] + [counter.format(event=event, name=event.lower()) for event in ('INSERT', 'UPDATE', 'DELETE')]
+
+
+VERSION_DDL = [statement for table in VERSIONED_TABLES for statement in _version_ddl(table)]
+
+
+@event.listens_for(db.metadata, 'after_create')
+def create_version_triggers(target, connection, **kw):
+    if connection.dialect.name != 'sqlite':
+        return
+    # Databases created before the version columns existed
+    for table in VERSIONED_TABLES:
+        columns = {row[1] for row in connection.execute(text(f"PRAGMA table_info({table})"))}
+        if 'version' not in columns:
+            connection.execute(text(f"ALTER TABLE {table} ADD COLUMN version INTEGER NOT NULL DEFAULT 1"))
+        if 'updated_at' not in columns:
+            connection.execute(text(f"ALTER TABLE {table} ADD COLUMN updated_at DATETIME"))
+            connection.execute(text(f"UPDATE {table} SET updated_at = CURRENT_TIMESTAMP"))
+    for statement in VERSION_DDL:
+        connection.execute(text(statement))
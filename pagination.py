@@ -0,0 +1,159 @@
+from flask import Response, current_app, jsonify, request, stream_with_context
+from extensions import perf
+
+
+class PaginationError(ValueError):
+    pass
+
+
+# ?limit= as a page size: a positive integer, capped at MAX_PAGE_SIZE
+def parse_limit(default=None):
+    limit = request.args.get('limit', type=int)
+    if limit is None:
+        if 'limit' in request.args:
+            raise PaginationError('limit must be an integer')
+        return default
+    if limit < 1:
+        raise PaginationError('limit must be positive')
+    return min(limit, current_app.config['MAX_PAGE_SIZE'])
+
+
+# Read limit/after/fields/format from the query string
+def parse_list_args(model):
+    args = request.args
+    after = args.get('after', type=int)
+    if (args.get('limit', type=int) is None and 'limit' in args) or (after is None and 'after' in args):
+        raise PaginationError('limit and after must be integers')
+    limit = parse_limit()
+
+    fields = None
+    if args.get('fields'):
+        fields = [f.strip() for f in args['fields'].split(',') if f.strip()]
+        columns = model.__table__.columns.keys()
+        unknown = [f for f in fields if f not in columns]
+        if unknown:
+            raise PaginationError(f"Unknown field(s): {', '.join(unknown)}")
+
+    output = args.get('format', 'json')
+    if output not in ('json', 'ndjson'):
+        raise PaginationError('format must be json or ndjson')
+    return limit, after, fields, output
+
+
+# Turn projected rows into the to_dict() shape without building ORM objects.
+# Rows are read by position, so they must start with the `fields` columns in
+# that order (trailing extra columns are ignored). With fields=None, ORM
+# objects are passed through their to_dict().
+def row_formatter(model, fields):
+    if fields is None:
+        return lambda obj: obj.to_dict()
+    keys = tuple(fields)
+    formatters = getattr(model, 'field_formatters', {})
+    converted = [(i, formatters[f]) for i, f in enumerate(keys) if f in formatters]
+    if not converted:
+        return lambda row: dict(zip(keys, row))
+
+    def fmt(row):
+        values = list(row)
+        for i, convert in converted:
+            values[i] = convert(values[i])
+        return dict(zip(keys, values))
+    return fmt
+
+
+def projection(model, fields):
+    columns = [getattr(model, f) for f in fields]
+    if 'id' not in fields:
+        columns.append(model.id)  # For the keyset cursor
+    return columns
+
+
+# Walk a query in id order, one bounded batch at a time
+def _keyset_batches(query, model, fields, after, batch_size, descending=False):
+    if fields is not None:
+        query = query.with_entities(*projection(model, fields))
+    query = query.order_by(model.id.desc() if descending else model.id)
+    while True:
+        batch_query = query
+        if after is not None:
+            batch_query = batch_query.filter(model.id < after if descending else model.id > after)
+        batch = batch_query.limit(batch_size).all()
+        if not batch:
+            return
+        yield batch
+        if len(batch) < batch_size:
+            return
+        after = batch[-1].id
+
+
+def _stream_json_array(items, dumps):
+    yield '['
+    first = True
+    for item in items:
+        yield ('' if first else ',') + dumps(item)
+        first = False
+    yield ']\n'
+
+
+def _stream_ndjson(items, dumps):
+    for item in items:
+        yield dumps(item) + '\n'
+
+
+# Close the streamed query's session once the body is sent or the client
+# goes away. The request's teardown has already closed it by then, and the
+# batches read after that would otherwise keep its connection checked out.
+def _closing(body, session):
+    try:
+        yield from body
+    finally:
+        session.close()
+
+
+def _stream(items, output, session=None):
+    dumps = current_app.json.dumps
+    if output == 'ndjson':
+        body = _stream_ndjson(items, dumps)
+        mimetype = 'application/x-ndjson'
+    else:
+        body = _stream_json_array(items, dumps)
+        mimetype = 'application/json'
+    if session is not None:
+        body = _closing(body, session)
+    return Response(stream_with_context(body), mimetype=mimetype)
+
+
+# Keyset-paginated list response shared by the list endpoints.
+# Without `limit` the whole result set is streamed in batches; with `limit`
+# a single page is returned and the cursor for the next one is sent in the
+# X-Next-Cursor header. Queries that already select a projection (with an
+# `id` column) pass their own `formatter` and do not support fields=.
+# Models with `serialized_fields` are always read as projected rows.
+# `descending` lists newest first, with `after` counting down.
+def list_response(query, model, formatter=None, descending=False):
+    try:
+        limit, after, fields, output = parse_list_args(model)
+    except PaginationError as e:
+        return jsonify({'error': str(e)}), 400
+
+    if formatter is not None:
+        fields = None
+    elif fields is None:
+        fields = getattr(model, 'serialized_fields', None)
+    fmt = perf.timed(formatter or row_formatter(model, fields))
+    if limit is None:
+        batch_size = current_app.config['STREAM_BATCH_SIZE']
+        batches = _keyset_batches(query, model, fields, after, batch_size, descending)
+        return _stream((fmt(row) for batch in batches for row in batch), output, query.session)
+
+    page = next(_keyset_batches(query, model, fields, after, limit + 1, descending), [])
+    has_more = len(page) > limit
+    page = page[:limit]
+    items = [fmt(row) for row in page]
+    if output == 'ndjson':
+        response = _stream(items, output)
+    else:
+        response = jsonify(items)
+    if has_more:
+        response.headers['X-Next-Cursor'] = str(page[-1].id)
+    return response
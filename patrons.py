@@ -0,0 +1,92 @@
+from flask import current_app
+from sqlalchemy import bindparam, select, update
+from circulation import begin_write, insert_returning
+from importer import IMPORT_SCHEMAS, convert_record
+from models import db, Customer
+
+CUSTOMER_STATUSES = ('active', 'inactive')
+
+
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _rejected(index, reason):
+    return {'index': index, 'status': 'rejected', 'reason': reason}
+
+
+# Set the status of many customers in one transaction, with one
+# UPDATE ... WHERE id IN (...) per chunk of ids; no rows are loaded and
+# customers already in that status are not rewritten. Returns the ids that
+# changed.
+def set_customer_status(customer_ids, status):
+    chunk_size = current_app.config['BULK_UPDATE_CHUNK_SIZE']
+    changed = []
+    for chunk in _chunks(sorted(set(customer_ids)), chunk_size):
+        changed.extend(db.session.scalars(
+            update(Customer)
+            .where(Customer.id.in_(chunk), Customer.status != status)
+            .values(status=status)
+            .returning(Customer.id),
+            execution_options={'synchronize_session': False},
+        ))
+    db.session.commit()
+    return changed
+
+
+# Create many customers in one transaction, with a result per item. Items
+# are validated like imported records; existing emails are found with one
+# IN (...) query, new customers go in one multi-row INSERT and, with
+# `upsert`, existing ones are updated by one executemany UPDATE (status is
+# kept unless the item sets it). Otherwise an existing email is rejected.
+def bulk_upsert_customers(items, upsert=False):
+    schema = IMPORT_SCHEMAS['customers'][1]
+    results = [None] * len(items)
+    parsed = {}
+    for index, item in enumerate(items):
+        try:
+            row = convert_record(item, schema)
+        except (AttributeError, TypeError, ValueError) as e:
+            results[index] = _rejected(index, f'Invalid customer: {e}')
+            continue
+        if row['status'] not in CUSTOMER_STATUSES:
+            results[index] = _rejected(index, f"Invalid customer: invalid status: {row['status']!r}")
+        elif row['email'] in parsed:
+            results[index] = _rejected(index, 'Duplicate email in request')
+        else:
+            parsed[row['email']] = (index, row, 'status' in item)
+
+    begin_write()
+    existing = {
+        row.email: row for row in db.session.execute(
+            select(Customer.email, Customer.id, Customer.status).where(Customer.email.in_(parsed))
+        )
+    } if parsed else {}
+
+    created, updated = [], []
+    for email, (index, row, sets_status) in parsed.items():
+        current = existing.get(email)
+        if current is None:
+            created.append((index, row))
+        elif not upsert:
+            results[index] = _rejected(index, 'Email already registered')
+        else:
+            if not sets_status:
+                row['status'] = current.status
+            updated.append((index, {'customer_id': current.id, **row}))
+
+    if created:
+        ids = insert_returning(Customer, [row for _, row in created], Customer.id)
+        for (index, _), (customer_id,) in zip(created, ids):
+            results[index] = {'index': index, 'status': 'created', 'id': customer_id}
+    if updated:
+        customer = Customer.__table__
+        db.session.execute(
+            customer.update().where(customer.c.id == bindparam('customer_id')),
+            [row for _, row in updated],
+        )
+        for index, row in updated:
+            results[index] = {'index': index, 'status': 'updated', 'id': row['customer_id']}
+    db.session.commit()
+    return results, [row['customer_id'] for _, row in updated]
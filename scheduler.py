@@ -0,0 +1,228 @@
+import os
+import socket
+import threading
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import insert, or_, select, update
+from maintenance import mark_overdue_loans, prune_read_notifications, queue_due_soon_reminders
+from models import db, ScheduledJob
+from stats import refresh_summaries
+
+# Job name -> function; each runs in an app context and returns a count.
+# When they run is set by JOB_SCHEDULES.
+JOBS = {
+    'mark-overdue': mark_overdue_loans,
+    'due-soon-reminders': queue_due_soon_reminders,
+    'prune-notifications': prune_read_notifications,
+    'refresh-stats': refresh_summaries,
+}
+
+
+class CronError(ValueError):
+    pass
+
+
+# (low, high) of the minute, hour, day of month, month and day of week
+# fields; day of week 0 and 7 are both Sunday
+CRON_FIELDS = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+
+
+def _cron_field(field, low, high):
+    values = set()
+    for part in field.split(','):
+        span, _, step = part.partition('/')
+        try:
+            if span == '*':
+                start, end = low, high
+            elif '-' in span:
+                start, end = (int(value) for value in span.split('-', 1))
+            else:
+                start = end = int(span)
+                if step:
+                    end = high
+            step = int(step) if step else 1
+        except ValueError:
+            raise CronError(f'Invalid cron field: {field!r}') from None
+        if not low <= start <= end <= high or step < 1:
+            raise CronError(f'Invalid cron field: {field!r}')
+        values.update(range(start, end + 1, step))
+    return values
+
+
+# A five-field cron expression: '*', lists, ranges and steps
+class CronSchedule:
+    def __init__(self, expression):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise CronError(f'Expected 5 cron fields: {expression!r}')
+        self.minutes, self.hours, self.days, self.months, weekdays = (
+            _cron_field(field, low, high) for field, (low, high) in zip(fields, CRON_FIELDS)
+        )
+        self.weekdays = {day % 7 for day in weekdays}
+        # As in cron, a restricted day of month and day of week match either
+        self.either_day = fields[2] != '*' and fields[4] != '*'
+
+    def _day_matches(self, moment):
+        day = moment.day in self.days
+        weekday = (moment.weekday() + 1) % 7 in self.weekdays
+        return (day or weekday) if self.either_day else (day and weekday)
+
+    # The first matching minute after `moment`
+    def next_after(self, moment):
+        moment = moment.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        give_up = moment + timedelta(days=4 * 366)
+        while moment < give_up:
+            if moment.month not in self.months:
+                moment = (moment.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+            elif not self._day_matches(moment):
+                moment = moment.replace(hour=0, minute=0) + timedelta(days=1)
+            elif moment.hour not in self.hours:
+                moment = moment.replace(minute=0) + timedelta(hours=1)
+            elif moment.minute not in self.minutes:
+                moment += timedelta(minutes=1)
+            else:
+                return moment
+        raise CronError('Cron expression never matches')
+
+
+# Identifies this process in job leases
+def worker_id():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+# Add rows for configured jobs that have none and reschedule the rows
+# whose cron expression changed
+def sync_jobs(now):
+    schedules = {name: expression for name, expression in current_app.config['JOB_SCHEDULES'].items() if name in JOBS}
+    stored = dict(db.session.execute(select(ScheduledJob.name, ScheduledJob.schedule)).all())
+    rows = [
+        {'name': name, 'schedule': expression, 'next_run_at': CronSchedule(expression).next_after(now)}
+        for name, expression in schedules.items()
+        if stored.get(name) != expression
+    ]
+    new = [row for row in rows if row['name'] not in stored]
+    changed = [row for row in rows if row['name'] in stored]
+    if new:
+        db.session.execute(insert(ScheduledJob).prefix_with('OR IGNORE'), new)
+    if changed:
+        db.session.execute(update(ScheduledJob), changed)
+    db.session.commit()
+    return schedules
+
+
+# Take the lease on a due job. The conditional UPDATE succeeds for exactly
+# one of the workers racing for it.
+def _claim(name, owner, now):
+    claimed = db.session.execute(
+        update(ScheduledJob)
+        .where(
+            ScheduledJob.name == name,
+            ScheduledJob.next_run_at <= now,
+            or_(ScheduledJob.lease_expires_at.is_(None), ScheduledJob.lease_expires_at <= now),
+        )
+        .values(lease_owner=owner, lease_expires_at=now + timedelta(seconds=current_app.config['JOB_LEASE_SECONDS']))
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    db.session.commit()
+    return claimed == 1
+
+
+# Record the run and schedule the next one, unless the lease ran out and
+# another worker has taken the job since
+def _finish(name, owner, schedule, started, finished, status, result):
+    db.session.execute(
+        update(ScheduledJob)
+        .where(ScheduledJob.name == name, ScheduledJob.lease_owner == owner)
+        .values(
+            last_run_at=started,
+            last_status=status,
+            last_result=result[:500],
+            next_run_at=CronSchedule(schedule).next_after(finished),
+            lease_owner=None,
+            lease_expires_at=None,
+        )
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+
+
+# Run every job that is due and not leased by another worker. Returns
+# {name: count} for the jobs this worker ran (None for a failed job). `now`
+# fixes the clock, for tests.
+def run_pending(owner=None, now=None):
+    clock = (lambda: now) if now else datetime.utcnow
+    owner = owner or worker_id()
+    started = clock()
+    schedules = sync_jobs(started)
+    due = db.session.scalars(
+        select(ScheduledJob.name)
+        .where(
+            ScheduledJob.name.in_(schedules),
+            ScheduledJob.next_run_at <= started,
+            or_(ScheduledJob.lease_expires_at.is_(None), ScheduledJob.lease_expires_at <= started),
+        )
+        .order_by(ScheduledJob.next_run_at)
+    ).all()
+    db.session.commit()
+
+    results = {}
+    for name in due:
+        started = clock()
+        if not _claim(name, owner, started):
+            continue
+        try:
+            results[name] = JOBS[name]()
+            status, result = 'ok', str(results[name])
+        except Exception as e:
+            db.session.rollback()
+            current_app.logger.exception('Job %s failed', name)
+            results[name] = None
+            status, result = 'failed', str(e)
+        _finish(name, owner, schedules[name], started, clock(), status, result)
+    return results
+
+
+# Runs the jobs from a thread in each app process when SCHEDULER_ENABLED
+# is set; `flask run-scheduler` runs the same loop as a process of its own
+class JobScheduler:
+    def __init__(self, app=None):
+        self.app = None
+        self._pid = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        for expression in app.config.get('JOB_SCHEDULES', {}).values():
+            CronSchedule(expression)
+        self.app = app
+        app.extensions['job_scheduler'] = self
+        if app.config.get('SCHEDULER_ENABLED'):
+            app.before_request(self._ensure_started)
+
+    # Started by the first request in each process: a thread started before
+    # gunicorn forks its workers would not exist in them
+    def _ensure_started(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._stop = threading.Event()
+                threading.Thread(target=self.run_forever, args=(self._stop,), name='job-scheduler', daemon=True).start()
+
+    def run_forever(self, stop):
+        owner = worker_id()
+        while not stop.is_set():
+            with self.app.app_context():
+                try:
+                    run_pending(owner)
+                except Exception:
+                    self.app.logger.exception('Scheduler pass failed')
+                finally:
+                    db.session.remove()
+            stop.wait(self.app.config['SCHEDULER_POLL_INTERVAL'])
+
+    def stop(self):
+        self._stop.set()
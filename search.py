@@ -0,0 +1,62 @@
+import re
+from sqlalchemy import column, func, literal_column, or_, table, text
+from models import db, Book
+
+
+class SearchError(ValueError):
+    pass
+
+
+book_fts = table('book_fts', column('rowid'))
+
+# Matches in the title count ten times as much as matches in the description
+BOOK_FTS_RANK = func.bm25(literal_column('book_fts'), 10.0, 1.0)
+
+
+# Turn free text into an FTS5 query: every word must match, the last one as a prefix
+def fts_expression(q):
+    terms = re.findall(r'\w+', q)
+    if not terms:
+        return None
+    return ' '.join(f'"{term}"' for term in terms[:-1]) + f' "{terms[-1]}"*'
+
+
+# Build the catalog search query from request args.
+# Returns (query, ranked); ranked queries are ordered by relevance, the
+# others by id so they can be keyset-paginated.
+def build_book_search(args):
+    query = Book.query.filter(Book.active == True)
+
+    if args.get('author'):
+        query = query.filter(Book.author == args['author'])
+    if args.get('category'):
+        query = query.filter(Book.category == args['category'])
+
+    year_from = args.get('year_from', type=int)
+    year_to = args.get('year_to', type=int)
+    if (year_from is None and 'year_from' in args) or (year_to is None and 'year_to' in args):
+        raise SearchError('year_from and year_to must be integers')
+    if year_from is not None:
+        query = query.filter(Book.year_published >= year_from)
+    if year_to is not None:
+        query = query.filter(Book.year_published <= year_to)
+
+    q = args.get('q', '').strip()
+    if not q:
+        return query, False
+
+    expression = fts_expression(q)
+    if expression is None:
+        raise SearchError('q must contain at least one word')
+
+    if db.engine.dialect.name != 'sqlite':
+        pattern = f'%{q}%'
+        query = query.filter(or_(Book.name.ilike(pattern), Book.description.ilike(pattern)))
+        return query.order_by(Book.id), True
+
+    query = (
+        query.join(book_fts, book_fts.c.rowid == Book.id)
+        .filter(text('book_fts MATCH :fts_query').bindparams(fts_query=expression))
+        .order_by(BOOK_FTS_RANK)
+    )
+    return query, True
@@ -0,0 +1,145 @@
+from sqlalchemy import Integer, case, cast, delete, func, insert, select, text
+from circulation import begin_write, roll_overdue
+from models import (
+    db, Book, BookLoanDay, BookLoanTotal, CategoryLoanDay, CityLoanDay, Customer, Loan, OverdueLoan, StatsDirtyDay,
+)
+
+
+# Move the all-time totals by the book_loan_day rows of the dirty days,
+# subtracted before they are recomputed (sign -1) and added after (+1)
+BOOK_TOTALS_UPSERT = text("""
+    INSERT INTO book_loan_total(book_id, loans)
+        SELECT book_id, :sign * sum(loans) FROM book_loan_day
+        WHERE day IN (SELECT day FROM stats_dirty_day) GROUP BY book_id
+    ON CONFLICT(book_id) DO UPDATE SET loans = loans + excluded.loans
+""")
+
+
+# Recompute the daily rollups for the days in stats_dirty_day (or for every
+# day with full=True) and clear them. Runs in one write transaction so no
+# loan write can mark a day between the recompute and the clear.
+# Returns the number of days refreshed.
+def refresh_summaries(full=False):
+    roll_overdue()
+    if not full and db.session.execute(select(StatsDirtyDay.day).limit(1)).first() is None:
+        return 0
+    begin_write()
+    if full:
+        for model in (BookLoanDay, BookLoanTotal, CategoryLoanDay, CityLoanDay, StatsDirtyDay):
+            db.session.execute(delete(model))
+        db.session.execute(insert(StatsDirtyDay).from_select(['day'], select(Loan.loan_date).distinct()))
+
+    dirty = select(StatsDirtyDay.day)
+    db.session.execute(BOOK_TOTALS_UPSERT, {'sign': -1})
+    for model in (BookLoanDay, CategoryLoanDay, CityLoanDay):
+        db.session.execute(delete(model).where(model.day.in_(dirty)))
+
+    db.session.execute(insert(BookLoanDay).from_select(
+        ['day', 'book_id', 'loans'],
+        select(Loan.loan_date, Loan.book_id, func.count())
+        .where(Loan.loan_date.in_(dirty))
+        .group_by(Loan.loan_date, Loan.book_id),
+    ))
+    db.session.execute(BOOK_TOTALS_UPSERT, {'sign': 1})
+    db.session.execute(insert(CategoryLoanDay).from_select(
+        ['day', 'category', 'loans'],
+        select(Loan.loan_date, Book.category, func.count())
+        .join(Book, Book.id == Loan.book_id)
+        .where(Loan.loan_date.in_(dirty))
+        .group_by(Loan.loan_date, Book.category),
+    ))
+    loan_days = func.julianday(Loan.actual_return_date) - func.julianday(Loan.loan_date)
+    db.session.execute(insert(CityLoanDay).from_select(
+        ['day', 'city', 'loans', 'returned', 'returned_late', 'open_overdue', 'loan_days'],
+        select(
+            Loan.loan_date,
+            Customer.city,
+            func.count(),
+            func.count(Loan.actual_return_date),
+            func.sum(case((Loan.actual_return_date > Loan.return_date, 1), else_=0)),
+            func.sum(case((Loan.id.in_(select(OverdueLoan.loan_id)), 1), else_=0)),
+            cast(func.coalesce(func.sum(loan_days), 0), Integer),
+        )
+        .join(Customer, Customer.id == Loan.cust_id)
+        .where(Loan.loan_date.in_(dirty))
+        .group_by(Loan.loan_date, Customer.city),
+    ))
+    days = db.session.execute(delete(StatsDirtyDay)).rowcount
+    db.session.commit()
+    return days
+
+
+def _in_range(column, since, until):
+    conditions = []
+    if since is not None:
+        conditions.append(column >= since)
+    if until is not None:
+        conditions.append(column <= until)
+    return conditions
+
+
+# Titles with the most loans dated between since and until. Without a
+# window the running totals answer it from the index on loans.
+def top_books(since=None, until=None, limit=10):
+    if since is None and until is None:
+        statement = (
+            select(BookLoanTotal.book_id, Book.name, Book.author, BookLoanTotal.loans)
+            .join(Book, Book.id == BookLoanTotal.book_id)
+            .where(BookLoanTotal.loans > 0)
+            .order_by(BookLoanTotal.loans.desc(), BookLoanTotal.book_id.desc())
+        )
+    else:
+        loans = func.sum(BookLoanDay.loans).label('loans')
+        statement = (
+            select(BookLoanDay.book_id, Book.name, Book.author, loans)
+            .join(Book, Book.id == BookLoanDay.book_id)
+            .where(*_in_range(BookLoanDay.day, since, until))
+            .group_by(BookLoanDay.book_id, Book.name, Book.author)
+            .order_by(loans.desc(), BookLoanDay.book_id.desc())
+        )
+    rows = db.session.execute(statement.limit(limit))
+    return [{'book_id': r.book_id, 'name': r.name, 'author': r.author, 'loans': r.loans} for r in rows]
+
+
+# Loans per month by the book's category as of the last refresh of that day
+def loans_per_category(since=None, until=None):
+    month = func.substr(CategoryLoanDay.day, 1, 7).label('month')
+    rows = db.session.execute(
+        select(month, CategoryLoanDay.category, func.sum(CategoryLoanDay.loans).label('loans'))
+        .where(*_in_range(CategoryLoanDay.day, since, until))
+        .group_by(month, CategoryLoanDay.category)
+        .order_by(month, CategoryLoanDay.category)
+    )
+    return [{'month': r.month, 'category': r.category, 'loans': r.loans} for r in rows]
+
+
+# Average days between loan_date and actual_return_date of returned loans
+def loan_duration(since=None, until=None):
+    row = db.session.execute(
+        select(
+            func.coalesce(func.sum(CityLoanDay.returned), 0).label('returned'),
+            func.coalesce(func.sum(CityLoanDay.loan_days), 0).label('loan_days'),
+        ).where(*_in_range(CityLoanDay.day, since, until))
+    ).one()
+    return {
+        'returned_loans': row.returned,
+        'average_days': round(row.loan_days / row.returned, 2) if row.returned else None,
+    }
+
+
+# Share of loans per city that were returned late or are still out past
+# their return date
+def overdue_rate(since=None, until=None):
+    overdue = (func.sum(CityLoanDay.returned_late) + func.sum(CityLoanDay.open_overdue)).label('overdue')
+    rows = db.session.execute(
+        select(CityLoanDay.city, func.sum(CityLoanDay.loans).label('loans'), overdue)
+        .where(*_in_range(CityLoanDay.day, since, until))
+        .group_by(CityLoanDay.city)
+        .order_by(CityLoanDay.city)
+    )
+    return [{
+        'city': r.city,
+        'loans': r.loans,
+        'overdue': r.overdue,
+        'overdue_rate': round(r.overdue / r.loans, 4),
+    } for r in rows]
@@ -1,18 +1,13 @@
+import json
+import os
+from datetime import date, datetime, timedelta
 import pytest
-from app import app, db, Book, Customer, Loan, Admin, Notification
-
-@pytest.fixture
-def client():
-    app.config['TESTING'] = True
-    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'  # Use an in-memory database for testing
-    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-    
-    with app.test_client() as client:
-        with app.app_context():
-            db.create_all()  # Create the tables in the in-memory database
-        yield client
-        db.session.remove()
-        db.drop_all()
+from contextlib import contextmanager
+from sqlalchemy import event
+from app import create_app
+from models import db, Book, Customer, Loan, Admin, Notification
+from cache import LRUCache, RedisCache
+from extensions import mail
 
 def test_home(client):
     response = client.get('/')
@@ -178,3 +173,1183 @@ def test_get_overdue_loans(client):
     assert len(response.json) == 1
     assert response.json[0]['cust_id'] == customer_response.json['id']
 
+
+def test_get_books_keyset_pagination(client):
+    for i in range(5):
+        client.post('/books', json={
+            "name": f"Paged Book {i}",
+            "author": "Paged Author",
+            "year_published": 2000 + i,
+            "book_type": 1,
+            "category": "Fiction",
+        })
+
+    response = client.get('/books?limit=2')
+    assert response.status_code == 200
+    assert [b['name'] for b in response.json] == ["Paged Book 0", "Paged Book 1"]
+    cursor = response.headers['X-Next-Cursor']
+
+    response = client.get(f'/books?limit=2&after={cursor}')
+    assert [b['name'] for b in response.json] == ["Paged Book 2", "Paged Book 3"]
+
+    response = client.get(f"/books?limit=2&after={response.headers['X-Next-Cursor']}")
+    assert [b['name'] for b in response.json] == ["Paged Book 4"]
+    assert 'X-Next-Cursor' not in response.headers
+
+def test_get_books_fields_and_ndjson(client):
+    for i in range(3):
+        client.post('/books', json={
+            "name": f"Export Book {i}",
+            "author": "Export Author",
+            "year_published": 2010,
+            "book_type": 1,
+        })
+
+    response = client.get('/books?fields=id,name')
+    assert response.status_code == 200
+    assert response.json[0] == {"id": 1, "name": "Export Book 0"}
+
+    response = client.get('/books?format=ndjson&fields=name')
+    assert response.mimetype == 'application/x-ndjson'
+    lines = response.get_data(as_text=True).splitlines()
+    assert len(lines) == 3
+    assert json.loads(lines[2]) == {"name": "Export Book 2"}
+
+    response = client.get('/books?fields=title')
+    assert response.status_code == 400
+
+def test_streamed_lists_return_their_connection(committing_app):
+    with committing_app.app_context():
+        pool = db.engine.pool
+    client = committing_app.test_client()
+    client.post('/books', json={"name": "Streamed Book", "author": "Stream Author", "year_published": 2020, "book_type": 1})
+    for url in ('/books', '/books?format=ndjson', '/customers'):
+        response = client.get(url)
+        response.get_data()
+        assert response.status_code == 200
+        assert pool.checkedout() == 0
+    # A client that disconnects before reading the body
+    client.get('/books').close()
+    assert pool.checkedout() == 0
+
+def test_search_books(client):
+    books = [
+        ("Dune", "Frank Herbert", 1965, "Science Fiction", "Desert planet and spice."),
+        ("Dune Messiah", "Frank Herbert", 1969, "Science Fiction", "The sequel to Dune."),
+        ("Desert Solitaire", "Edward Abbey", 1968, "Nature", "A season in the wilderness."),
+    ]
+    for name, author, year, category, description in books:
+        client.post('/books', json={
+            "name": name,
+            "author": author,
+            "year_published": year,
+            "book_type": 1,
+            "category": category,
+            "description": description,
+        })
+
+    response = client.get('/books/search?q=dune')
+    assert response.status_code == 200
+    assert [b['name'] for b in response.json] == ["Dune", "Dune Messiah"]
+    assert [b['name'] for b in client.get('/books/search?q=dune&limit=1&offset=1').json] == ["Dune Messiah"]
+    for bad in ('limit=0', 'limit=ten', 'offset=-1', 'offset=x'):
+        assert client.get(f'/books/search?q=dune&{bad}').status_code == 400
+
+    response = client.get('/books/search?q=desert')
+    assert {b['name'] for b in response.json} == {"Dune", "Desert Solitaire"}
+    assert response.json[0]['name'] == "Desert Solitaire"  # title match ranks first
+
+    response = client.get('/books/search?author=Frank Herbert&year_from=1966')
+    assert [b['name'] for b in response.json] == ["Dune Messiah"]
+
+    client.put('/books/2', json={"name": "Children of Dune"})
+    response = client.get('/books/search?q=messiah')
+    assert response.json == []
+
+    client.patch('/books/1/deactivate')
+    response = client.get('/books/search?q=dune')
+    assert [b['name'] for b in response.json] == ["Children of Dune"]
+
+def test_lru_cache_ttl_and_eviction():
+    now = [0.0]
+    cache = LRUCache(maxsize=2, ttl=10, clock=lambda: now[0])
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1
+    cache.set('c', 3)  # evicts 'b', the least recently used
+    assert cache.get('b') is None
+    now[0] = 11
+    assert cache.get('a') is None  # expired
+    assert cache.stats.to_dict()['hits'] == 1
+    assert cache.stats.misses == 2
+    assert cache.stats.evictions == 1
+
+class FakeRedis:
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, ex=None):
+        self.data[key] = value
+
+    def delete(self, *keys):
+        for key in keys:
+            self.data.pop(key, None)
+
+    def scan_iter(self, match):
+        return [key for key in list(self.data) if key.startswith(match.rstrip('*'))]
+
+def test_redis_cache_backend():
+    cache = RedisCache(FakeRedis(), ttl=60)
+    cache.set('book:1', {"id": 1, "name": "Cached"})
+    assert cache.get('book:1') == {"id": 1, "name": "Cached"}
+    cache.delete_many(['book:1'])
+    assert cache.get('book:1') is None
+    assert cache.stats.hits == 1 and cache.stats.misses == 1
+
+def test_get_book_is_cached_and_invalidated(client):
+    response = client.post('/books', json={
+        "name": "Cached Book",
+        "author": "Cache Author",
+        "year_published": 2001,
+        "book_type": 1,
+    })
+    book_id = response.json['id']
+
+    before = client.get('/cache/stats').json
+    client.get(f'/books/{book_id}')
+    client.get(f'/books/{book_id}')
+    stats = client.get('/cache/stats').json
+    assert stats['misses'] - before['misses'] == 1
+    assert stats['hits'] - before['hits'] == 1
+
+    client.put(f'/books/{book_id}', json={"name": "Renamed Book"})
+    assert client.get(f'/books/{book_id}').json['name'] == "Renamed Book"
+
+    client.patch(f'/books/{book_id}/deactivate')
+    assert client.get(f'/books/{book_id}').status_code == 404
+
+def add_customer(app, name, email, city='Springfield'):
+    with app.app_context():
+        customer = Customer(name=name, city=city, age=30, date_of_birth=date(1995, 1, 1), email=email, phone='5550000000')
+        db.session.add(customer)
+        db.session.commit()
+        return customer.id
+
+def test_checkout_and_return_maintain_available_copies(client, app):
+    book_id = client.post('/books', json={
+        "name": "Popular Book",
+        "author": "Popular Author",
+        "year_published": 2020,
+        "book_type": 1,
+        "available_copies": 1,
+    }).json['id']
+    first = add_customer(app, "First Patron", "first@example.com")
+    second = add_customer(app, "Second Patron", "second@example.com")
+    loan = {"book_id": book_id, "loan_date": "2025-01-01", "return_date": "2025-01-15"}
+
+    response = client.post('/loans', json={**loan, "cust_id": first})
+    assert response.status_code == 201
+    assert client.get(f'/books/{book_id}').json['available_copies'] == 0
+
+    response = client.post('/loans', json={**loan, "cust_id": second})
+    assert response.status_code == 409
+
+    loan_id = client.get('/loans').json[0]['id']
+    response = client.put(f'/loans/{loan_id}', json={"actual_return_date": "2025-01-10"})
+    assert response.json['status'] == 'returned'
+    assert client.get(f'/books/{book_id}').json['available_copies'] == 1
+
+    # Returning twice does not add a second copy
+    client.put(f'/loans/{loan_id}', json={"actual_return_date": "2025-01-11"})
+    assert client.get(f'/books/{book_id}').json['available_copies'] == 1
+
+def test_checkout_enforces_loan_limit(client, app):
+    book_id = client.post('/books', json={
+        "name": "Plentiful Book",
+        "author": "Author",
+        "year_published": 2020,
+        "book_type": 1,
+        "available_copies": 10,
+    }).json['id']
+    cust_id = add_customer(app, "Busy Patron", "busy@example.com")
+    loan = {"cust_id": cust_id, "book_id": book_id, "loan_date": "2025-01-01", "return_date": "2025-01-15"}
+
+    for _ in range(app.config['MAX_LOANS_PER_CUSTOMER']):
+        assert client.post('/loans', json=loan).status_code == 201
+    response = client.post('/loans', json=loan)
+    assert response.status_code == 409
+    assert client.get(f'/books/{book_id}').json['available_copies'] == 10 - app.config['MAX_LOANS_PER_CUSTOMER']
+
+def test_bulk_loans_and_returns(client, app):
+    book_id = client.post('/books', json={
+        "name": "Kiosk Book",
+        "author": "Kiosk Author",
+        "year_published": 2021,
+        "book_type": 1,
+        "available_copies": 2,
+    }).json['id']
+    customers = [add_customer(app, f"Kiosk Patron {i}", f"kiosk{i}@example.com") for i in range(3)]
+    loans = [
+        {"cust_id": cust_id, "book_id": book_id, "loan_date": "2025-02-01", "return_date": "2025-02-15"}
+        for cust_id in customers
+    ]
+    loans.append({"cust_id": 999, "book_id": book_id, "loan_date": "2025-02-01", "return_date": "2025-02-15"})
+    loans.append({"cust_id": customers[0], "book_id": book_id, "loan_date": "not a date", "return_date": "2025-02-15"})
+
+    response = client.post('/loans/bulk', json={"loans": loans})
+    assert response.status_code == 200
+    results = response.json['results']
+    assert [r['status'] for r in results] == ['created', 'created', 'rejected', 'rejected', 'rejected']
+    assert results[2]['reason'] == 'No copies available'
+    assert results[3]['reason'] == 'Customer not found'
+    assert results[0]['loan']['cust_id'] == customers[0]
+    assert client.get(f'/books/{book_id}').json['available_copies'] == 0
+
+    loan_ids = [results[0]['loan']['id'], results[1]['loan']['id']]
+    returns = [{"loan_id": loan_id, "actual_return_date": "2025-02-10"} for loan_id in loan_ids]
+    returns.append({"loan_id": loan_ids[0], "actual_return_date": "2025-02-10"})
+    response = client.post('/loans/bulk_return', json={"returns": returns})
+    assert [r['status'] for r in response.json['results']] == ['returned', 'returned', 'rejected']
+    assert response.json['results'][0]['loan']['actual_return_date'] == "2025-02-10"
+    assert client.get(f'/books/{book_id}').json['available_copies'] == 2
+
+def test_bulk_loans_use_constant_statements(client, app):
+    book_id = client.post('/books', json={
+        "name": "Batch Book",
+        "author": "Batch Author",
+        "year_published": 2021,
+        "book_type": 1,
+        "available_copies": 50,
+    }).json['id']
+    counts = []
+    for size in (2, 12):
+        customers = [add_customer(app, f"Batch Patron {size}-{i}", f"batch{size}-{i}@example.com") for i in range(size)]
+        loans = [{"cust_id": cust_id, "book_id": book_id, "loan_date": "2025-02-01", "return_date": "2025-02-15"}
+                 for cust_id in customers]
+        with count_queries(app) as checkout_statements:
+            results = client.post('/loans/bulk', json={"loans": loans}).json['results']
+        assert [r['loan']['cust_id'] for r in results] == customers
+        returns = [{"loan_id": r['loan']['id'], "actual_return_date": "2025-02-10"} for r in results]
+        with count_queries(app) as return_statements:
+            results = client.post('/loans/bulk_return', json={"returns": returns}).json['results']
+        assert [r['loan']['actual_return_date'] for r in results] == ["2025-02-10"] * size
+        assert results[0]['loan']['version'] == 2
+        counts.append((len(checkout_statements), len(return_statements)))
+    assert counts[0] == counts[1]
+    assert counts[1] <= (6, 5)
+
+def test_returned_copy_goes_to_next_hold(client, app):
+    book_id = client.post('/books', json={
+        "name": "Waitlisted Book",
+        "author": "Author",
+        "year_published": 2022,
+        "book_type": 1,
+        "available_copies": 1,
+    }).json['id']
+    reader, first, second = (add_customer(app, f"Hold Patron {i}", f"hold{i}@example.com") for i in range(3))
+    loan = {"book_id": book_id, "loan_date": "2025-03-01", "return_date": "2025-03-15"}
+
+    assert client.post(f'/books/{book_id}/holds', json={"cust_id": first}).status_code == 409
+    loan_id = client.post('/loans', json={**loan, "cust_id": reader}).json['id']
+    first_hold = client.post(f'/books/{book_id}/holds', json={"cust_id": first}).json
+    second_hold = client.post(f'/books/{book_id}/holds', json={"cust_id": second}).json
+    assert first_hold['status'] == 'waiting'
+    assert client.post(f'/books/{book_id}/holds', json={"cust_id": first}).status_code == 409
+    assert [h['id'] for h in client.get(f'/books/{book_id}/holds').json] == [first_hold['id'], second_hold['id']]
+
+    # The returned copy is set aside for the head of the queue, not shelved
+    client.put(f'/loans/{loan_id}', json={"actual_return_date": "2025-03-10"})
+    assert client.get(f'/books/{book_id}').json['available_copies'] == 0
+    holds = client.get(f'/books/{book_id}/holds').json
+    assert [h['status'] for h in holds] == ['ready', 'waiting']
+    notices = client.get(f'/customers/{first}/notifications').json
+    assert [n['type'] for n in notices] == ['hold_ready']
+    assert 'Waitlisted Book' in notices[0]['content']
+
+    assert client.post('/loans', json={**loan, "cust_id": second}).status_code == 409
+    assert client.post('/loans', json={**loan, "cust_id": first}).status_code == 201
+    assert client.get(f'/books/{book_id}/holds?status=fulfilled').json[0]['id'] == first_hold['id']
+
+    # Cancelling the last hold leaves the next returned copy on the shelf
+    response = client.delete(f"/holds/{second_hold['id']}")
+    assert response.json['status'] == 'cancelled'
+    assert client.delete(f"/holds/{second_hold['id']}").status_code == 409
+    loan_id = client.get(f'/customers/{first}/loans').json[0]['id']
+    client.put(f'/loans/{loan_id}', json={"actual_return_date": "2025-03-20"})
+    assert client.get(f'/books/{book_id}').json['available_copies'] == 1
+
+def test_bulk_checkout_fulfills_ready_hold(client, app):
+    book_id = client.post('/books', json={
+        "name": "Held Kiosk Book",
+        "author": "Author",
+        "year_published": 2022,
+        "book_type": 1,
+        "available_copies": 1,
+    }).json['id']
+    reader, holder, other = (add_customer(app, f"Bulk Hold Patron {i}", f"bulkhold{i}@example.com") for i in range(3))
+    loan = {"book_id": book_id, "loan_date": "2025-03-01", "return_date": "2025-03-15"}
+    loan_id = client.post('/loans', json={**loan, "cust_id": reader}).json['id']
+    hold = client.post(f'/books/{book_id}/holds', json={"cust_id": holder}).json
+    client.put(f'/loans/{loan_id}', json={"actual_return_date": "2025-03-10"})
+
+    response = client.post('/loans/bulk', json={"loans": [{**loan, "cust_id": other}, {**loan, "cust_id": holder}]})
+    results = response.json['results']
+    assert [r['status'] for r in results] == ['rejected', 'created']
+    assert results[0]['reason'] == 'No copies available'
+    assert client.get(f'/books/{book_id}/holds?status=fulfilled').json[0]['id'] == hold['id']
+    assert client.get(f'/books/{book_id}').json['available_copies'] == 0
+
+def test_overdue_set_is_maintained_incrementally(client, app):
+    book_id = client.post('/books', json={
+        "name": "Overdue Set Book",
+        "author": "Author",
+        "year_published": 2020,
+        "book_type": 1,
+        "available_copies": 5,
+    }).json['id']
+    first = add_customer(app, "Late Patron", "late@example.com")
+    second = add_customer(app, "Punctual Patron", "punctual@example.com")
+    today = datetime.utcnow().date()
+    loans = client.post('/loans/bulk', json={"loans": [
+        {"cust_id": first, "book_id": book_id, "loan_date": "2025-01-01", "return_date": "2025-01-10"},
+        {"cust_id": second, "book_id": book_id, "loan_date": str(today), "return_date": str(today)},
+        # Already marked by the mark-overdue job, e.g. on another clock
+        {"cust_id": second, "book_id": book_id, "loan_date": str(today), "return_date": str(today), "status": "overdue"},
+    ]}).json['results']
+    late_id, due_today_id, marked_id = [result['loan']['id'] for result in loans]
+
+    response = client.get('/loans/overdue')
+    assert [loan['id'] for loan in response.json] == [late_id]
+
+    # The next day the loans due today join the set
+    with app.app_context():
+        from circulation import roll_overdue
+        assert roll_overdue(today + timedelta(days=1)) == 2
+        assert roll_overdue(today + timedelta(days=1)) == 0
+    assert [loan['id'] for loan in client.get('/loans/overdue').json] == [late_id, due_today_id, marked_id]
+
+    client.put(f'/loans/{late_id}', json={"actual_return_date": str(today)})
+    assert [loan['id'] for loan in client.get('/loans/overdue').json] == [due_today_id, marked_id]
+
+def test_overdue_reads_do_not_roll_the_set(client, app):
+    book_id = client.post('/books', json={"name": "Lagging Book", "author": "A", "year_published": 2020, "book_type": 1}).json['id']
+    cust_id = add_customer(app, "Lagging Patron", "lagging@example.com")
+    yesterday = datetime.utcnow().date() - timedelta(days=1)
+    # The last roll was two days ago, so the loan is not in the set yet
+    with app.app_context():
+        from models import OverdueLoan, OverdueState
+        db.session.get(OverdueState, 1).as_of = yesterday - timedelta(days=1)
+        db.session.commit()
+    loan_id = client.post('/loans/bulk', json={"loans": [
+        {"cust_id": cust_id, "book_id": book_id, "loan_date": "2025-01-01", "return_date": str(yesterday)},
+    ]}).json['results'][0]['loan']['id']
+
+    for url, key, expected in (('/loans/overdue', 'id', loan_id), ('/loans/overdue/notify', 'email', "lagging@example.com")):
+        with count_queries(app) as statements:
+            response = client.get(url)
+        assert [loan[key] for loan in response.json] == [expected]
+        assert all(statement.lstrip().upper().startswith('SELECT') for statement in statements), statements
+    with app.app_context():
+        assert db.session.get(OverdueState, 1).as_of == yesterday - timedelta(days=1)
+        assert db.session.get(OverdueLoan, loan_id) is None
+
+
+@contextmanager
+def count_queries(app):
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        # Not the SAVEPOINTs standing in for commits inside the test's transaction
+        if not statement.startswith(('SAVEPOINT', 'RELEASE SAVEPOINT', 'ROLLBACK TO SAVEPOINT')):
+            statements.append(statement)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+# SQL statements each endpoint may issue, independent of how many rows it returns
+# Lists spend one extra query on the change counters behind their ETag
+QUERY_BUDGETS = [
+    ('GET', '/books', 2),
+    ('GET', '/books/1', 1),
+    ('GET', '/customers', 2),
+    ('GET', '/loans', 2),
+    ('GET', '/loans/overdue', 2),
+    ('GET', '/loans/overdue/notify', 2),
+    ('GET', '/notifications', 1),
+]
+
+@pytest.mark.parametrize('method, url, budget', QUERY_BUDGETS)
+def test_query_budget(client, app, method, url, budget):
+    book_id = client.post('/books', json={
+        "name": "Budget Book",
+        "author": "Author",
+        "year_published": 2020,
+        "book_type": 1,
+        "available_copies": 20,
+    }).json['id']
+    customers = [add_customer(app, f"Budget Patron {i}", f"budget{i}@example.com") for i in range(10)]
+    client.post('/loans/bulk', json={"loans": [
+        {"cust_id": cust_id, "book_id": book_id, "loan_date": "2025-01-01", "return_date": "2025-01-10"}
+        for cust_id in customers
+    ]})
+    app.extensions['lookup_cache'].clear()
+
+    with count_queries(app) as statements:
+        response = client.open(url, method=method)
+        response.get_data()
+    assert response.status_code == 200
+    assert len(statements) <= budget, statements
+
+def test_notify_overdue_loans(client, app):
+    book_id = client.post('/books', json={
+        "name": "Late Book",
+        "author": "Author",
+        "year_published": 2020,
+        "book_type": 1,
+    }).json['id']
+    cust_id = add_customer(app, "Late Reader", "late.reader@example.com")
+    client.post('/loans/bulk', json={"loans": [
+        {"cust_id": cust_id, "book_id": book_id, "loan_date": "2025-01-01", "return_date": "2025-01-10"},
+    ]})
+
+    response = client.get('/loans/overdue/notify')
+    assert response.status_code == 200
+    assert response.json == [{
+        "customer_name": "Late Reader",
+        "email": "late.reader@example.com",
+        "book_title": "Late Book",
+        "due_date": "Fri, 10 Jan 2025 00:00:00 GMT",
+    }]
+
+def test_overdue_notices_are_queued_and_mailed(client, app, monkeypatch):
+    monkeypatch.setattr(app.extensions['mail'], 'suppress', True)
+    book_id = client.post('/books', json={
+        "name": "Mailed Book",
+        "author": "Author",
+        "year_published": 2020,
+        "book_type": 1,
+        "available_copies": 3,
+    }).json['id']
+    customers = [add_customer(app, f"Mailed Patron {i}", f"mailed{i}@example.com") for i in range(3)]
+    client.post('/loans/bulk', json={"loans": [
+        {"cust_id": cust_id, "book_id": book_id, "loan_date": "2025-01-01", "return_date": "2025-01-10"}
+        for cust_id in customers
+    ]})
+
+    assert client.post('/loans/overdue/notify').json == {"queued": 3}
+    assert client.post('/loans/overdue/notify').json == {"queued": 0}
+
+    with app.app_context(), mail.record_messages() as outbox:
+        from mailer import dispatch_pending
+        stats = dispatch_pending(mail, batch_size=2, workers=2)
+        assert stats['sent'] == 3 and stats['batches'] == 2
+        assert sorted(message.recipients[0] for message in outbox) == [f"mailed{i}@example.com" for i in range(3)]
+        assert outbox[0].body == 'Book "Mailed Book" was due on 2025-01-10'
+        assert Notification.query.filter_by(delivery_status='sent').count() == 3
+        assert dispatch_pending(mail)['sent'] == 0
+
+def test_failed_mail_is_retried_with_backoff(client, app, monkeypatch):
+    book_id = client.post('/books', json={
+        "name": "Bounced Book",
+        "author": "Author",
+        "year_published": 2020,
+        "book_type": 1,
+    }).json['id']
+    cust_id = add_customer(app, "Bounced Patron", "bounced@example.com")
+    client.post('/loans/bulk', json={"loans": [
+        {"cust_id": cust_id, "book_id": book_id, "loan_date": "2025-01-01", "return_date": "2025-01-10"},
+    ]})
+    client.post('/loans/overdue/notify')
+
+    def refuse():
+        raise ConnectionRefusedError('SMTP server down')
+    monkeypatch.setattr(mail, 'connect', refuse)
+
+    with app.app_context():
+        from mailer import dispatch_pending
+        assert dispatch_pending(mail)['failed'] == 1
+        notification = Notification.query.one()
+        assert notification.delivery_status == 'pending'
+        assert notification.attempts == 1
+        assert 'SMTP server down' in notification.last_error
+        # Not due again until the backoff has passed
+        assert dispatch_pending(mail)['failed'] == 0
+
+def test_notification_inbox_and_bulk_mark_read(client):
+    for i in range(4):
+        client.post('/notifications', json={
+            "type": "info",
+            "content": f"Message {i}",
+            "priority": "high" if i % 2 else "low",
+            "recipient_id": 7,
+        })
+    client.post('/notifications', json={"type": "info", "content": "Other", "priority": "low", "recipient_id": 8})
+
+    response = client.get('/customers/7/notifications?limit=3')
+    assert [n['content'] for n in response.json] == ["Message 3", "Message 2", "Message 1"]
+    response = client.get(f"/customers/7/notifications?limit=3&after={response.headers['X-Next-Cursor']}")
+    assert [n['content'] for n in response.json] == ["Message 0"]
+
+    response = client.get('/customers/7/notifications?priority=high')
+    assert [n['content'] for n in response.json] == ["Message 3", "Message 1"]
+    assert client.get('/customers/7/notifications/unread_count').json['unread'] == 4
+
+    response = client.post('/notifications/mark_read', json={"ids": [1, 2]})
+    assert response.json == {"updated": 2}
+    assert client.get('/customers/7/notifications/unread_count').json['unread'] == 2
+    assert [n['id'] for n in client.get('/customers/7/notifications?status=new').json] == [4, 3]
+
+    # Marking up to a timestamp needs a recipient
+    response = client.post('/notifications/mark_read', json={"before": "2999-01-01T00:00:00"})
+    assert response.status_code == 400
+    assert client.get('/customers/8/notifications/unread_count').json['unread'] == 1
+    response = client.post('/customers/7/notifications/mark_read', json={"before": "2999-01-01T00:00:00"})
+    assert response.json == {"updated": 2}
+    assert client.get('/customers/7/notifications/unread_count').json['unread'] == 0
+    assert client.get('/customers/8/notifications/unread_count').json['unread'] == 1
+
+    client.patch('/update_notification_status/5')
+    assert client.get('/customers/8/notifications/unread_count').json['unread'] == 0
+
+def test_perf_instrumentation_metrics():
+    from flask import Flask, jsonify
+    from config import Config
+    from database import init_db
+    from instrumentation import PerfInstrumentation
+
+    instrumented = Flask(__name__)
+    instrumented.config.from_object(Config)
+    instrumented.config.update(
+        SQLALCHEMY_DATABASE_URI='sqlite:///:memory:',
+        PERF_INSTRUMENTATION=True,
+        PERF_SERVER_TIMING=True,
+    )
+    init_db(instrumented)
+    PerfInstrumentation(instrumented)
+
+    @instrumented.route('/books')
+    def list_books():
+        return jsonify([book.to_dict() for book in Book.query.all()])
+
+    with instrumented.app_context():
+        db.create_all()
+        db.session.add(Book(name="Timed", author="Author", year_published=2000, book_type=1))
+        db.session.commit()
+
+    client = instrumented.test_client()
+    response = client.get('/books')
+    assert 'db;dur=' in response.headers['Server-Timing']
+    assert '1 queries' in response.headers['Server-Timing']
+    response.close()  # the request is recorded when the server closes the response
+
+    metrics = client.get('/metrics').get_data(as_text=True)
+    assert 'library_request_duration_seconds_count{endpoint="list_books"} 1' in metrics
+    assert 'library_sql_statements_total{endpoint="list_books"} 1' in metrics
+    assert 'library_serialization_seconds_total{endpoint="list_books"}' in metrics
+    # Only this app is instrumented; the shared model classes are not patched
+    assert Book.to_dict is Book.__dict__['to_dict']
+    assert not hasattr(Book.to_dict, '__wrapped__')
+
+    # List endpoints time their row formatting
+    app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:', 'PERF_INSTRUMENTATION': True})
+    with app.app_context():
+        db.create_all()
+    app.test_client().post('/books', json={"name": "Listed", "author": "A", "year_published": 2000, "book_type": 1})
+    response = app.test_client().get('/books')
+    assert [book['name'] for book in response.json] == ["Listed"]
+    response.close()
+    stats = app.extensions['perf_instrumentation'].endpoints['books.get_books']
+    assert stats.count == 1 and stats.serialize_time > 0
+
+def test_import_data_resumes_after_failure(committing_app, tmp_path):
+    from sqlalchemy.exc import IntegrityError
+    from importer import import_file
+    app = committing_app
+
+    def write_customers(emails):
+        path = tmp_path / 'customers.jsonl'
+        path.write_text(''.join(json.dumps({
+            "name": f"Imported {i}",
+            "city": "Oslo",
+            "age": 40,
+            "date_of_birth": "1985-04-01",
+            "email": email,
+            "phone": "5551234567",
+        }) + '\n' for i, email in enumerate(emails)))
+        return str(path)
+
+    path = write_customers(["a@example.com", "b@example.com", "a@example.com", "d@example.com"])
+    with app.app_context():
+        with pytest.raises(IntegrityError):
+            import_file('customers', path, batch_size=2)
+        assert Customer.query.count() == 2
+        # The indexes dropped for the load are back after the failure
+        indexes = {row[0] for row in db.session.execute(db.text(
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'customer'"
+        ))}
+        assert {index.name for index in Customer.__table__.indexes} <= indexes
+
+        path = write_customers(["a@example.com", "b@example.com", "c@example.com", "d@example.com"])
+        stats = import_file('customers', path, batch_size=2)
+        assert stats['resumed_after'] == 2 and stats['imported'] == 2
+        customers = Customer.query.order_by(Customer.id).all()
+        assert [c.email for c in customers] == ["a@example.com", "b@example.com", "c@example.com", "d@example.com"]
+        assert customers[2].date_of_birth == date(1985, 4, 1)
+
+def test_import_data_rejects_bad_lines(committing_app, tmp_path, caplog):
+    from importer import import_file
+    customer = {"name": "Imported", "city": "Oslo", "age": 40, "date_of_birth": "1985-04-01", "phone": "5551234567"}
+    path = tmp_path / 'customers.jsonl'
+    path.write_text('\n'.join([
+        json.dumps({**customer, "email": "first@example.com"}),
+        '{"name": "Broken",',
+        '[1, 2]',
+        '',
+        json.dumps({**customer, "email": "last@example.com"}),
+    ]) + '\n')
+    with committing_app.app_context():
+        stats = import_file('customers', str(path), batch_size=2)
+        assert (stats['imported'], stats['rejected']) == (2, 2)
+        assert [c.email for c in Customer.query.order_by(Customer.id)] == ["first@example.com", "last@example.com"]
+    rejected = [r.getMessage() for r in caplog.records if 'rejected' in r.getMessage()]
+    assert [message.split(': ')[0] for message in rejected] == [f'{path}:2', f'{path}:3']
+
+def test_export_streams_and_tracks_watermark(client, app, tmp_path):
+    from exporter import export_to_file
+    with app.app_context():
+        start = db.session.query(db.func.max(Book.id)).scalar() or 0
+    for i in range(3):
+        client.post('/books', json={"name": f"Export {i}", "author": "A", "year_published": 2000 + i, "book_type": 1})
+
+    response = client.get(f'/export/books?format=csv&since_id={start}')
+    assert response.mimetype == 'text/csv'
+    lines = response.get_data(as_text=True).splitlines()
+    assert lines[0] == 'id,name,author,year_published,book_type,category,active,available_copies,description,version,updated_at'
+    assert lines[1].startswith(f'{start + 1},Export 0,A,2000,1,General,True,1,')
+    assert len(lines) == 4
+
+    response = client.get(f'/export/books?format=ndjson&since_id={start + 2}')
+    assert [json.loads(line)['name'] for line in response.get_data(as_text=True).splitlines()] == ["Export 2"]
+    assert client.get('/export/books?format=parquet').status_code == 400
+
+    with app.app_context():
+        # As if the books were written a while ago; bumping the version
+        # keeps the update trigger from stamping updated_at again
+        db.session.execute(db.update(Book).where(Book.id > start).values(
+            updated_at=datetime(2025, 1, 1), version=Book.version + 1))
+        db.session.commit()
+        path = str(tmp_path / 'books.ndjson')
+        assert export_to_file('books', 'ndjson', path, since_id=start, watermark='nightly')['rows'] == 3
+    # Changed rows are exported again, not only the new ones
+    client.put(f'/books/{start + 1}', json={"description": "Back on the shelf"})
+    client.post('/books', json={"name": "Export 3", "author": "A", "year_published": 2003, "book_type": 1})
+    with app.app_context():
+        stats = export_to_file('books', 'ndjson', path, watermark='nightly')
+    assert (stats['rows'], stats['since_id'], stats['last_id']) == (2, None, start + 4)
+    with open(path) as f:
+        assert [json.loads(line)['name'] for line in f] == ["Export 0", "Export 3"]
+
+    response = client.get(f"/export/books?format=ndjson&updated_since={stats['updated_since'].isoformat()}")
+    assert [json.loads(line)['name'] for line in response.get_data(as_text=True).splitlines()] == ["Export 0", "Export 3"]
+    assert client.get('/export/books?updated_since=yesterday').status_code == 400
+
+
+def test_stats_rollups_follow_loan_writes(client, app):
+    books = [client.post('/books', json={
+        "name": name, "author": "Stats", "year_published": 2000, "book_type": 1,
+        "category": category, "available_copies": 5,
+    }).json['id'] for name, category in (("Popular", "Fiction"), ("Niche", "History"))]
+    north = add_customer(app, "North Patron", "north@example.com", city="Northville")
+    south = add_customer(app, "South Patron", "south@example.com", city="Southville")
+    loans = client.post('/loans/bulk', json={"loans": [
+        {"cust_id": north, "book_id": books[0], "loan_date": "2001-01-05", "return_date": "2001-01-19"},
+        {"cust_id": south, "book_id": books[0], "loan_date": "2001-01-20", "return_date": "2001-02-03"},
+        {"cust_id": south, "book_id": books[1], "loan_date": "2001-02-01", "return_date": "2001-02-15"},
+    ]}).json['results']
+    first, second, third = [result['loan']['id'] for result in loans]
+    client.put(f'/loans/{first}', json={"actual_return_date": "2001-01-15"})
+    client.put(f'/loans/{second}', json={"actual_return_date": "2001-02-09"})
+    window = 'since=2001-01-01&until=2001-12-31'
+    assert client.post('/stats/refresh').json == {"refreshed_days": 3}
+
+    response = client.get(f'/stats/top_books?{window}')
+    assert [(row['name'], row['loans']) for row in response.json] == [("Popular", 2), ("Niche", 1)]
+    assert client.get(f'/stats/loans_per_category?{window}').json == [
+        {"month": "2001-01", "category": "Fiction", "loans": 2},
+        {"month": "2001-02", "category": "History", "loans": 1},
+    ]
+    assert client.get(f'/stats/loan_duration?{window}').json == {"returned_loans": 2, "average_days": 15.0}
+    # South: one returned late, one still out long past its return date
+    assert client.get(f'/stats/overdue_rate?{window}').json == [
+        {"city": "Northville", "loans": 1, "overdue": 0, "overdue_rate": 0.0},
+        {"city": "Southville", "loans": 2, "overdue": 2, "overdue_rate": 1.0},
+    ]
+
+    # Reads never refresh; only the touched day is recomputed
+    client.put(f'/loans/{third}', json={"actual_return_date": "2001-02-10"})
+    assert client.get(f'/stats/overdue_rate?{window}').json[1]['overdue'] == 2
+    with app.app_context():
+        from stats import refresh_summaries
+        assert refresh_summaries() == 1
+        assert refresh_summaries() == 0
+    assert client.get(f'/stats/overdue_rate?{window}').json[1]['overdue'] == 1
+    overall = {row['city']: row for row in client.get('/stats/overdue_rate').json}
+    assert (overall['Southville']['loans'], overall['Southville']['overdue']) == (2, 1)
+    top = {row['name']: row['loans'] for row in client.get('/stats/top_books?limit=1000').json}
+    assert (top["Popular"], top["Niche"]) == (2, 1)
+    assert client.get('/stats/top_books?since=2001-13-01').status_code == 400
+    for limit in ('0', '-1', 'ten'):
+        assert client.get(f'/stats/top_books?limit={limit}').status_code == 400
+
+
+def test_engine_options_from_environment():
+    from config import engine_options
+    assert engine_options('sqlite:///library.db', {}) == {'connect_args': {'timeout': 15}}
+    assert engine_options('postgresql+psycopg2://library@db/library', {}) == {}
+    options = engine_options('postgresql://library@db/library', {
+        'DB_POOL_SIZE': '10', 'DB_MAX_OVERFLOW': '5', 'DB_POOL_PRE_PING': 'true', 'DB_POOL_RECYCLE': '1800',
+    })
+    assert (options['pool_size'], options['max_overflow'], options['pool_pre_ping'], options['pool_recycle']) == (10, 5, True, 1800)
+
+    # Worked out from the URIs the app ends up with, not the Config defaults
+    from database import _apply_engine_options
+    config = {
+        'SQLALCHEMY_DATABASE_URI': 'postgresql://library@db/library',
+        'SQLALCHEMY_ENGINE_OPTIONS': {'echo': True},
+        'SQLALCHEMY_BINDS': {'replica': 'sqlite:///replica.db'},
+    }
+    _apply_engine_options(config)
+    assert config['SQLALCHEMY_ENGINE_OPTIONS'] == {'echo': True}
+    assert config['SQLALCHEMY_BINDS'] == {'replica': {'url': 'sqlite:///replica.db', 'connect_args': {'timeout': 15}}}
+    app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:'})
+    assert app.config['SQLALCHEMY_ENGINE_OPTIONS']['connect_args']['timeout'] == 15
+
+
+def test_reads_go_to_replica_until_first_write(tmp_path):
+    import shutil
+    from flask import Flask
+    from sqlalchemy.exc import OperationalError
+    from config import Config
+    from database import init_db, use_replica
+
+    primary, replica = tmp_path / 'primary.db', tmp_path / 'replica.db'
+    routed = Flask('routed')
+    routed.config.from_object(Config)
+    routed.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{primary}'
+    routed.config['SQLALCHEMY_BINDS'] = {'replica': f'sqlite:///{replica}'}
+    init_db(routed)
+
+    def add_book(name):
+        db.session.add(Book(name=name, author='A', year_published=2000, book_type=1))
+        db.session.commit()
+
+    with routed.app_context():
+        db.create_all(bind_key=None)
+        add_book('On both')
+        db.engine.dispose()
+        shutil.copy(primary, replica)
+        add_book('Primary only')
+
+    with routed.app_context():
+        use_replica()
+        assert Book.query.count() == 1
+        add_book('Written')
+        # Read-your-writes: once the session has written it stays on the primary
+        assert Book.query.count() == 3
+
+    with routed.app_context():
+        assert Book.query.count() == 3
+        with pytest.raises(OperationalError):
+            with db.engines['replica'].begin() as connection:
+                connection.exec_driver_sql("DELETE FROM book")
+        for engine in db.engines.values():
+            engine.dispose()
+    # init_app registered metadata for the bind; the main app has no replica
+    db.metadatas.pop('replica')
+
+
+def test_conditional_get_on_rows_and_lists(client, app):
+    book_id = client.post('/books', json={"name": "Polled", "author": "A", "year_published": 2000, "book_type": 1}).json['id']
+    response = client.get(f'/books/{book_id}')
+    etag = response.headers['ETag']
+    assert response.json['version'] == 1 and response.headers['Last-Modified']
+
+    response = client.get(f'/books/{book_id}', headers={'If-None-Match': etag})
+    assert response.status_code == 304 and response.data == b''
+
+    listing = client.get('/books?limit=5')
+    list_etag = listing.headers['ETag']
+    assert client.get('/books?limit=5', headers={'If-None-Match': list_etag}).status_code == 304
+    # Another query string is another representation
+    assert client.get('/books?limit=6', headers={'If-None-Match': list_etag}).status_code == 200
+
+    # Any write to book, including the bare UPDATE a checkout runs, changes both
+    customer_id = add_customer(app, "Poller", "poller@example.com")
+    client.post('/loans', json={"cust_id": customer_id, "book_id": book_id, "loan_date": "2025-01-01", "return_date": "2025-01-10"})
+    response = client.get(f'/books/{book_id}', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert (response.json['version'], response.json['available_copies']) == (2, 0)
+    assert client.get('/books?limit=5', headers={'If-None-Match': list_etag}).status_code == 200
+
+    # A write the cache never heard of (e.g. from another worker) is not
+    # hidden behind a 304 from the stale cached payload
+    etag = response.headers['ETag']
+    with app.app_context():
+        db.session.execute(db.update(Book).where(Book.id == book_id).values(name="Renamed elsewhere"))
+        db.session.commit()
+    assert client.get(f'/books/{book_id}').json['name'] == "Polled"
+    response = client.get(f'/books/{book_id}', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert (response.json['version'], response.json['name']) == (3, "Renamed elsewhere")
+    assert client.get(f'/books/{book_id}', headers={'If-None-Match': response.headers['ETag']}).status_code == 304
+
+
+def test_orjson_provider_matches_stdlib_output(app):
+    from flask.json.provider import DefaultJSONProvider
+    from json_provider import OrjsonProvider
+    assert isinstance(app.json, OrjsonProvider)
+    payload = {"b": [1, 2.5, None, True], "a": "näme", "when": datetime(2025, 1, 2, 3, 4, 5), "day": date(2025, 1, 2)}
+    stdlib = DefaultJSONProvider(app)
+    assert json.loads(app.json.dumps(payload)) == json.loads(stdlib.dumps(payload))
+    assert list(json.loads(app.json.dumps(payload))) == ["a", "b", "day", "when"]
+    with app.app_context():
+        assert app.json.response(payload).get_data() == app.json.dumps(payload).encode() + b'\n'
+
+    # jsonify() encodes through app.json.dumps, which instrumentation wraps
+    calls = []
+    dumps = app.json.dumps
+    app.json.dumps = lambda obj, **kwargs: calls.append(obj) or dumps(obj, **kwargs)
+    try:
+        with app.app_context():
+            app.json.response(payload)
+    finally:
+        del app.json.dumps
+    assert calls == [payload]
+
+
+def test_row_formatter_matches_to_dict(client, app):
+    from pagination import projection, row_formatter
+    book_id = client.post('/books', json={"name": "Rows", "author": "A", "year_published": 2000, "book_type": 1}).json['id']
+    customer_id = add_customer(app, "Row Patron", "rows@example.com")
+    loan_id = client.post('/loans', json={"cust_id": customer_id, "book_id": book_id, "loan_date": "2025-01-01", "return_date": "2025-01-10"}).json['id']
+    client.post('/notifications', json={"type": "info", "content": "Hello", "priority": "low", "recipient_id": customer_id})
+
+    with app.app_context():
+        for model, id in ((Book, book_id), (Customer, customer_id), (Loan, loan_id), (Notification, None)):
+            obj = db.session.get(model, id) if id else model.query.first()
+            fields = model.serialized_fields
+            row = model.query.filter_by(id=obj.id).with_entities(*projection(model, fields)).one()
+            assert list(row_formatter(model, fields)(row).items()) == list(obj.to_dict().items())
+
+
+def test_token_bucket_refills_at_rate():
+    from throttle import MemoryBucketStore
+    now = [0.0]
+    store = MemoryBucketStore(clock=lambda: now[0])
+    assert [store.take('kiosk', 1, 2) for _ in range(2)] == [0, 0]
+    assert store.take('kiosk', 1, 2) == 1.0
+    now[0] = 0.5
+    assert store.take('kiosk', 1, 2) == 0.5
+    assert store.take('other', 1, 2) == 0
+
+
+def test_write_requests_are_throttled_and_shed(client, app, monkeypatch):
+    from throttle import AdmissionGate
+    write_throttle = app.extensions['write_throttle']
+    monkeypatch.setitem(app.config, 'RATE_LIMIT_ENABLED', True)
+    monkeypatch.setitem(app.config, 'RATE_LIMITS', {'notifications.create_notification': (0.5, 2)})
+    notification = {"type": "info", "content": "Flood", "priority": "low"}
+
+    kiosk = {'X-Client-Key': 'kiosk-throttle-test'}
+    statuses = [client.post('/notifications', json=notification, headers=kiosk).status_code for _ in range(3)]
+    assert statuses == [201, 201, 429]
+    response = client.post('/notifications', json=notification, headers=kiosk)
+    assert response.headers['Retry-After'] == '2'
+    assert client.post('/notifications', json=notification, headers={'X-Client-Key': 'other-kiosk'}).status_code == 201
+    assert client.get('/notifications?limit=1', headers=kiosk).status_code == 200  # Reads are not limited
+    assert write_throttle.stats()['throttled'] == {'notifications.create_notification': 2}
+
+    gate = AdmissionGate(max_concurrent=1, max_queue=0, timeout=1)
+    monkeypatch.setattr(write_throttle, 'gate', gate)
+    assert gate.enter() is None  # A slow write holds the only slot
+    response = client.post('/books', json={"name": "Shed", "author": "A", "year_published": 2000, "book_type": 1})
+    assert (response.status_code, response.headers['Retry-After']) == (503, '1')
+    assert write_throttle.stats()['shed'] == {'queue_full': 1}
+    gate.leave()
+    assert client.post('/books', json={"name": "Admitted", "author": "A", "year_published": 2000, "book_type": 1}).status_code == 201
+    # The admitted request gives its slot back on teardown, which the test
+    # client runs when the next request starts
+    client.get('/')
+    assert gate.enter() is None
+
+
+def test_admission_queue_times_out():
+    from throttle import AdmissionGate
+    gate = AdmissionGate(max_concurrent=1, max_queue=1, timeout=0.01)
+    assert gate.enter() is None
+    assert gate.enter() == 'queue_timeout'
+    gate.leave()
+    assert gate.enter() is None
+
+
+def test_admin_session_uses_identity_cache_and_rehashes(client, app, monkeypatch):
+    from werkzeug.security import generate_password_hash
+    assert client.post('/admin', json={"username": "root-admin", "password": "s3cret"}).status_code == 201
+    with app.app_context():
+        admin = Admin.query.filter_by(username="root-admin").one()
+        admin_id = admin.id
+        assert admin.password.startswith('scrypt:32768:8:1$')
+        # An older, cheaper hash
+        admin.password = generate_password_hash("s3cret", method='pbkdf2:sha256:1000')
+        db.session.commit()
+
+    assert client.get(f'/admin/{admin_id}').status_code == 401
+    assert client.post('/login', json={"username": "root-admin", "password": "wrong"}).status_code == 401
+    assert client.post('/login', json={"username": "root-admin", "password": "s3cret"}).status_code == 200
+    with app.app_context():
+        assert db.session.get(Admin, admin_id).password.startswith('scrypt:32768:8:1$')
+
+    assert client.get(f'/admin/{admin_id}').json == {'id': admin_id, 'username': "root-admin"}
+    with count_queries(app) as statements:
+        client.get(f'/admin/{admin_id}')
+    # Only the route's own lookup: the session's admin came from the cache
+    assert len(statements) == 1
+
+    client.delete(f'/admin/{admin_id}')
+    assert client.get(f'/admin/{admin_id}').status_code == 401
+
+
+def test_factories_insert_scale_fixtures(client, app):
+    from factories import make_books, make_customers, make_loans
+    yesterday = date.today() - timedelta(days=1)
+    with app.app_context():
+        book_ids = make_books(200, available_copies=10, category=lambda i: ('Fiction', 'History')[i % 2])
+        customer_ids = make_customers(500)
+        loan_ids = make_loans(2000, customer_ids, book_ids, return_date=lambda i: yesterday if i % 4 == 0 else date.today())
+        db.session.commit()
+        assert (Book.query.count(), Customer.query.count(), Loan.query.count()) == (200, 500, 2000)
+
+    assert loan_ids == sorted(loan_ids)
+    assert client.get(f'/books/{book_ids[1]}').json['category'] == 'History'
+    assert client.get(f'/books/{book_ids[0]}').json['available_copies'] == 0
+    overdue = client.get('/loans/overdue?limit=1000').json
+    assert len(overdue) == 500
+
+def test_bulk_update_status_is_set_based(client, app, monkeypatch):
+    from factories import make_customers
+    monkeypatch.setitem(app.config, 'BULK_UPDATE_CHUNK_SIZE', 100)
+    with app.app_context():
+        customer_ids = make_customers(250, status=lambda i: 'inactive' if i < 50 else 'active')
+        db.session.commit()
+    client.get(f'/customers/{customer_ids[-1]}')
+
+    with count_queries(app) as statements:
+        response = client.post('/customers/bulk_update_status', json={"customer_ids": customer_ids, "status": "inactive"})
+    assert response.json == {'message': '200 customers updated successfully'}
+    assert [s.split()[0] for s in statements] == ['UPDATE'] * 3
+    assert client.get(f'/customers/{customer_ids[-1]}').json['status'] == 'inactive'
+
+    response = client.post('/customers/bulk_update_status', json={"customer_ids": customer_ids, "status": "expired"})
+    assert response.status_code == 400
+
+def test_bulk_create_and_upsert_customers(client, app):
+    existing = add_customer(app, "Old Name", "known@example.com")
+    client.delete(f'/customers/{existing}')
+    patron = {"name": "Patron", "city": "Shelbyville", "age": 40, "date_of_birth": "1985-05-05", "phone": "5551234567"}
+    customers = [
+        {**patron, "email": "new@example.com"},
+        {**patron, "name": "New Name", "email": "known@example.com"},
+        {**patron, "email": "new@example.com"},
+        {**patron, "email": "bad@example.com", "age": "forty"},
+        {**patron, "email": "nodob@example.com", "date_of_birth": None},
+    ]
+
+    response = client.post('/customers/bulk', json={"customers": customers})
+    results = response.json['results']
+    assert [r['status'] for r in results] == ['created', 'rejected', 'rejected', 'rejected', 'rejected']
+    assert [r['reason'] for r in results[1:]] == [
+        'Email already registered',
+        'Duplicate email in request',
+        "Invalid customer: invalid age: 'forty'",
+        'Invalid customer: missing date_of_birth',
+    ]
+    assert client.get(f"/customers/{results[0]['id']}").json['date_of_birth'] == '1985-05-05'
+
+    customers[0]["email"] = "another@example.com"
+    response = client.post('/customers/bulk', json={"customers": customers[:2], "upsert": True})
+    assert [r['status'] for r in response.json['results']] == ['created', 'updated']
+    updated = client.get(f'/customers/{existing}').json
+    assert (updated['name'], updated['status']) == ("New Name", 'inactive')
+
+    # New customers go in with one INSERT; ids come back in request order
+    batch = [{**patron, "email": f"batch{i}@example.com"} for i in range(10)]
+    with count_queries(app) as statements:
+        results = client.post('/customers/bulk', json={"customers": batch}).json['results']
+    assert [s.split()[0] for s in statements].count('INSERT') == 1
+    assert [client.get(f"/customers/{r['id']}").json['email'] for r in results] == [c['email'] for c in batch]
+
+# Seconds `import app` may take in a fresh interpreter; most of it is Flask
+# and SQLAlchemy themselves
+IMPORT_TIME_BUDGET = 2.0
+
+def test_import_is_cheap_and_builds_nothing():
+    import subprocess
+    import sys
+    script = (
+        "import sys, time\n"
+        "started = time.perf_counter()\n"
+        "import app\n"
+        "print(time.perf_counter() - started)\n"
+        "print(hasattr(app, 'app'), 'pyarrow' in sys.modules, 'redis' in sys.modules)\n"
+    )
+    result = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, check=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__)))
+    elapsed, built = result.stdout.splitlines()
+    assert built == 'False False False'
+    assert float(elapsed) < IMPORT_TIME_BUDGET
+
+def test_apps_are_isolated():
+    app, other = (
+        create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:', 'CACHE_BACKEND': backend})
+        for backend in ('memory', None)
+    )
+    for each in (app, other):
+        with each.app_context():
+            db.create_all()
+    app.test_client().post('/books', json={"name": "Only here", "author": "A", "year_published": 2000, "book_type": 1})
+
+    assert [b['name'] for b in app.test_client().get('/books').json] == ["Only here"]
+    assert other.test_client().get('/books').json == []
+    assert other.extensions['lookup_cache'] is not app.extensions['lookup_cache']
+    assert other.test_client().get('/cache/stats').json == {'backend': None}
+
+def test_cron_schedule_next_run():
+    from scheduler import CronError, CronSchedule
+    now = datetime(2025, 3, 14, 10, 7, 30)
+    assert CronSchedule('*/15 * * * *').next_after(now) == datetime(2025, 3, 14, 10, 15)
+    assert CronSchedule('0 8 * * *').next_after(now) == datetime(2025, 3, 15, 8, 0)
+    assert CronSchedule('30 3 1 */3 *').next_after(now) == datetime(2025, 4, 1, 3, 30)
+    # Day of month or Sunday, as in cron
+    assert CronSchedule('0 0 20 * 0').next_after(now) == datetime(2025, 3, 16, 0, 0)
+    for expression in ('* * *', '61 * * * *', '5-1 * * * *', '*/0 * * * *', 'x * * * *'):
+        with pytest.raises(CronError):
+            CronSchedule(expression)
+
+def test_maintenance_jobs_work_in_chunks(client, app, monkeypatch):
+    from factories import make_books, make_customers, make_loans
+    from maintenance import mark_overdue_loans, prune_read_notifications, queue_due_soon_reminders
+    monkeypatch.setitem(app.config, 'MAINTENANCE_CHUNK_SIZE', 2)
+    today = date.today()
+    due = [today - timedelta(days=3)] * 5 + [today + timedelta(days=1)] * 3 + [today + timedelta(days=10)]
+    old = datetime.utcnow() - timedelta(days=app.config['NOTIFICATION_RETENTION_DAYS'] + 1)
+    with app.app_context():
+        loan_ids = make_loans(len(due), make_customers(9), make_books(9), return_date=lambda i: due[i])
+        db.session.add_all([
+            Notification(type='info', content='old read', status='read', recipient_id=1, created_at=old),
+            Notification(type='info', content='old read', status='read', recipient_id=1, created_at=old),
+            Notification(type='info', content='old read', status='read', recipient_id=1, created_at=old),
+            Notification(type='info', content='old unread', status='new', recipient_id=1, created_at=old),
+            Notification(type='info', content='unsent', status='read', recipient_id=1, created_at=old, delivery_status='pending'),
+            Notification(type='info', content='recent read', status='read', recipient_id=1),
+        ])
+        db.session.commit()
+
+        assert mark_overdue_loans() == 5
+        assert mark_overdue_loans() == 0
+        assert queue_due_soon_reminders() == 3
+        assert queue_due_soon_reminders() == 0
+        assert prune_read_notifications() == 3
+        assert sorted(n.content for n in Notification.query.filter_by(type='info')) == ['old unread', 'recent read', 'unsent']
+
+    assert client.get(f'/loans/{loan_ids[0]}').json['status'] == 'overdue'
+    assert client.get(f'/loans/{loan_ids[5]}').json['status'] == 'ongoing'
+    # Marked loans are still overdue, and returning one takes it off the list
+    assert sorted(loan['id'] for loan in client.get('/loans/overdue').json) == loan_ids[:5]
+    client.put(f'/loans/{loan_ids[0]}', json={"actual_return_date": str(today)})
+    assert len(client.get('/loans/overdue').json) == 4
+
+def test_scheduler_leases_each_run_to_one_worker(app, monkeypatch):
+    import scheduler
+    from models import ScheduledJob
+    calls = []
+    monkeypatch.setitem(app.config, 'JOB_SCHEDULES', {'mark-overdue': '0 * * * *', 'refresh-stats': '0 0 * * *'})
+    monkeypatch.setitem(scheduler.JOBS, 'mark-overdue', lambda: calls.append('mark-overdue') or 7)
+    monkeypatch.setitem(scheduler.JOBS, 'refresh-stats', lambda: 1 / 0)
+    now = datetime(2025, 3, 14, 10, 30)
+    with app.app_context():
+        assert scheduler.run_pending('a', now) == {}
+        later = now + timedelta(hours=1)
+        assert scheduler.run_pending('a', later) == {'mark-overdue': 7}
+        assert scheduler.run_pending('b', later) == {}
+        job = db.session.get(ScheduledJob, 'mark-overdue')
+        assert (job.last_status, job.last_result, job.next_run_at) == ('ok', '7', datetime(2025, 3, 14, 12, 0))
+
+        # A worker that died mid-run keeps the job until its lease runs out
+        db.session.execute(db.update(ScheduledJob).values(lease_owner='a', lease_expires_at=later + timedelta(hours=2)))
+        db.session.commit()
+        assert scheduler.run_pending('b', later + timedelta(hours=1)) == {}
+        assert scheduler.run_pending('b', later + timedelta(days=1)) == {'mark-overdue': 7, 'refresh-stats': None}
+        failed = db.session.get(ScheduledJob, 'refresh-stats')
+        assert (failed.last_status, failed.last_result, failed.lease_owner) == ('failed', 'division by zero', None)
+    assert calls == ['mark-overdue', 'mark-overdue']
+
+def asgi_get(asgi_app, path, headers=None):
+    import asyncio
+    from urllib.parse import urlsplit
+    url = urlsplit(path)
+    scope = {
+        'type': 'http', 'method': 'GET', 'path': url.path, 'query_string': url.query.encode(),
+        'headers': [(name.lower().encode(), value.encode()) for name, value in (headers or {}).items()],
+    }
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    asyncio.run(asgi_app(scope, receive, send))
+    start = messages[0]
+    body = b''.join(message.get('body', b'') for message in messages[1:])
+    return start['status'], {k.decode(): v.decode() for k, v in start['headers']}, body
+
+def test_async_read_api_matches_flask_routes(committing_app):
+    import asyncio
+    pytest.importorskip('aiosqlite')
+    from async_api import AsyncReadAPI
+    client = committing_app.test_client()
+    book_id = client.post('/books', json={"name": "Polled", "author": "A", "year_published": 2001, "book_type": 1}).json['id']
+    cust_id = add_customer(committing_app, "Kiosk Reader", "kiosk.reader@example.com")
+    for i in range(3):
+        client.post('/notifications', json={"type": "info", "content": f"n{i}", "priority": "low", "recipient_id": cust_id})
+    api = AsyncReadAPI(committing_app)
+
+    paths = [
+        f'/books/{book_id}',
+        f'/books/{book_id}/availability',
+        f'/customers/{cust_id}/notifications',
+        f'/customers/{cust_id}/notifications?limit=2',
+        f'/customers/{cust_id}/notifications/unread_count',
+        '/books/999',
+        f'/customers/{cust_id}/notifications?limit=x',
+    ]
+    for path in paths:
+        expected = client.get(path)
+        status, headers, body = asgi_get(api, path)
+        assert (status, json.loads(body)) == (expected.status_code, expected.json), path
+        assert headers.get('x-next-cursor') == expected.headers.get('X-Next-Cursor')
+
+    status, headers, _ = asgi_get(api, f'/books/{book_id}')
+    assert headers['etag'] == client.get(f'/books/{book_id}').headers['ETag']
+    assert asgi_get(api, f'/books/{book_id}', {'If-None-Match': headers['etag']})[0] == 304
+    assert asgi_get(api, '/loans')[0] == 404
+    asyncio.run(api.engine.dispose())
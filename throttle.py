@@ -0,0 +1,172 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+from flask import current_app, g, jsonify, request
+
+WRITE_METHODS = ('POST', 'PUT', 'PATCH', 'DELETE')
+
+
+# Token buckets in process memory. The least recently used buckets are
+# dropped beyond `maxsize` keys; a dropped bucket simply starts full again.
+class MemoryBucketStore:
+    def __init__(self, maxsize=100000, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.clock = clock
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    # Take one token; returns 0 when allowed, else seconds until one is available
+    def take(self, key, rate, burst):
+        with self._lock:
+            now = self.clock()
+            tokens, updated = self._buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated) * rate)
+            if tokens >= 1:
+                tokens -= 1
+                wait = 0.0
+            else:
+                wait = (1 - tokens) / rate
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.maxsize:
+                self._buckets.popitem(last=False)
+            return wait
+
+
+# Shared buckets for several workers or hosts, on any client exposing the
+# redis-py eval() API. The refill and take run as one script on the server,
+# using the server's clock.
+class RedisBucketStore:
+    SCRIPT = """
+        local rate, burst = tonumber(ARGV[1]), tonumber(ARGV[2])
+        local time = redis.call('TIME')
+        local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+        local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+        local tokens = tonumber(state[1]) or burst
+        local updated = tonumber(state[2]) or now
+        tokens = math.min(burst, tokens + (now - updated) * rate)
+        local wait = 0
+        if tokens >= 1 then
+            tokens = tokens - 1
+        else
+            wait = (1 - tokens) / rate
+        end
+        redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+        redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+        return tostring(wait)
+    """
+
+    def __init__(self, client, prefix='library:ratelimit:'):
+        self.client = client
+        self.prefix = prefix
+
+    def take(self, key, rate, burst):
+        return float(self.client.eval(self.SCRIPT, 1, self.prefix + key, rate, burst))
+
+
+# At most `max_concurrent` write requests run at once; up to `max_queue`
+# more wait for a slot for `timeout` seconds, and the rest are shed at once
+# instead of piling up on the database lock.
+class AdmissionGate:
+    def __init__(self, max_concurrent, max_queue, timeout):
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+        self._lock = threading.Lock()
+        self.waiting = 0
+
+    # Returns None once admitted, else the reason the request was shed
+    def enter(self):
+        if self._slots.acquire(blocking=False):
+            return None
+        with self._lock:
+            if self.waiting >= self.max_queue:
+                return 'queue_full'
+            self.waiting += 1
+        try:
+            admitted = self._slots.acquire(timeout=self.timeout)
+        finally:
+            with self._lock:
+                self.waiting -= 1
+        return None if admitted else 'queue_timeout'
+
+    def leave(self):
+        self._slots.release()
+
+
+# Token-bucket rate limiting per client and endpoint, plus the admission
+# gate, for every write request (POST/PUT/PATCH/DELETE)
+class WriteThrottle:
+    def __init__(self, app=None):
+        self.store = None
+        self.gate = None
+        self.throttled = {}
+        self.shed = {}
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        backend = app.config.get('RATE_LIMIT_BACKEND', 'memory')
+        if backend == 'memory':
+            self.store = MemoryBucketStore()
+        elif backend == 'redis':
+            import redis
+            self.store = RedisBucketStore(redis.Redis.from_url(app.config['RATE_LIMIT_REDIS_URL']))
+        else:
+            raise ValueError(f'Unknown RATE_LIMIT_BACKEND: {backend}')
+        self.gate = AdmissionGate(
+            app.config.get('ADMISSION_MAX_CONCURRENT', 4),
+            app.config.get('ADMISSION_MAX_QUEUE', 32),
+            app.config.get('ADMISSION_QUEUE_TIMEOUT', 5),
+        )
+        app.extensions['write_throttle'] = self
+        app.before_request(self._before_request)
+        app.teardown_request(self._teardown_request)
+
+    # Kiosks identify themselves with a header; other clients by address
+    def client_key(self):
+        header = current_app.config.get('RATE_LIMIT_KEY_HEADER')
+        return (header and request.headers.get(header)) or request.remote_addr or 'unknown'
+
+    def _count(self, counters, key):
+        with self._lock:
+            counters[key] = counters.get(key, 0) + 1
+
+    def _reject(self, status, message, retry_after):
+        response = jsonify({'error': message})
+        response.status_code = status
+        response.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+        return response
+
+    def _before_request(self):
+        config = current_app.config
+        if request.method not in WRITE_METHODS or not config.get('RATE_LIMIT_ENABLED', True):
+            return None
+        endpoint = request.endpoint or 'unknown'
+
+        rate, burst = config.get('RATE_LIMITS', {}).get(endpoint, config['RATE_LIMIT_DEFAULT'])
+        wait = self.store.take(f'{self.client_key()}:{endpoint}', rate, burst)
+        if wait > 0:
+            self._count(self.throttled, endpoint)
+            return self._reject(429, 'Too many requests', wait)
+
+        reason = self.gate.enter()
+        if reason is not None:
+            self._count(self.shed, reason)
+            return self._reject(503, 'Server busy, try again later', self.gate.timeout)
+        g.admitted = True
+        return None
+
+    def _teardown_request(self, exc):
+        if g.pop('admitted', False):
+            self.gate.leave()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'throttled': dict(self.throttled),
+                'shed': dict(self.shed),
+                'queued': self.gate.waiting,
+            }
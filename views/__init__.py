@@ -0,0 +1,12 @@
+from views import admin, books, customers, holds, loans, notifications, reports
+
+# One blueprint per resource, registered by create_app()
+BLUEPRINTS = (
+    books.bp,
+    customers.bp,
+    loans.bp,
+    holds.bp,
+    notifications.bp,
+    admin.bp,
+    reports.bp,
+)
@@ -0,0 +1,81 @@
+from flask import Blueprint, jsonify, request
+from flask_login import login_required, login_user, logout_user
+from auth import hash_password, verify_password
+from extensions import admin_identities
+from models import db, Admin
+
+bp = Blueprint('admin', __name__)
+
+
+# Create Admin
+@bp.route('/admin', methods=['POST'])
+def create_admin():
+    data = request.get_json()
+    username = data.get('username')
+    password = data.get('password')
+    if not username or not password:
+        return jsonify({'message': 'username and password are required'}), 400
+    hashed_password = hash_password(password)
+
+    new_admin = Admin(username=username, password=hashed_password)
+    db.session.add(new_admin)
+    db.session.commit()
+
+    return jsonify({'message': 'Admin created successfully'}), 201
+
+# Read Admin by ID
+@bp.route('/admin/<int:id>', methods=['GET'])
+@login_required
+def get_admin(id):
+    admin = Admin.query.get_or_404(id)
+    return jsonify({'id': admin.id, 'username': admin.username}), 200
+
+# Update Admin
+@bp.route('/admin/<int:id>', methods=['PUT'])
+@login_required
+def update_admin(id):
+    data = request.get_json()
+    admin = Admin.query.get(id)
+    if not admin:
+        return jsonify({'message': 'Admin not found'}), 404
+
+    admin.username = data.get('username', admin.username)
+    if 'password' in data:
+        admin.password = hash_password(data.get('password'))
+
+    db.session.commit()
+    admin_identities.invalidate(id)
+    return jsonify({'message': 'Admin updated successfully'}), 200
+
+# Delete Admin
+@bp.route('/admin/<int:id>', methods=['DELETE'])
+@login_required
+def delete_admin(id):
+    admin = Admin.query.get(id)
+    if not admin:
+        return jsonify({'message': 'Admin not found'}), 404
+
+    db.session.delete(admin)
+    db.session.commit()
+    admin_identities.invalidate(id)
+    return jsonify({'message': 'Admin deleted successfully'}), 200
+
+# Login Route (for Admin)
+@bp.route('/login', methods=['POST'])
+def login():
+    data = request.get_json()
+    username = data.get('username')
+    password = data.get('password')
+
+    admin = Admin.query.filter_by(username=username).first()
+    if admin and verify_password(admin, password):
+        login_user(admin)
+        return jsonify({'message': 'Login successful'}), 200
+    return jsonify({'message': 'Invalid username or password'}), 401
+
+# Logout Route
+@bp.route('/logout', methods=['POST'])
+@login_required
+def logout():
+    logout_user()
+    return jsonify({'message': 'Logged out successfully'}), 200
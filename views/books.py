@@ -0,0 +1,103 @@
+from flask import Blueprint, jsonify, request
+from circulation import availability_payload, availability_query
+from conditional import conditional_list, conditional_row
+from database import replica_reads
+from extensions import lookup_cache
+from models import db, Book
+from pagination import PaginationError, list_response, parse_limit, projection, row_formatter
+from search import SearchError, build_book_search
+
+bp = Blueprint('books', __name__)
+
+
+# Create a new book
+@bp.route('/books', methods=['POST'])
+def create_book():
+    data = request.get_json()
+    book = Book(
+        name=data.get('name'),
+        author=data.get('author'),
+        year_published=data.get('year_published'),
+        book_type=data.get('book_type'),
+        category=data.get('category'),
+        description=data.get('description'),
+        available_copies=data.get('available_copies', 1),
+    )
+    db.session.add(book)
+    db.session.commit()
+    return jsonify(book.to_dict()), 201
+
+# Get all active books
+@bp.route('/books', methods=['GET'])
+@replica_reads
+@conditional_list('book')
+def get_books():
+    return list_response(Book.query.filter_by(active=True), Book)
+
+# Search active books by author/category/year range and free text (q)
+@bp.route('/books/search', methods=['GET'])
+@replica_reads
+@conditional_list('book')
+def search_books():
+    try:
+        query, ranked = build_book_search(request.args)
+    except SearchError as e:
+        return jsonify({'error': str(e)}), 400
+    if not ranked:
+        return list_response(query, Book)
+
+    offset = request.args.get('offset', '0')
+    try:
+        limit = parse_limit(20)
+        if not offset.isdigit():
+            raise PaginationError('offset must be a non-negative integer')
+    except PaginationError as e:
+        return jsonify({'error': str(e)}), 400
+    fields = Book.serialized_fields
+    rows = query.with_entities(*projection(Book, fields)).limit(limit).offset(int(offset)).all()
+    fmt = row_formatter(Book, fields)
+    return jsonify([fmt(row) for row in rows])
+
+# Get a specific active book by ID
+@bp.route('/books/<int:id>', methods=['GET'])
+def get_book(id):
+    response = conditional_row(Book, id, visible=lambda book: book['active'])
+    if response is None:
+        return jsonify({"error": "Book not found"}), 404
+    return response
+
+# Copies on the shelf and holds waiting, for kiosks polling a title
+@bp.route('/books/<int:id>/availability', methods=['GET'])
+def get_book_availability(id):
+    row = db.session.execute(availability_query(id)).first()
+    if row is None:
+        return jsonify({"error": "Book not found"}), 404
+    return jsonify(availability_payload(row))
+
+# Update a specific book by ID
+@bp.route('/books/<int:id>', methods=['PUT'])
+def update_book(id):
+    data = request.get_json()
+    book = Book.query.get(id)
+    if book:
+        book.name = data.get('name', book.name)
+        book.author = data.get('author', book.author)
+        book.year_published = data.get('year_published', book.year_published)
+        book.book_type = data.get('book_type', book.book_type)
+        book.category = data.get('category', book.category)
+        book.description = data.get('description', book.description)
+        db.session.commit()
+        lookup_cache.invalidate(Book, id)
+        return jsonify(book.to_dict())
+    return jsonify({"error": "Book not found"}), 404
+
+# Deactivate a book (make it inactive)
+@bp.route('/books/<int:id>/deactivate', methods=['PATCH'])
+def deactivate_book(id):
+    book = Book.query.get(id)
+    if book:
+        book.active = False
+        db.session.commit()
+        lookup_cache.invalidate(Book, id)
+        return jsonify({"message": "Book deactivated successfully"}), 200
+    return jsonify({"error": "Book not found"}), 404
@@ -0,0 +1,15 @@
+from flask import current_app, jsonify
+
+
+# The list under `key` of a bulk request body, or an error response
+def bulk_items(data, key):
+    items = (data or {}).get(key)
+    if not isinstance(items, list):
+        return None, (jsonify({"message": f"'{key}' must be a list"}), 400)
+    if len(items) > current_app.config['MAX_BULK_ITEMS']:
+        return None, (jsonify({"message": f"At most {current_app.config['MAX_BULK_ITEMS']} items per request"}), 400)
+    return items, None
+
+def bulk_summary(results):
+    accepted = sum(1 for result in results if result['status'] != 'rejected')
+    return {"results": results, "accepted": accepted, "rejected": len(results) - accepted}
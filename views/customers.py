@@ -0,0 +1,148 @@
+from flask import Blueprint, abort, jsonify, request
+from circulation import parse_date
+from conditional import conditional_list, conditional_row
+from database import replica_reads
+from extensions import lookup_cache
+from models import db, Customer, Loan
+from pagination import list_response
+from patrons import CUSTOMER_STATUSES, bulk_upsert_customers, set_customer_status
+from views.bulk import bulk_items, bulk_summary
+
+bp = Blueprint('customers', __name__)
+
+
+# Create Customer
+@bp.route('/customers', methods=['POST'])
+def create_customer():
+    data = request.get_json()
+
+    try:
+        new_customer = Customer(
+            name=data['name'],
+            city=data['city'],
+            age=data['age'],
+            date_of_birth=parse_date(data['date_of_birth']),
+            email=data['email'],
+            phone=data['phone'],
+            status=data.get('status', 'active')
+        )
+
+        db.session.add(new_customer)
+        db.session.commit()
+        return jsonify(new_customer.to_dict()), 201
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+
+# Get Customer by ID
+@bp.route('/customers/<int:id>', methods=['GET'])
+def get_customer(id):
+    response = conditional_row(Customer, id)
+    if response is None:
+        abort(404)
+    return response
+
+# Update Customer
+@bp.route('/customers/<int:id>', methods=['PUT'])
+def update_customer(id):
+    data = request.get_json()
+    customer = Customer.query.get_or_404(id)
+
+    try:
+        customer.name = data.get('name', customer.name)
+        customer.city = data.get('city', customer.city)
+        customer.age = data.get('age', customer.age)
+        if 'date_of_birth' in data:
+            customer.date_of_birth = parse_date(data['date_of_birth'])
+        customer.email = data.get('email', customer.email)
+        customer.phone = data.get('phone', customer.phone)
+        customer.status = data.get('status', customer.status)
+
+        db.session.commit()
+        lookup_cache.invalidate(Customer, id)
+        return jsonify(customer.to_dict())
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+
+# Mark Customer as Inactive (instead of delete)
+@bp.route('/customers/<int:id>', methods=['DELETE'])
+def deactivate_customer(id):
+    customer = Customer.query.get_or_404(id)
+
+    try:
+        customer.status = 'inactive'
+        db.session.commit()
+        lookup_cache.invalidate(Customer, id)
+        return jsonify({'message': 'Customer marked as inactive'}), 200
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+
+# List All Customers (Optional)
+@bp.route('/customers', methods=['GET'])
+@replica_reads
+@conditional_list('customer')
+def get_customers():
+    return list_response(Customer.query, Customer)
+
+#Activate Customer
+@bp.route('/customers/<int:id>/activate', methods=['PATCH'])
+def activate_customer(id):
+    customer = Customer.query.get_or_404(id)
+
+    try:
+        customer.status = 'active'
+        db.session.commit()
+        lookup_cache.invalidate(Customer, id)
+        return jsonify({'message': 'Customer reactivated successfully'}), 200
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+
+#Get All Inactive Customers
+@bp.route('/customers/inactive', methods=['GET'])
+def get_inactive_customers():
+    inactive_customers = Customer.query.filter_by(status='inactive').all()
+    return jsonify([customer.to_dict() for customer in inactive_customers])
+
+#Bulk Update Customer Status
+@bp.route('/customers/bulk_update_status', methods=['POST'])
+def bulk_update_status():
+    data = request.get_json() or {}
+    customer_ids = data.get('customer_ids', [])
+    new_status = data.get('status', 'inactive')
+
+    if not isinstance(customer_ids, list) or not all(type(id) is int for id in customer_ids):
+        return jsonify({'error': "'customer_ids' must be a list of integers"}), 400
+    if new_status not in CUSTOMER_STATUSES:
+        return jsonify({'error': f"'status' must be one of {', '.join(CUSTOMER_STATUSES)}"}), 400
+
+    try:
+        changed = set_customer_status(customer_ids, new_status)
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+    lookup_cache.invalidate(Customer, *changed)
+    return jsonify({'message': f'{len(changed)} customers updated successfully'}), 200
+
+# Create many customers in one transaction, with a result per item; with
+# "upsert": true, items whose email is registered update that customer
+@bp.route('/customers/bulk', methods=['POST'])
+def create_customers_bulk():
+    data = request.get_json()
+    items, error = bulk_items(data, 'customers')
+    if error:
+        return error
+    results, updated = bulk_upsert_customers(items, upsert=bool(data.get('upsert', False)))
+    lookup_cache.invalidate(Customer, *updated)
+    return jsonify(bulk_summary(results)), 200
+
+#Get Customer Loan Information
+@bp.route('/customers/<int:id>/loans', methods=['GET'])
+@replica_reads
+@conditional_list('customer', 'loan')
+def get_customer_loans(id):
+    if lookup_cache.get(Customer, id) is None:
+        abort(404)
+    return list_response(Loan.query.filter_by(cust_id=id), Loan)
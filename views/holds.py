@@ -0,0 +1,44 @@
+from flask import Blueprint, abort, jsonify, request
+from circulation import CirculationError, cancel_hold, place_hold
+from extensions import lookup_cache
+from models import db, Book, Hold
+from pagination import list_response
+
+bp = Blueprint('holds', __name__)
+
+
+# Join a book's hold queue (only when no copy is available)
+@bp.route('/books/<int:id>/holds', methods=['POST'])
+def create_hold(id):
+    data = request.get_json()
+    if not data or 'cust_id' not in data:
+        return jsonify({"message": "cust_id is required"}), 400
+    try:
+        hold = place_hold(data['cust_id'], id)
+    except CirculationError as e:
+        return jsonify({"message": e.message}), e.status_code
+    return jsonify(hold.to_dict()), 201
+
+# A book's hold queue in the order it is served; ?status= for closed holds
+@bp.route('/books/<int:id>/holds', methods=['GET'])
+def get_book_holds(id):
+    if lookup_cache.get(Book, id) is None:
+        abort(404)
+    query = Hold.query.filter_by(book_id=id)
+    if request.args.get('status'):
+        query = query.filter_by(status=request.args['status'])
+    else:
+        query = query.filter(Hold.status.in_(('waiting', 'ready')))
+    return list_response(query, Hold)
+
+# Cancel a hold; a copy it was holding goes to the next in the queue
+@bp.route('/holds/<int:id>', methods=['DELETE'])
+def delete_hold(id):
+    hold = Hold.query.get_or_404(id)
+    try:
+        cancel_hold(hold)
+    except CirculationError as e:
+        return jsonify({"message": e.message}), e.status_code
+    lookup_cache.invalidate(Book, hold.book_id)
+    db.session.refresh(hold)
+    return jsonify(hold.to_dict())
@@ -0,0 +1,128 @@
+from flask import Blueprint, jsonify, request
+from circulation import (
+    CirculationError, bulk_checkout, bulk_return, checkout, overdue_loans_query, overdue_notices_query,
+    parse_date, release_copy, return_loan,
+)
+from conditional import conditional, conditional_list, row_etag
+from database import replica_reads
+from extensions import lookup_cache
+from mailer import enqueue_overdue_notices
+from models import db, Book, Customer, Loan
+from pagination import list_response
+from views.bulk import bulk_items, bulk_summary
+
+bp = Blueprint('loans', __name__)
+
+
+# Create a new loan
+@bp.route('/loans', methods=['POST'])
+def create_loan():
+    data = request.get_json()
+    # Validate if customer and book exist
+    customer = lookup_cache.get(Customer, data['cust_id'])
+    book = lookup_cache.get(Book, data['book_id'])
+
+    if not customer:
+        return jsonify({"message": "Customer not found"}), 404
+    if not book:
+        return jsonify({"message": "Book not found"}), 404
+
+    try:
+        new_loan = checkout(
+            cust_id=data['cust_id'],
+            book_id=data['book_id'],
+            loan_date=parse_date(data['loan_date']),
+            return_date=parse_date(data['return_date']),
+            status=data.get('status', 'ongoing')
+        )
+    except CirculationError as e:
+        return jsonify({"message": e.message}), e.status_code
+    lookup_cache.invalidate(Book, data['book_id'])
+    return jsonify(new_loan.to_dict()), 201
+
+# Create many loans in one transaction, with a result per item
+@bp.route('/loans/bulk', methods=['POST'])
+def create_loans_bulk():
+    items, error = bulk_items(request.get_json(), 'loans')
+    if error:
+        return error
+    results, book_ids = bulk_checkout(items)
+    lookup_cache.invalidate(Book, *book_ids)
+    return jsonify(bulk_summary(results)), 200
+
+# Return many loans in one transaction, with a result per item
+@bp.route('/loans/bulk_return', methods=['POST'])
+def return_loans_bulk():
+    items, error = bulk_items(request.get_json(), 'returns')
+    if error:
+        return error
+    results, book_ids = bulk_return(items)
+    lookup_cache.invalidate(Book, *book_ids)
+    return jsonify(bulk_summary(results)), 200
+
+# Get all loans
+@bp.route('/loans', methods=['GET'])
+@replica_reads
+@conditional_list('loan')
+def get_loans():
+    return list_response(Loan.query, Loan)
+
+# Get a specific loan by ID
+@bp.route('/loans/<int:id>', methods=['GET'])
+def get_loan(id):
+    loan = Loan.query.get_or_404(id)
+    return conditional(row_etag('loan', loan.id, loan.version), loan.updated_at, lambda: jsonify(loan.to_dict()))
+
+# Update a loan (e.g., update return date or status)
+@bp.route('/loans/<int:id>', methods=['PUT'])
+def update_loan(id):
+    data = request.get_json()
+    loan = Loan.query.get_or_404(id)
+
+    if 'actual_return_date' in data and loan.actual_return_date is None:
+        # Returning the book: close the loan and release the copy atomically
+        returned_on = parse_date(data['actual_return_date'])
+        return_loan(loan, returned_on, data.get('status', 'returned'))
+        db.session.commit()
+        lookup_cache.invalidate(Book, loan.book_id)
+        return jsonify(loan.to_dict())
+
+    if 'status' in data:
+        loan.status = data['status']
+    if 'actual_return_date' in data:
+        loan.actual_return_date = parse_date(data['actual_return_date'])
+
+    db.session.commit()
+    return jsonify(loan.to_dict())
+
+# Delete a loan
+@bp.route('/loans/<int:id>', methods=['DELETE'])
+def delete_loan(id):
+    loan = Loan.query.get_or_404(id)
+    book_id = loan.book_id
+    if loan.actual_return_date is None:
+        release_copy(book_id)
+    db.session.delete(loan)
+    db.session.commit()
+    lookup_cache.invalidate(Book, book_id)
+    return '', 204
+
+# Get all overdue loans
+@bp.route('/loans/overdue', methods=['GET'])
+def overdue_loans():
+    return list_response(overdue_loans_query(), Loan)
+
+# Notify customers with overdue loans
+@bp.route('/loans/overdue/notify', methods=['GET'])
+def notify_overdue_loans():
+    return list_response(overdue_notices_query(), Loan, formatter=lambda row: {
+        'customer_name': row.customer_name,
+        'email': row.email,
+        'book_title': row.book_title,
+        'due_date': row.return_date
+    })
+
+# Queue overdue notices for the mail worker (flask dispatch-mail)
+@bp.route('/loans/overdue/notify', methods=['POST'])
+def queue_overdue_notices():
+    return jsonify({'queued': enqueue_overdue_notices()}), 202
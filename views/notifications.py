@@ -0,0 +1,133 @@
+from datetime import datetime
+from flask import Blueprint, current_app, jsonify, request
+from sqlalchemy import update
+from models import db, InboxCounter, Notification
+from pagination import list_response
+
+bp = Blueprint('notifications', __name__)
+
+
+# Create a notification
+@bp.route('/notifications', methods=['POST'])
+def create_notification():
+    data = request.get_json()
+    new_notification = Notification(
+        type=data['type'],
+        content=data['content'],
+        status=data.get('status', 'new'),
+        priority=data['priority'],
+        recipient_id=data.get('recipient_id'),
+    )
+    db.session.add(new_notification)
+    db.session.commit()
+    return jsonify({'message': 'Notification created', 'id': new_notification.id}), 201
+
+# Read all notifications
+@bp.route('/notifications', methods=['GET'])
+def get_notifications():
+    return list_response(Notification.query, Notification)
+
+# Read a specific notification by ID
+@bp.route('/notifications/<int:id>', methods=['GET'])
+def get_notification(id):
+    notification = Notification.query.get_or_404(id)
+    return jsonify(notification.to_dict())
+
+# Update a notification
+@bp.route('/notifications/<int:id>', methods=['PUT'])
+def update_notification(id):
+    notification = Notification.query.get_or_404(id)
+    data = request.get_json()
+
+    notification.type = data.get('type', notification.type)
+    notification.content = data.get('content', notification.content)
+    notification.status = data.get('status', notification.status)
+    notification.priority = data.get('priority', notification.priority)
+    notification.recipient_id = data.get('recipient_id', notification.recipient_id)
+
+    db.session.commit()
+    return jsonify({'message': 'Notification updated'})
+
+# Delete a notification
+@bp.route('/notifications/<int:id>', methods=['DELETE'])
+def delete_notification(id):
+    notification = Notification.query.get_or_404(id)
+    db.session.delete(notification)
+    db.session.commit()
+    return jsonify({'message': 'Notification deleted'})
+
+# A customer's inbox, newest first, optionally filtered by status and priority
+@bp.route('/customers/<int:id>/notifications', methods=['GET'])
+def get_customer_notifications(id):
+    query = Notification.query.filter_by(recipient_id=id)
+    if request.args.get('status'):
+        query = query.filter_by(status=request.args['status'])
+    if request.args.get('priority'):
+        query = query.filter_by(priority=request.args['priority'])
+    return list_response(query, Notification, descending=True)
+
+# Unread notification count, read from the trigger-maintained counter
+@bp.route('/customers/<int:id>/notifications/unread_count', methods=['GET'])
+def get_unread_count(id):
+    counter = db.session.get(InboxCounter, id)
+    return jsonify({'recipient_id': id, 'unread': counter.unread if counter else 0})
+
+# Mark many notifications read in one UPDATE: a list of ids and/or everything
+# created up to a timestamp. The timestamp form is always limited to one
+# recipient, so it can never sweep every inbox.
+def _mark_read(data, recipient_id):
+    ids = data.get('ids')
+    before = data.get('before')
+    if not ids and not before:
+        return jsonify({'error': "Provide 'ids' or 'before'"}), 400
+    if before and recipient_id is None:
+        return jsonify({'error': "'before' needs a 'recipient_id'"}), 400
+
+    max_items = current_app.config['MAX_BULK_ITEMS']
+    conditions = [Notification.status != 'read']
+    if ids:
+        if not isinstance(ids, list) or len(ids) > max_items:
+            return jsonify({'error': f"'ids' must be a list of at most {max_items} ids"}), 400
+        conditions.append(Notification.id.in_(ids))
+    if before:
+        try:
+            conditions.append(Notification.created_at <= datetime.fromisoformat(before))
+        except (TypeError, ValueError):
+            return jsonify({'error': "'before' must be an ISO 8601 timestamp"}), 400
+    if recipient_id is not None:
+        conditions.append(Notification.recipient_id == recipient_id)
+
+    updated = db.session.execute(
+        update(Notification).where(*conditions).values(status='read')
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    db.session.commit()
+    return jsonify({'updated': updated}), 200
+
+# Mark notifications read by ids, optionally limited to one recipient_id
+@bp.route('/notifications/mark_read', methods=['POST'])
+def mark_notifications_read():
+    data = request.get_json() or {}
+    return _mark_read(data, data.get('recipient_id'))
+
+# Mark a customer's notifications read, by ids or up to a timestamp
+@bp.route('/customers/<int:id>/notifications/mark_read', methods=['POST'])
+def mark_customer_notifications_read(id):
+    return _mark_read(request.get_json() or {}, id)
+
+
+@bp.route('/update_notification_status/<int:notification_id>', methods=['PATCH'])
+def update_notification_status(notification_id):
+    # Get the notification by ID
+    notification = Notification.query.get(notification_id)
+
+    if notification:
+        # Update its status to 'read'
+        notification.status = 'read'
+
+        # Commit the update to the database
+        db.session.commit()
+
+        return jsonify({"message": "Notification status updated successfully."}), 200
+    else:
+        return jsonify({"message": "Notification not found."}), 404
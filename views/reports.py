@@ -0,0 +1,103 @@
+from datetime import datetime
+from flask import Blueprint, Response, abort, current_app, jsonify, request, stream_with_context
+from circulation import parse_date
+from database import replica_reads
+from exporter import EXPORT_MODELS, iter_text
+from extensions import lookup_cache, write_throttle
+from pagination import PaginationError, parse_limit
+from stats import loan_duration, loans_per_category, overdue_rate, refresh_summaries, top_books
+
+bp = Blueprint('reports', __name__)
+
+
+# Stream a whole table (or the rows after since_id and/or updated at or
+# after updated_since, an ISO timestamp) as CSV or NDJSON
+@bp.route('/export/<kind>', methods=['GET'])
+@replica_reads
+def export_data(kind):
+    if kind not in EXPORT_MODELS:
+        abort(404)
+    fmt = request.args.get('format', 'csv')
+    if fmt not in ('csv', 'ndjson'):
+        return jsonify({'error': 'format must be csv or ndjson'}), 400
+    since_id = request.args.get('since_id', type=int)
+    updated_since = request.args.get('updated_since')
+    try:
+        updated_since = datetime.fromisoformat(updated_since) if updated_since else None
+    except ValueError:
+        return jsonify({'error': 'updated_since must be an ISO timestamp'}), 400
+    body = iter_text(kind, fmt, since_id, current_app.config['EXPORT_BATCH_SIZE'], updated_since)
+    response = Response(stream_with_context(body), mimetype='text/csv' if fmt == 'csv' else 'application/x-ndjson')
+    response.headers['Content-Disposition'] = f'attachment; filename={kind}.{fmt}'
+    return response
+
+
+# since/until (YYYY-MM-DD, inclusive) bound the loan_date of the loans counted
+def _stats_args():
+    since, until = request.args.get('since'), request.args.get('until')
+    since = parse_date(since) if since else None
+    until = parse_date(until) if until else None
+    return since, until
+
+# Recompute the rollups for the days changed since the last refresh (every
+# day with ?full=1). The GET /stats endpoints only read the rollups; the
+# refresh-stats job keeps them current on its schedule.
+@bp.route('/stats/refresh', methods=['POST'])
+def stats_refresh():
+    full = request.args.get('full', '').lower() in ('1', 'true', 'yes')
+    return jsonify({'refreshed_days': refresh_summaries(full=full)})
+
+# Most borrowed titles
+@bp.route('/stats/top_books', methods=['GET'])
+@replica_reads
+def stats_top_books():
+    try:
+        limit = parse_limit(current_app.config['STATS_TOP_LIMIT'])
+    except PaginationError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        since, until = _stats_args()
+    except ValueError:
+        return jsonify({'error': 'since and until must be YYYY-MM-DD'}), 400
+    return jsonify(top_books(since, until, limit))
+
+# Loans per category per month
+@bp.route('/stats/loans_per_category', methods=['GET'])
+@replica_reads
+def stats_loans_per_category():
+    try:
+        since, until = _stats_args()
+    except ValueError:
+        return jsonify({'error': 'since and until must be YYYY-MM-DD'}), 400
+    return jsonify(loans_per_category(since, until))
+
+# Average loan duration of returned loans
+@bp.route('/stats/loan_duration', methods=['GET'])
+@replica_reads
+def stats_loan_duration():
+    try:
+        since, until = _stats_args()
+    except ValueError:
+        return jsonify({'error': 'since and until must be YYYY-MM-DD'}), 400
+    return jsonify(loan_duration(since, until))
+
+# Overdue rate by customer city
+@bp.route('/stats/overdue_rate', methods=['GET'])
+@replica_reads
+def stats_overdue_rate():
+    try:
+        since, until = _stats_args()
+    except ValueError:
+        return jsonify({'error': 'since and until must be YYYY-MM-DD'}), 400
+    return jsonify(overdue_rate(since, until))
+
+
+# Lookup cache counters, for sizing CACHE_MAX_SIZE / CACHE_TTL
+@bp.route('/cache/stats', methods=['GET'])
+def cache_stats():
+    return jsonify(lookup_cache.stats())
+
+# Write requests rejected by the rate limiter (per endpoint) and shed by admission control
+@bp.route('/throttle/stats', methods=['GET'])
+def throttle_stats():
+    return jsonify(write_throttle.stats())
@@ -0,0 +1,4 @@
+# WSGI entry point: gunicorn 'wsgi:app' (--preload builds it once, before forking)
+from app import create_app
+
+app = create_app()